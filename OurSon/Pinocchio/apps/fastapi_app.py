@@ -1,18 +1,47 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from nestor.dialogue.manager import DialogueManager
+from nestor.obs import events, metrics
+from nestor.persona import registry as personas
 
-app = FastAPI(title="Nestor API")
 dm = DialogueManager()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await dm.aclose()
+
+app = FastAPI(title="Nestor API", lifespan=lifespan)
+
 class Query(BaseModel):
     message: str
     chakra: str | None = None
+    session_id: str | None = None
+
+    def meta(self) -> dict:
+        if self.chakra and self.chakra not in personas.available():
+            raise HTTPException(status_code=400, detail=f"unknown chakra: {self.chakra}")
+        return {"session_id": self.session_id, "chakra": self.chakra}
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/metrics")
+def get_metrics(events_tail: int = 0):
+    """Stage latency histograms (ms percentiles), counters, cache stats; events_tail>0 adds recent events."""
+    snap = metrics.snapshot()
+    if events_tail > 0:
+        snap["events"] = events.recent(events_tail)
+    return snap
+
 @app.post("/respond")
-def respond(q: Query):
-    return {"reply": dm.respond(q.message)}
+async def respond(q: Query):
+    return {"reply": await dm.respond_async(q.message, q.meta())}
+
+@app.post("/respond/stream")
+async def respond_stream(q: Query):
+    # client disconnect cancels the generator, which closes the upstream LLM stream
+    return StreamingResponse(dm.respond_stream(q.message, q.meta()), media_type="text/plain; charset=utf-8")
@@ -0,0 +1,45 @@
+"""Deterministic synthetic joke corpora (NDJSON shards), cached between runs."""
+import json, random
+from pathlib import Path
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+SHARD = 10_000
+
+LANGS = ("fr", "en")
+STYLES = ("standup", "sitcom", "dad", "wordplay", "roast", "clean", "absurde")
+AUDIENCES = ("all-ages", "all-ages", "PG-13", "18+")
+SAFETY = ("safe", "safe", "borderline", "risky")
+TAGS = [f"tag{i}" for i in range(200)]
+CHARACTERS = [f"perso{i}" for i in range(50)]
+WORDS = ("pingouin café lundi chat pizza patron réunion vacances voisin tracteur poisson "
+         "ordinateur banane grand-mère métro parapluie dentiste robot fromage canapé").split()
+
+def joke(i: int, rng: random.Random) -> dict:
+    words = rng.choices(WORDS, k=12)
+    return {
+        "id": f"syn-{i}",
+        "lang": rng.choice(LANGS),
+        "style": rng.choice(STYLES),
+        "audience": rng.choice(AUDIENCES),
+        "tags": rng.sample(TAGS, 3),
+        "characters": rng.sample(CHARACTERS, rng.randint(0, 2)),
+        "beats": {"setup": " ".join(words[:6]) + " ?", "punchline": " ".join(words[6:]) + " !"},
+        "safety": rng.choice(SAFETY),
+        "collection": f"col{i % 20}",
+    }
+
+def corpus(size: str, root: Path) -> Path:
+    """Folder of NDJSON shards for `size` ("1k", "100k", "1M"); generated once."""
+    n = SIZES[size]
+    out = root / f"jokes_{size}"
+    done = out / ".complete"
+    if done.exists():
+        return out
+    out.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(n)
+    for start in range(0, n, SHARD):
+        with (out / f"shard_{start // SHARD:04d}.ndjson").open("w", encoding="utf-8") as fh:
+            for i in range(start, min(n, start + SHARD)):
+                fh.write(json.dumps(joke(i, rng), ensure_ascii=False) + "\n")
+    done.touch()
+    return out
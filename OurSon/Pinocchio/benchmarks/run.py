@@ -0,0 +1,215 @@
+"""
+Hot-path benchmarks: joke library, KV/episodic storage, vector store, dialogue turn.
+
+    python -m benchmarks.run --sizes 1k,100k --out bench.json [--compare old.json]
+
+Every result is {"name", "size", "n", "median_ms", "p95_ms", "mean_ms", "ops_per_s"};
+the JSON also records the commit and interpreter so runs can be compared.
+"""
+import argparse, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.corpus import SIZES, TAGS, CHARACTERS, corpus
+from nestor.io_utils.m3_jokes import JokeLibrary
+from nestor.memory.episodic import EpisodicMemory
+from nestor.storage.kv import KV
+from nestor.storage.vector import NumpyVectorStore
+
+VECTOR_CAP = 100_000   # 1M x 384 floats is 1.5 GB: vector benches stop at 100k rows
+
+class Results:
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+
+    def add(self, name: str, size: str, durations: List[float], **extra) -> None:
+        durations = sorted(durations)
+        row = {
+            "name": name, "size": size, "n": len(durations),
+            "median_ms": round(statistics.median(durations) * 1000, 4),
+            "p95_ms": round(durations[min(len(durations) - 1, int(0.95 * len(durations)))] * 1000, 4),
+            "mean_ms": round(statistics.fmean(durations) * 1000, 4),
+            "ops_per_s": round(len(durations) / sum(durations), 1) if sum(durations) else None,
+            **extra,
+        }
+        self.rows.append(row)
+        tags = "".join(f" {k}={v}" for k, v in extra.items())
+        print(f"{name:<36} {size:>5} {row['median_ms']:>11.3f} ms  p95 {row['p95_ms']:>11.3f} ms  n={row['n']}{tags}", flush=True)
+
+def timed(fn: Callable[[], Any], n: int) -> List[float]:
+    out = []
+    for _ in range(n):
+        t = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t)
+    return out
+
+# ---------- library ----------
+
+def bench_library(res: Results, size: str, data: Path, tmp: Path) -> JokeLibrary:
+    repeat = 1 if SIZES[size] >= 1_000_000 else 3
+    res.add("library.from_path", size, timed(lambda: JokeLibrary.from_path(data), repeat))
+    snap = tmp / f"lib_{size}.snap"
+    JokeLibrary.from_path(data, snapshot=snap)
+    res.add("library.from_path(snapshot)", size, timed(lambda: JokeLibrary.from_path(data, snapshot=snap), repeat))
+    mapped = tmp / f"lib_{size}.m3map"
+    JokeLibrary.from_path(data, snapshot=snap, mapped=mapped)
+    res.add("library.from_path(mapped)", size, timed(lambda: JokeLibrary.from_path(data, mapped=mapped), repeat))
+    lib = JokeLibrary.from_path(data, snapshot=snap)
+
+    rng = random.Random(1)
+    mixes = {
+        "lang": lambda: lib.search(lang="fr"),
+        "lang+style+audience": lambda: lib.search(lang="fr", style="standup", audience="all-ages"),
+        "tag": lambda: lib.search(include_tags=[rng.choice(TAGS)]),
+        "tags+character": lambda: lib.search(include_tags=[rng.choice(TAGS)], include_characters=[rng.choice(CHARACTERS)]),
+        "text": lambda: lib.search(text_query="pingouin café"),
+        "all+limit": lambda: lib.search(lang="en", style="dad", safety="safe", include_tags=[rng.choice(TAGS)],
+                                        text_query="robot", limit=20),
+    }
+    for mix, fn in mixes.items():
+        res.add(f"library.search[{mix}]", size, timed(fn, 50))
+    res.add("library.sample(5)", size, timed(lambda: lib.sample(5, style="standup"), 200))
+    sessions = [f"s{i}" for i in range(100)]
+    res.add("library.random(session)", size, timed(lambda: lib.random(session=rng.choice(sessions), lang="fr"), 500))
+    return lib
+
+# ---------- storage ----------
+
+def bench_kv(res: Results, tmp: Path) -> None:
+    kv = KV(str(tmp / "kv.db"))
+    keys = [f"k{i}" for i in range(10_000)]
+    it = iter(range(10**9))
+    res.add("kv.set", "-", timed(lambda: kv.set(keys[next(it) % len(keys)], {"v": 1}), 2000))
+    res.add("kv.get", "-", timed(lambda: kv.get(random.choice(keys)), 5000))
+    batch = {k: {"v": 2} for k in keys[:100]}
+    res.add("kv.set_many(100)", "-", timed(lambda: kv.set_many(batch), 200))
+    res.add("kv.get_many(100)", "-", timed(lambda: kv.get_many(keys[:100]), 500))
+    kv.close()
+
+    wb = KV(str(tmp / "kv_wb.db"), write_behind=0.01)
+    res.add("kv.set(write_behind)", "-", timed(lambda: wb.set(keys[next(it) % len(keys)], {"v": 1}), 5000))
+    wb.close()
+
+def bench_episodic(res: Results, tmp: Path) -> None:
+    kv = KV(str(tmp / "epi.db"))
+    epi = EpisodicMemory(kv)
+    event = {"u": "bonjour Nestor, une blague ?", "a": "Pourquoi le pingouin traverse-t-il la banquise ?"}
+    filled = 0
+    for history in (0, 10_000, 100_000):
+        if history > filled:  # pre-fill in one transaction, not part of the measurement
+            with kv.conn as conn:
+                conn.executemany("INSERT INTO episodic (session, ts, event) VALUES (?,?,?)",
+                                 [("bench", float(i), json.dumps(event)) for i in range(filled, history)])
+            filled = history
+        res.add("episodic.remember", "-", timed(lambda: epi.remember(event, session="bench"), 500), history=history)
+        res.add("episodic.recent(20)", "-", timed(lambda: epi.recent(20, session="bench"), 200), history=history)
+    kv.close()
+
+def bench_vector(res: Results, size: str, lib: JokeLibrary, tmp: Path) -> None:
+    n = min(SIZES[size], VECTOR_CAP)
+    store = NumpyVectorStore(str(tmp / f"vec_{size}"), capacity=n)
+    items = [{"id": j.id, "text": j.render(), "lang": j.lang} for j in lib.all()[:n]]
+    durations = []
+    for i in range(0, n, 256):
+        t = time.perf_counter()
+        store.add(items[i:i + 256], namespace="jokes")
+        durations.append(time.perf_counter() - t)
+    res.add("vector.add(256)", f"{n // 1000}k", durations)
+    queries = ["pingouin au café", "le robot du dentiste", "grand-mère en vacances", "fromage et tracteur"]
+    res.add("vector.search(k=5)", f"{n // 1000}k", timed(lambda: store.search(random.choice(queries), k=5, namespace="jokes"), 100),
+            capped=n < SIZES[size])
+    store.close()
+
+# ---------- dialogue ----------
+
+class FakeLLMClient:
+    """In-process backend: fixed-cost echo, no network."""
+    model = "fake"
+
+    def generate(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> str:
+        return f"Réponse à: {prompt[-40:]}"
+
+    def stream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs):
+        yield self.generate(prompt, system=system)
+
+    async def agenerate(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> str:
+        return self.generate(prompt, system=system)
+
+    async def astream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs):
+        yield self.generate(prompt, system=system)
+
+def bench_dialogue(res: Results, tmp: Path) -> None:
+    os.environ.update({"VECTOR_DB": "numpy", "VECTOR_PATH": str(tmp / "dm_vectors"), "KV_PATH": str(tmp / "dm.db"),
+                       "LLM_CACHE_ENTRIES": "0"})
+    from nestor.dialogue.manager import DialogueManager
+    dm = DialogueManager()
+    dm.llm._client = FakeLLMClient()
+    dm.vec.add([{"id": i, "text": f"souvenir {i} du pingouin et du café"} for i in range(1000)], namespace="texts")
+    sessions = [{"session_id": f"user{i}"} for i in range(20)]
+    msgs = ["bonjour", "raconte une blague", "encore une !", "sur les pingouins ?", "merci"]
+    rng = random.Random(0)
+    res.add("dialogue.respond", "-", timed(lambda: dm.respond(rng.choice(msgs), rng.choice(sessions)), 300))
+    dm.kv.close()
+
+# ---------- main ----------
+
+def git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(rows: List[Dict[str, Any]], baseline: Path) -> None:
+    old = {(r["name"], r["size"], r.get("history")): r for r in json.loads(baseline.read_text(encoding="utf-8"))["results"]}
+    print(f"\nvs {baseline} (median, >1 = slower)")
+    for r in rows:
+        prev = old.get((r["name"], r["size"], r.get("history")))
+        if prev and prev["median_ms"]:
+            ratio = r["median_ms"] / prev["median_ms"]
+            flag = "  <-- regression" if ratio > 1.2 else ""
+            print(f"{r['name']:<36} {r['size']:>5} {ratio:6.2f}x{flag}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1k,100k", help="comma list of " + ",".join(SIZES))
+    ap.add_argument("--only", default="library,kv,episodic,vector,dialogue")
+    ap.add_argument("--cache", default=str(ROOT / "benchmarks" / ".cache"), help="where synthetic corpora are kept")
+    ap.add_argument("--out", help="write results JSON here (default: stdout)")
+    ap.add_argument("--compare", help="previous results JSON to diff against")
+    args = ap.parse_args()
+    only = set(args.only.split(","))
+    res = Results()
+    started = time.time()
+    with tempfile.TemporaryDirectory(prefix="nestor-bench-") as tmp:
+        tmp = Path(tmp)
+        for size in args.sizes.split(","):
+            if not only & {"library", "vector"}:
+                break
+            data = corpus(size, Path(args.cache))
+            lib = bench_library(res, size, data, tmp) if "library" in only else JokeLibrary.from_path(data)
+            if "vector" in only:
+                bench_vector(res, size, lib, tmp)
+        if "kv" in only:
+            bench_kv(res, tmp)
+        if "episodic" in only:
+            bench_episodic(res, tmp)
+        if "dialogue" in only:
+            bench_dialogue(res, tmp)
+    report = {
+        "commit": git_rev(), "python": platform.python_version(), "machine": platform.machine(),
+        "cpus": os.cpu_count(), "started": started, "duration_s": round(time.time() - started, 1),
+        "results": res.rows,
+    }
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        compare(res.rows, Path(args.compare))
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,24 @@ class Settings(BaseSettings):
     llm_backend: Literal["lmstudio","openai"] = "lmstudio"
     lmstudio_base_url: str = "http://localhost:1234/v1"
     openai_api_key: str | None = None
-    vector_db: Literal["chromadb","faiss"] = "chromadb"
+    vector_db: Literal["chromadb","faiss","numpy"] = "chromadb"
+    vector_path: str = "nestor_vectors"  # numpy backend: memmapped matrix + row log
+    semantic_cache_entries: int = 1024  # query embeddings / recall results kept per cache, 0 disables
+    session_max: int = 4096           # hot sessions kept in memory per worker
+    session_idle_s: float = 1800      # idle sessions leave memory (history stays in the KV)
+    session_history_turns: int = 50
+    history_token_budget: int = 1024  # history tokens sent to the model per turn
+    context_token_budget: int = 512   # retrieved context tokens per turn
+    prompt_token_budget: int = 2048   # whole prompt (persona + history + context + message)
+    jokes_path: str | None = None          # joke corpus (file or folder); its modules' taboos drive the guardrails
+    jokes_mapped_path: str | None = None   # shared mmap file for the corpus, e.g. "jokes.m3map" (uvicorn workers)
+    kv_path: str = "nestor.db"
+    kv_write_behind_ms: int = 0   # >0: group KV/episodic commits within this window
+    llm_cache_entries: int = 1024  # 0 disables the LLM response cache
+    llm_cache_ttl_s: float = 3600
+    llm_cache_path: str | None = None  # optional SQLite tier, e.g. "llm_cache.db"
+    llm_batch_window_ms: float = 0     # >0: route async generation through the micro-batcher
+    llm_max_concurrency: int = 4
 
     class Config:
         env_file = ".env"
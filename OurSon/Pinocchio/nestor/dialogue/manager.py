@@ -1,33 +1,162 @@
-from typing import Dict, Any
+import asyncio, functools, time
+from typing import Dict, Any, AsyncIterator, Set
 from ..config import load_settings
+from ..humor import safety
+from ..io_utils.m3_jokes import JokeLibrary
 from ..logging import get_logger
+from ..llm.batching import BatchDispatcher
+from ..llm.cache import ResponseCache
 from ..llm.client import LLM
 from ..persona import registry as personas
 from ..memory.episodic import EpisodicMemory
 from ..memory.semantic import SemanticMemory
+from ..obs import metrics
+from ..obs.metrics import span
 from ..storage.kv import KV
-from ..storage.vector import VectorStore
-from .session import SessionState
+from ..storage.vector import make_vector_store
+from ..tools import guardrails
+from .prompt import Prompt, PromptBuilder
+from .session import SessionState, SessionStore
 
 log = get_logger(__name__)
 
 class DialogueManager:
     def __init__(self):
         self.settings = load_settings()
-        self.llm = LLM(backend=self.settings.llm_backend, base_url=self.settings.lmstudio_base_url, api_key=self.settings.openai_api_key)
-        self.kv = KV()
-        self.vec = VectorStore()
+        s = self.settings
+        cache = ResponseCache(s.llm_cache_entries, ttl=s.llm_cache_ttl_s, path=s.llm_cache_path) if s.llm_cache_entries > 0 else None
+        self.llm = LLM(backend=s.llm_backend, cache=cache, base_url=s.lmstudio_base_url, api_key=s.openai_api_key)
+        self.batcher = BatchDispatcher(self.llm, window=s.llm_batch_window_ms / 1000,
+                                       max_concurrency=s.llm_max_concurrency) if s.llm_batch_window_ms > 0 else None
+        self.kv = KV(s.kv_path, write_behind=s.kv_write_behind_ms / 1000)
+        self.vec = make_vector_store(s)
         self.epi = EpisodicMemory(self.kv)
-        self.sem = SemanticMemory(self.vec)
+        self.sem = SemanticMemory(self.vec, max_embeddings=s.semantic_cache_entries, max_results=s.semantic_cache_entries)
+        self.sessions = SessionStore(self.kv, max_sessions=s.session_max, idle_ttl=s.session_idle_s,
+                                     max_turns=s.session_history_turns)
+        self.prompts = PromptBuilder(s.prompt_token_budget, context_budget=s.context_token_budget,
+                                     history_budget=s.history_token_budget)
+        self._background: Set[asyncio.Task] = set()
+        self._last_write: Dict[str, asyncio.Task] = {}  # session id -> its latest pending write
+        # the corpus' taboos configure the process-wide safety engine used by the guardrails;
+        # prepare= writes the verdicts into the mapped file before it goes read-only
+        self.jokes = JokeLibrary.from_path(s.jokes_path, mapped=s.jokes_mapped_path,
+                                           prepare=safety.guard_library) if s.jokes_path else None
+        self.joke_safety = safety.guard_library(self.jokes) if self.jokes is not None else {}
+        if cache is not None:
+            metrics.METRICS.register("llm_cache", lambda: cache.stats)
+        if self.batcher is not None:
+            metrics.METRICS.register("llm_batcher", self.batcher.stats)
+        metrics.METRICS.register("semantic_cache", lambda: self.sem.stats)
+        metrics.METRICS.register("sessions", lambda: {"hot": len(self.sessions)})
 
     def respond(self, user_msg: str, meta: Dict[str, Any] | None = None, state: SessionState | None = None) -> str:
-        state = state or SessionState(id="default")
-        ctx = {"user": user_msg, "history": state.history}
-        blocks = personas.apply(state.chakra, ctx)
-        system = blocks.get("system", "")
-        retrieval = self.sem.recall(user_msg, k=3, namespace="texts")
-        prompt = f"Context: {retrieval}\nUser: {user_msg}"
-        reply = self.llm.generate(prompt, system=system)
-        state.history.append({"user": user_msg, "assistant": reply})
-        self.epi.remember({"u": user_msg, "a": reply})
-        return reply
+        with span("respond.total"):
+            state = state or self.session(meta)
+            blocks = self._persona(user_msg, state, self._chakra(meta, state))
+            retrieval = self._recall(user_msg)
+            p = self._prompt(blocks, user_msg, state, retrieval)
+            with span("respond.llm"):
+                reply = self.llm.generate(p.user, system=p.system, messages=p.messages)
+            reply = guardrails.sanitize(reply, guardrails.mode_for(state.rating))
+            state.add_turn(user_msg, reply)
+            self._persist(user_msg, reply, state)
+            return reply
+
+    async def respond_async(self, user_msg: str, meta: Dict[str, Any] | None = None, state: SessionState | None = None) -> str:
+        with span("respond.total"):
+            state = state or self.session(meta)
+            p = await self._prepare(user_msg, state, self._chakra(meta, state))
+            with span("respond.llm"):
+                reply = await (self.batcher or self.llm).agenerate(p.user, system=p.system, messages=p.messages)
+            reply = guardrails.sanitize(reply, guardrails.mode_for(state.rating))
+            self._record(user_msg, reply, state)
+            return reply
+
+    async def respond_stream(self, user_msg: str, meta: Dict[str, Any] | None = None, state: SessionState | None = None) -> AsyncIterator[str]:
+        with span("respond_stream.total"):
+            state = state or self.session(meta)
+            p = await self._prepare(user_msg, state, self._chakra(meta, state))
+            parts = []
+            guard = guardrails.stream_sanitizer(guardrails.mode_for(state.rating))
+            start = time.perf_counter()
+            async for chunk in self.llm.astream(p.user, system=p.system, messages=p.messages):
+                if not parts:
+                    metrics.observe("respond_stream.first_token", time.perf_counter() - start)
+                chunk = guard.feed(chunk)
+                parts.append(chunk)
+                if chunk:
+                    yield chunk
+            tail = guard.flush()
+            if tail:
+                parts.append(tail)
+                yield tail
+            self._record(user_msg, "".join(parts), state)
+
+    async def aclose(self) -> None:
+        if self.batcher is not None:
+            await self.batcher.aclose()
+        # let pending memory writes land before the process goes away
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await asyncio.to_thread(self.kv.flush)
+
+    def session(self, meta: Dict[str, Any] | None = None) -> SessionState:
+        """Session named by meta["session_id"]; without one, a throwaway session (no shared history)."""
+        session_id = (meta or {}).get("session_id")
+        return self.sessions.get(session_id) if session_id else self.sessions.ephemeral()
+
+    @staticmethod
+    def _chakra(meta: Dict[str, Any] | None, state: SessionState) -> str:
+        # per request: a named session is shared by every request that names it
+        return (meta or {}).get("chakra") or state.chakra
+
+    def _context(self, user_msg: str, state: SessionState) -> dict:
+        return {"user": user_msg, "history": state.window(self.settings.history_token_budget)}
+
+    def _persona(self, user_msg: str, state: SessionState, chakra: str) -> dict:
+        with span("respond.persona"):
+            return personas.apply(chakra, self._context(user_msg, state))
+
+    def _recall(self, user_msg: str):
+        with span("respond.recall"):
+            return self.sem.recall(user_msg, k=3, namespace="texts")
+
+    def _prompt(self, blocks: dict, user_msg: str, state: SessionState, retrieval) -> Prompt:
+        with span("respond.prompt"):
+            return self.prompts.build(blocks.get("system", ""), user_msg, history=state.history, retrieval=retrieval)
+
+    async def _prepare(self, user_msg: str, state: SessionState, chakra: str) -> Prompt:
+        # persona assembly and retrieval are independent: run them side by side
+        blocks, retrieval = await asyncio.gather(
+            asyncio.to_thread(self._persona, user_msg, state, chakra),
+            asyncio.to_thread(self._recall, user_msg),
+        )
+        return self._prompt(blocks, user_msg, state, retrieval)
+
+    def _persist(self, user_msg: str, reply: str, state: SessionState) -> None:
+        with span("respond.persist"):
+            self.epi.remember({"u": user_msg, "a": reply}, session=state.id)
+            self.sessions.save(state)
+
+    def _record(self, user_msg: str, reply: str, state: SessionState) -> None:
+        state.add_turn(user_msg, reply)
+        previous = None if state.ephemeral else self._last_write.get(state.id)
+        task = asyncio.get_running_loop().create_task(self._write(user_msg, reply, state, previous))
+        if not state.ephemeral:
+            self._last_write[state.id] = task
+        self._background.add(task)
+        task.add_done_callback(functools.partial(self._persisted, state.id))
+
+    async def _write(self, user_msg: str, reply: str, state: SessionState, previous: asyncio.Task | None) -> None:
+        # a session's turns land in the order they were taken; other sessions write in parallel
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        await asyncio.to_thread(self._persist, user_msg, reply, state)
+
+    def _persisted(self, session_id: str, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if self._last_write.get(session_id) is task:
+            del self._last_write[session_id]
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("session/episodic write failed: %s", task.exception())
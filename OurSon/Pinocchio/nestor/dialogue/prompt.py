@@ -0,0 +1,67 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+from .tokens import count_tokens, count_turn
+
+@dataclass
+class Prompt:
+    system: str                                          # persona prompt, byte-identical every turn
+    messages: List[dict] = field(default_factory=list)   # history, between system and the user turn
+    user: str = ""                                       # retrieved context + current message
+    tokens: int = 0                                      # estimated size of the whole prompt
+
+class PromptBuilder:
+    """
+    Assembles system + history + context + message under a token budget.
+    The system message is the persona prompt alone, so the prefix the backend sees
+    only changes when the persona does (its prompt/KV cache stays warm); per-turn
+    material (retrieved context) goes into the last user message. Retrieved items
+    are rendered as bare text lines, at most `context_budget` tokens; history gets
+    the rest of the budget, newest turns first, at most `history_budget` tokens.
+    """
+
+    def __init__(self, budget: int = 2048, context_budget: int = 512, history_budget: int = 1024,
+                 max_item_chars: int = 300):
+        self.budget = budget
+        self.context_budget = context_budget
+        self.history_budget = history_budget
+        self.max_item_chars = max_item_chars
+
+    def render_item(self, item: Dict[str, Any]) -> str:
+        text = " ".join((item.get("text") or "").split())
+        if len(text) > self.max_item_chars:
+            text = text[:self.max_item_chars - 1].rstrip() + "…"
+        return text
+
+    def build(self, system: str, user_msg: str, history: Sequence[dict] = (), retrieval: Sequence[Dict[str, Any]] = ()) -> Prompt:
+        remaining = self.budget - count_tokens(system) - count_tokens(user_msg) - 8
+
+        lines: List[str] = []
+        seen = set()
+        ctx_left = min(self.context_budget, remaining)
+        for item in retrieval:
+            line = self.render_item(item)
+            if not line or line in seen:
+                continue
+            cost = count_tokens(line) + 1
+            if cost > ctx_left:
+                break
+            ctx_left -= cost
+            seen.add(line)
+            lines.append(f"- {line}")
+        user = "Context:\n" + "\n".join(lines) + f"\n\n{user_msg}" if lines else user_msg
+        remaining -= count_tokens(user) - count_tokens(user_msg)
+
+        turns: List[dict] = []
+        hist_left = min(self.history_budget, remaining)
+        for turn in reversed(history):
+            hist_left -= count_turn(turn)
+            if hist_left < 0:
+                break
+            turns.append(turn)
+        turns.reverse()
+        messages = []
+        for turn in turns:
+            messages.append({"role": "user", "content": turn["user"]})
+            messages.append({"role": "assistant", "content": turn["assistant"]})
+        return Prompt(system=system, messages=messages, user=user,
+                      tokens=count_tokens(system) + count_tokens(user) + sum(count_turn(t) for t in turns))
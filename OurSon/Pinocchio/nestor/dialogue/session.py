@@ -1,8 +1,112 @@
+import threading, time, zlib
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List
+from .tokens import count_turn
+
+MAX_TURNS = 50
 
 @dataclass
 class SessionState:
     id: str
     chakra: str = "racine"
-    history: list[dict] = field(default_factory=list)
+    history: Deque[dict] = field(default_factory=lambda: deque(maxlen=MAX_TURNS))  # ring buffer: oldest turns fall off
     rating: str = "G"
+    last_seen: float = field(default_factory=time.time)
+    ephemeral: bool = False  # anonymous caller: never cached, saved or shared
+
+    def add_turn(self, user: str, assistant: str) -> None:
+        self.history.append({"user": user, "assistant": assistant})
+        self.last_seen = time.time()
+
+    def window(self, budget: int) -> List[dict]:
+        """Most recent turns (oldest first) whose estimated token count fits in `budget`."""
+        out: List[dict] = []
+        for turn in reversed(self.history):
+            budget -= count_turn(turn)
+            if budget < 0:
+                break
+            out.append(turn)
+        out.reverse()
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "chakra": self.chakra, "history": list(self.history), "rating": self.rating}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], max_turns: int = MAX_TURNS) -> "SessionState":
+        return cls(id=data["id"], chakra=data.get("chakra", "racine"), rating=data.get("rating", "G"),
+                   history=deque(data.get("history", ()), maxlen=max_turns))
+
+class _Shard:
+    __slots__ = ("lock", "sessions")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()  # least recently used first
+
+class SessionStore:
+    """
+    Sessions by id: an LRU of hot sessions in memory, split into shards with their
+    own lock, backed by the KV store ("session:<id>"). A shard holds at most
+    max_sessions / shards sessions; sessions idle for `idle_ttl` seconds are dropped
+    on access. Dropped sessions are reloaded from the KV on their next request.
+    """
+
+    def __init__(self, kv: Any, max_sessions: int = 4096, idle_ttl: float = 1800,
+                 max_turns: int = MAX_TURNS, shards: int = 16):
+        self.kv = kv
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self._per_shard = max(1, max_sessions // shards)
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[zlib.crc32(session_id.encode("utf-8")) % len(self._shards)]
+
+    def ephemeral(self) -> SessionState:
+        """Fresh session for a caller without an id; its history lives for one request."""
+        return SessionState(id="default", history=deque(maxlen=self.max_turns), ephemeral=True)
+
+    def get(self, session_id: str) -> SessionState:
+        shard = self._shard(session_id)
+        now = time.time()
+        with shard.lock:
+            self._evict(shard, now)
+            state = shard.sessions.get(session_id)
+            if state is not None:
+                shard.sessions.move_to_end(session_id)
+        if state is None:
+            data = self.kv.get(f"session:{session_id}")
+            state = SessionState.from_dict(data, self.max_turns) if data else \
+                SessionState(id=session_id, history=deque(maxlen=self.max_turns))
+            with shard.lock:
+                state = shard.sessions.setdefault(session_id, state)  # a concurrent loader may have won
+                shard.sessions.move_to_end(session_id)
+                self._evict(shard, now)
+        state.last_seen = now
+        return state
+
+    def _evict(self, shard: _Shard, now: float) -> None:
+        sessions = shard.sessions
+        while len(sessions) > self._per_shard:
+            sessions.popitem(last=False)
+        while sessions:
+            oldest = next(iter(sessions.values()))
+            if now - oldest.last_seen < self.idle_ttl:
+                break
+            sessions.popitem(last=False)
+
+    def save(self, state: SessionState) -> None:
+        if state.ephemeral:
+            return
+        self.kv.set(f"session:{state.id}", state.to_dict())
+
+    def drop(self, session_id: str) -> None:
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.sessions.pop(session_id, None)
+        self.kv.delete(f"session:{session_id}")
+
+    def __len__(self) -> int:
+        return sum(len(s.sessions) for s in self._shards)
@@ -0,0 +1,10 @@
+import re
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """Cheap BPE-like estimate: one token per punctuation mark, ~4 characters per word piece."""
+    return sum(1 + (len(p) - 1) // 4 for p in _PIECE.findall(text or ""))
+
+def count_turn(turn: dict) -> int:
+    return sum(count_tokens(v) for v in turn.values() if isinstance(v, str)) + 4  # role/format overhead
@@ -1,2 +1,238 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from ..io_utils.m3_jokes import fold   # same folding as the joke index: ’ -> ', œ -> oe, no accents, casefold
+
+def fold_with_map(text: str) -> Tuple[str, List[int]]:
+    """fold() plus, for each folded char, the index of the original char it came from."""
+    out, where = [], []
+    for i, ch in enumerate(text):
+        f = fold(ch)
+        out.append(f)
+        where.extend([i] * len(f))
+    return "".join(out), where
+
+class Match(NamedTuple):
+    start: int      # span in the original text
+    end: int
+    term: str
+    level: str      # "hard" | "soft"
+
+VERDICTS = ("safe", "borderline", "risky")   # same vocabulary as Joke.safety
+_BLOCKED = {"G": ("hard", "soft"), "PG": ("hard",), "16+": ("hard",), "18+": ("hard",)}
+
+def blocked(rating: str) -> Tuple[str, ...]:
+    """Taboo levels ruled out at `rating` (unknown ratings get the strictest policy)."""
+    return _BLOCKED.get(rating, _BLOCKED["G"])
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """One regex shaped like a trie of the terms: shared prefixes are matched once."""
+    trie: dict = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node: dict) -> str:
+        end = "" in node
+        branches = [(r"\s+" if ch == " " else re.escape(ch)) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if end else body
+
+    return emit(trie)
+
+class SafetyEngine:
+    """
+    Taboo terms (hard/soft limits of the humor modules) compiled into one matcher
+    over folded text. The terms form a single trie-shaped regex anchored on word
+    boundaries, so a scan is one left-to-right pass in C whatever the number of
+    terms ("haine" does not fire inside "chaîne"). Verdicts: hard -> risky,
+    soft -> borderline, none -> safe.
+    """
+
+    def __init__(self, terms: Optional[Dict[str, str]] = None, bleep: str = "⭐"):
+        self.bleep = bleep
+        self.terms: Dict[str, str] = {}              # folded term -> level (hard wins)
+        for term, level in (terms or {}).items():
+            key = " ".join(fold(term).split())
+            if key and self.terms.get(key) != "hard":
+                self.terms[key] = level
+        self.max_len = max((len(t) for t in self.terms), default=0)
+        self._re = re.compile(r"(?<!\w)(?:" + _trie_pattern(self.terms) + r")(?!\w)") if self.terms else None
+
+    @classmethod
+    def from_modules(cls, modules: Dict[str, dict]) -> "SafetyEngine":
+        """Union of every module's taboos; the bleep symbol is the one most modules declare."""
+        terms: Dict[str, str] = {}
+        symbols: Counter = Counter()
+        for info in modules.values():
+            taboos = info.get("taboos") or {}
+            for t in taboos.get("soft_limits") or ():
+                terms.setdefault(t, "soft")
+            for t in taboos.get("hard_limits") or ():
+                terms[t] = "hard"
+            if taboos.get("bleep_symbol"):
+                symbols[taboos["bleep_symbol"]] += 1
+        return cls(terms, bleep=symbols.most_common(1)[0][0] if symbols else "⭐")
+
+    @property
+    def empty(self) -> bool:
+        return self._re is None
+
+    def _levels(self, folded: str) -> Iterator[Tuple[str, int, int]]:
+        for m in self._re.finditer(folded):
+            yield self.terms[" ".join(m.group().split())], m.start(), m.end()
+
+    def scan(self, text: str) -> List[Match]:
+        if self._re is None or not text:
+            return []
+        if text.isascii():  # folding is 1:1 on ASCII, positions carry over
+            return [Match(s, e, text[s:e], lvl) for lvl, s, e in self._levels(fold(text))]
+        folded, where = fold_with_map(text)
+        out = []
+        for lvl, s, e in self._levels(folded):
+            start, end = where[s], where[e - 1] + 1
+            out.append(Match(start, end, text[start:end], lvl))
+        return out
+
+    def verdict(self, text: str) -> str:
+        if self._re is None or not text:
+            return "safe"
+        levels = {lvl for lvl, _, _ in self._levels(fold(text))}
+        return "risky" if "hard" in levels else "borderline" if levels else "safe"
+
+    def screen(self, texts: Sequence[str]) -> List[str]:
+        """Verdict per text, in order (one pass per text, no per-term loop)."""
+        return [self.verdict(t) for t in texts]
+
+    def allowed(self, text: str, rating: str = "G") -> bool:
+        levels = blocked(rating)
+        if self._re is None or not text:
+            return True
+        return not any(lvl in levels for lvl, _, _ in self._levels(fold(text)))
+
+    def sanitize(self, text: str, levels: Sequence[str] = ("hard", "soft")) -> str:
+        if self._re is None or not text or not any(lvl in levels for lvl, _, _ in self._levels(fold(text))):
+            return text  # clean text: no position mapping needed
+        hits = [m for m in self.scan(text) if m.level in levels]
+        if not hits:
+            return text
+        parts, pos = [], 0
+        for m in hits:
+            parts.append(text[pos:m.start])
+            parts.append(self.bleep)
+            pos = m.end
+        parts.append(text[pos:])
+        return "".join(parts)
+
+    def annotate(self, jokes: Iterable) -> Dict[str, str]:
+        """id -> verdict for Joke objects (rendered text); computed once per library load."""
+        return {j.id: self.verdict(j.render()) for j in jokes}
+
+    def stream(self, levels: Sequence[str] = ("hard", "soft")) -> "StreamSanitizer":
+        return StreamSanitizer(self, levels)
+
+class StreamSanitizer:
+    """
+    Sanitizes text arriving in chunks. Only the tail that could still be part of a
+    term is held back: `max_len + 1` folded characters (plus one for the word-boundary
+    check), a whitespace run counting as one since terms match any run of spaces.
+    Everything before it is scanned once and released immediately.
+    """
+
+    def __init__(self, engine: SafetyEngine, levels: Sequence[str] = ("hard", "soft")):
+        self.engine = engine
+        self.levels = levels
+        self._buf = ""
+        self._prev = ""   # released tail from the last char that folds to something: word-boundary context
+
+    def feed(self, chunk: str) -> str:
+        if self.engine.empty:
+            return chunk
+        self._buf += chunk
+        cut = self._tail_start()
+        if cut <= 0:
+            return ""
+        for m in self._hits():
+            if m.start < cut < m.end:
+                cut = m.start   # never split a taboo term across releases
+                break
+        return self._release(cut)
+
+    def flush(self) -> str:
+        return self._release(len(self._buf))
+
+    def _tail_start(self) -> int:
+        need, i, in_space = self.engine.max_len + 1, len(self._buf), False
+        while i > 0 and need > 0:
+            ch = self._buf[i - 1]
+            if ch.isspace():
+                need -= not in_space
+                in_space = True
+            else:
+                need -= len(fold(ch))   # 0 for a lone combining mark
+                in_space = False
+            i -= 1
+        return i
+
+    def _hits(self) -> List[Match]:
+        # scan with the released context so (?<!\w) sees what came before
+        shift = len(self._prev)
+        return [Match(m.start - shift, m.end - shift, m.term, m.level)
+                for m in self.engine.scan(self._prev + self._buf) if m.end > shift and m.level in self.levels]
+
+    def _release(self, cut: int) -> str:
+        if cut <= 0:
+            return ""
+        out, pos = [], 0
+        for m in self._hits():
+            if m.end > cut:
+                break
+            if m.start < 0:
+                continue
+            out.append(self._buf[pos:m.start])
+            out.append(self.engine.bleep)
+            pos = m.end
+        out.append(self._buf[pos:cut])
+        # a combining mark (NFD) folds to "": keep the base char it sits on as context
+        j = cut - 1
+        while j > 0 and not fold(self._buf[j]):
+            j -= 1
+        self._prev = self._buf[j:cut] if fold(self._buf[j]) else self._prev + self._buf[:cut]
+        self._buf = self._buf[cut:]
+        return "".join(out)
+
+# ---------- process-wide engine ----------
+
+_engine = SafetyEngine()
+
+def configure(engine: SafetyEngine) -> None:
+    global _engine
+    _engine = engine
+
+def engine() -> SafetyEngine:
+    return _engine
+
 def is_safe(joke_text: str, rating: str) -> bool:
-    return True
+    """Rating policy: G blocks hard and soft limits; PG, 16+ and 18+ block hard limits only."""
+    return _engine.allowed(joke_text, rating)
+
+_verdicts: Dict[str, Dict[str, str]] = {}
+
+def guard_library(lib) -> Dict[str, str]:
+    """
+    Compile the taboos of a loaded JokeLibrary into the process-wide engine and
+    return id -> verdict for all its jokes (cached until the library changes).
+    Jokes that declare no safety get their verdict, so search(safety=...) sees it.
+    """
+    verdicts = _verdicts.get(lib.fingerprint)
+    if verdicts is None:
+        configure(SafetyEngine.from_modules(lib.modules))
+        verdicts = _engine.annotate(lib.all())
+        _verdicts.clear()
+        _verdicts[lib.fingerprint] = verdicts
+    lib.annotate_safety(verdicts)
+    return verdicts
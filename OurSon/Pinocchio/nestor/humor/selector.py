@@ -1,2 +1,149 @@
-def rank_candidates(cands: list[dict], context: str) -> list[dict]:
-    return cands  # TODO: implement ranking
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from ..logging import get_logger
+
+log = get_logger(__name__)
+
+CACHE_VERSION = 3
+
+def _vectorizer():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    # char n-grams inside word boundaries: robust to inflection, typos and fr/en mixing
+    return TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 4), lowercase=True, strip_accents="unicode",
+                           sublinear_tf=True, dtype=np.float32)
+
+class JokeRanker:
+    """
+    TF-IDF (char 3-4 grams) over a whole joke collection, fitted once.
+    The matrix is kept transposed (features x jokes, CSR) so scoring a context is
+    one sparse vector-matrix product touching only the n-grams the context has;
+    style weights and a recency penalty are blended in, top-k by argpartition.
+    """
+
+    def __init__(self, ids: Sequence[str], texts: Sequence[str], styles: Sequence[str]):
+        self.ids = list(ids)
+        self.row_of: Dict[str, int] = {i: r for r, i in enumerate(self.ids)}
+        self.style_names, codes = np.unique(np.asarray(styles, dtype=str), return_inverse=True)
+        self._style_code = codes.astype(np.int32)
+        self.vectorizer = _vectorizer()
+        try:
+            matrix = self.vectorizer.fit_transform(texts) if self.ids else None
+        except ValueError:  # nothing but empty texts / no n-gram at all
+            matrix = None
+        self._by_feature = matrix.T.tocsr() if matrix is not None else None
+        self.signature: Optional[str] = None
+
+    @classmethod
+    def from_library(cls, lib, cache: Optional[Path | str] = None) -> "JokeRanker":
+        """
+        Fit on every joke of a JokeLibrary. With `cache` (.npz: plain arrays, loaded
+        without pickle), reuse the fitted matrix while the library is unchanged.
+        """
+        signature = f"{CACHE_VERSION}:{lib.fingerprint}"
+        if cache is not None and Path(cache).exists():
+            try:
+                ranker = cls._load(Path(cache), signature)
+                if ranker is not None:
+                    return ranker
+            except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                log.warning("ranker cache %s unreadable, rebuilding: %s", cache, e)
+        jokes = lib.all()
+        ranker = cls([j.id for j in jokes], [j.render() for j in jokes], [j.style for j in jokes])
+        ranker.signature = signature
+        if cache is not None:
+            try:
+                ranker._save(Path(cache))
+            except OSError as e:
+                log.warning("cannot write ranker cache %s: %s", cache, e)
+        return ranker
+
+    def _save(self, path: Path) -> None:
+        arrays = {"signature": np.array(self.signature or ""), "ids": np.array(self.ids, dtype=str),
+                  "style_names": self.style_names, "style_code": self._style_code}
+        m = self._by_feature
+        if m is not None:
+            vocab = self.vectorizer.vocabulary_
+            arrays.update(terms=np.array(sorted(vocab, key=vocab.get), dtype=str), idf=self.vectorizer.idf_,
+                          data=m.data, indices=m.indices, indptr=m.indptr, shape=np.array(m.shape))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(f"{path}.tmp")
+        with open(tmp, "wb") as fh:
+            np.savez(fh, **arrays)
+        tmp.replace(path)  # atomic: readers never see half a file
+
+    @classmethod
+    def _load(cls, path: Path, signature: str) -> Optional["JokeRanker"]:
+        from scipy.sparse import csr_matrix
+        with np.load(path, allow_pickle=False) as z:
+            if str(z["signature"]) != signature:
+                return None  # stale: the library changed
+            ranker = cls.__new__(cls)
+            ranker.ids = z["ids"].tolist()
+            ranker.row_of = {i: r for r, i in enumerate(ranker.ids)}
+            ranker.style_names, ranker._style_code = z["style_names"], z["style_code"]
+            ranker.vectorizer = _vectorizer()
+            ranker._by_feature = None
+            if "data" in z.files:
+                ranker.vectorizer.vocabulary_ = {t: i for i, t in enumerate(z["terms"].tolist())}
+                ranker.vectorizer.idf_ = z["idf"]
+                ranker._by_feature = csr_matrix((z["data"], z["indices"], z["indptr"]), shape=tuple(z["shape"]))
+            ranker.signature = signature
+        return ranker
+
+    def scores(self, context: str) -> np.ndarray:
+        """Cosine similarity of every joke to `context` (rows in self.ids order)."""
+        out = np.zeros(len(self.ids), dtype=np.float32)
+        if self._by_feature is None or not context:
+            return out
+        q = self.vectorizer.transform([context])
+        if q.nnz:
+            sims = q.data @ self._by_feature[q.indices]   # (1 x nnz) @ (nnz x jokes)
+            out += np.asarray(sims).ravel()
+        return out
+
+    def rank(self, context: str, candidates: Optional[Iterable[str]] = None, k: Optional[int] = 10,
+             style_weights: Optional[Dict[str, float]] = None, recent: Optional[Set[str]] = None,
+             recency_penalty: float = 1.0) -> List[Tuple[str, float]]:
+        """
+        (id, score) best first. candidates: restrict to these ids (unknown ids are skipped).
+        Ids in `recent` lose `recency_penalty` (1.0 = below anything not recent, cosine ≤ 1).
+        """
+        sims = self.scores(context)
+        if candidates is None:
+            rows = np.arange(len(self.ids))
+        else:
+            rows = np.fromiter((r for r in map(self.row_of.get, candidates) if r is not None), dtype=np.int64)
+        if rows.size == 0:
+            return []
+        score = sims[rows]
+        if style_weights:
+            per_style = np.array([style_weights.get(s, 1.0) for s in self.style_names], dtype=np.float32)
+            score *= per_style[self._style_code[rows]]
+        if recent:
+            stale = np.zeros(len(self.ids), dtype=bool)
+            stale[[r for r in map(self.row_of.get, recent) if r is not None]] = True
+            score -= recency_penalty * stale[rows]
+        k = rows.size if k is None else min(k, rows.size)
+        if k <= 0:
+            return []
+        top = np.argpartition(-score, k - 1)[:k] if k < rows.size else np.arange(rows.size)
+        top = top[np.argsort(-score[top], kind="stable")]
+        return [(self.ids[rows[i]], float(score[i])) for i in top]
+
+def rank_candidates(cands: list[dict], context: str, ranker: Optional[JokeRanker] = None,
+                    style_weights: Optional[Dict[str, float]] = None, recent: Optional[Set[str]] = None) -> list[dict]:
+    """
+    Candidates (dicts with id/text/style) best first for `context`. With a ranker,
+    candidates it knows are scored from its precomputed matrix; otherwise a small
+    TF-IDF is fitted on the candidates themselves. Candidates are returned unchanged, reordered.
+    """
+    if len(cands) < 2 or not context:
+        return list(cands)
+    ids = [str(c.get("id", n)) for n, c in enumerate(cands)]
+    if ranker is None or any(i not in ranker.row_of for i in ids):
+        ranker = JokeRanker(ids, [c.get("text") or "" for c in cands], [c.get("style") or "" for c in cands])
+    order = {i: n for n, (i, _) in enumerate(ranker.rank(context, candidates=ids, k=None,
+                                                         style_weights=style_weights, recent=recent))}
+    return [c for _, c in sorted(zip(ids, cands), key=lambda p: order.get(p[0], len(order)))]
@@ -4,6 +4,8 @@ CLI de test pour M3
 Exemples :
   python io_utils/m3_cli.py --path standup.json --k 3 --lang fr
   python io_utils/m3_cli.py --path . --collection sitcom --q "pizza" --k 5
+  python io_utils/m3_cli.py --path . --snapshot .m3_cache.pkl --k 3
+  python io_utils/m3_cli.py --path . --mapped .m3_lib.m3map --k 0   # construit le fichier partagé
 """
 from __future__ import annotations
 import argparse
@@ -24,11 +26,14 @@ def parse_args():
     p.add_argument("--k", type=int, default=1)
     p.add_argument("--seed", type=int, default=None)
     p.add_argument("--export", default=None, help="Chemin .json pour exporter l'échantillon")
+    p.add_argument("--snapshot", default=None, help="Cache binaire (.pkl) réutilisé entre deux lancements")
+    p.add_argument("--workers", type=int, default=None, help="Nombre de processus pour le chargement d'un dossier")
+    p.add_argument("--mapped", default=None, help="Fichier colonnes mappé (mmap) partagé entre processus, reconstruit s'il est périmé")
     return p.parse_args()
 
 def main():
     a = parse_args()
-    lib = JokeLibrary.from_path(Path(a.path))
+    lib = JokeLibrary.from_path(Path(a.path), snapshot=a.snapshot, workers=a.workers, mapped=a.mapped)
     print(f"[M3/CLI] blagues chargées: {lib.size}")
 
     jokes = lib.sample(k=a.k, seed=a.seed,
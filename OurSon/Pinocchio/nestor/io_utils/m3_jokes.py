@@ -1,21 +1,35 @@
 # -*- coding: utf-8 -*-
 """
-M3 — Bibliothèque de blagues (JSON-array ou NDJSON)
+M3 — Bibliothèque de blagues (JSON-array, NDJSON ou modules d'humour concaténés)
 - Charge 1 fichier (.json / .ndjson) OU un dossier (récursif)
-- Détecte auto JSON-array vs NDJSON
-- Recherche, random, export
+- Lecture en flux : JSON-array, NDJSON et documents JSON concaténés
+- Modules d'humour (meta/module/persona/materials) → blagues + lib.modules
+- Recherche, export
+- Tirage pondéré (priorité de module × affinité de style), sans répétition par session
+- Snapshot binaire (cache) invalidé par taille/mtime de chaque fichier
+- Chargement parallèle optionnel (pool de processus, fusion déterministe)
+- Rechargement à chaud incrémental (reload/watch), publication atomique de l'état
+- Stockage en colonnes (codes internés), objets Joke recréés à la demande
+- Index compacts (tableaux triés / bitmaps), intersection du plus petit au plus grand
+- Index plein texte inversé (insensible aux accents/casse) pour text_query
+- Fichier colonnes mappé (mmap, lecture seule) partagé entre processus : workers
+  uvicorn démarrés sans parse ni index à reconstruire, pages communes en cache
 """
 
 from __future__ import annotations
-import json, random, re, sys
-from dataclasses import dataclass, field, asdict
+import hashlib, heapq, json, mmap, os, pickle, random, re, struct, sys, threading, unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, fields, asdict
 from datetime import datetime
 from pathlib import Path
-from typing import Iterable, List, Optional, Dict, Any, Tuple
+from typing import Callable, Iterable, Iterator, List, Optional, Dict, Any, Tuple, TextIO
 
 # ---------- Modèle ----------
 
-@dataclass
+@dataclass(slots=True)
 class Joke:
     id: str
     lang: str                 # "fr" | "en"
@@ -33,6 +47,7 @@ class Joke:
     updated_at: Optional[str] = None
     notes: Optional[str] = None
     collection: Optional[str] = None        # ex: "standup", "sitcom", "poemes"
+    module: Optional[str] = None            # id du module d'humour d'origine (cf. JokeLibrary.modules)
 
     def render(self) -> str:
         if self.beats and any(self.beats.get(k) for k in ("setup","turn","punchline")):
@@ -47,11 +62,114 @@ class Joke:
             out += f"  (delivery: {self.delivery})"
         return out
 
+# ---------- Stockage compact ----------
+
+_CODED = ("lang", "style", "audience", "delivery", "safety", "source", "collection", "module")
+_REST = ("beats", "attribution", "created_at", "updated_at", "notes")
+_NO_REST = (None,) * len(_REST)
+
+class _JokeStore:
+    """
+    Blagues rangées en colonnes plutôt qu'en objets :
+    - champs catégoriels → un code array('I') vers le tuple interné de leurs valeurs
+      (les combinaisons lang/style/audience/... se répètent d'une blague à l'autre)
+    - tags / personnages → un code chacun vers un tuple interné
+    - id/text → listes de str; champs rares → un tuple, ou None s'ils sont tous vides
+    store[i] recrée un Joke à la demande (None si l'emplacement a été retiré).
+    """
+
+    def __init__(self):
+        self._values: List[Any] = [()]         # code 0 = tuple vide
+        self._codes: Dict[Any, int] = {(): 0}
+        self._ids: List[str] = []
+        self._texts: List[Optional[str]] = []
+        self._profile = array("I")
+        self._tags = array("I")
+        self._characters = array("I")
+        self._rest: List[Optional[tuple]] = []
+        self._alive = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[Optional[Joke]]:
+        return map(self.__getitem__, range(len(self._ids)))
+
+    def __getitem__(self, i: int) -> Optional[Joke]:
+        if not self._alive[i]:
+            return None
+        v = self._values
+        lang, style, audience, delivery, safety, source, collection, module = v[self._profile[i]]
+        beats, attribution, created_at, updated_at, notes = self._rest[i] or _NO_REST
+        # positionnel, dans l'ordre des champs de Joke (chemin chaud de search)
+        return Joke(self._ids[i], lang, style, audience, list(v[self._tags[i]]), list(v[self._characters[i]]),
+                    dict(beats) if beats is not None else None, self._texts[i], delivery,
+                    safety, source, attribution, created_at, updated_at, notes, collection, module)
+
+    def _code(self, value: tuple) -> int:
+        try:
+            code = self._codes.get(value)
+        except TypeError:                      # valeur JSON non hachable : stockée telle quelle
+            self._values.append(value)
+            return len(self._values) - 1
+        if code is None:
+            value = tuple(sys.intern(x) if type(x) is str else x for x in value)
+            code = self._codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def append(self, j: Joke):
+        self._ids.append(j.id)
+        self._texts.append(j.text)
+        self._profile.append(self._code(tuple(getattr(j, name) for name in _CODED)))
+        self._tags.append(self._code(tuple(j.tags or ())))
+        self._characters.append(self._code(tuple(j.characters or ())))
+        rest = tuple(getattr(j, name) for name in _REST)
+        self._rest.append(rest if rest != _NO_REST else None)
+        self._alive.append(1)
+
+    def extend(self, jokes: Iterable[Joke]):
+        for j in jokes:
+            self.append(j)
+
+    def live(self, i: int) -> bool:
+        return bool(self._alive[i])
+
+    def id_of(self, i: int) -> str:
+        return self._ids[i]
+
+    def style_module(self, i: int) -> Tuple[str, Optional[str]]:
+        profile = self._values[self._profile[i]]
+        return profile[1], profile[7]
+
+    def set_coded(self, i: int, name: str, value: Any):
+        # nouveau profil interné; la table des valeurs, partagée entre copies, ne fait que croître
+        profile = list(self._values[self._profile[i]])
+        profile[_CODED.index(name)] = value
+        self._profile[i] = self._code(tuple(profile))
+
+    def retire(self, i: int):
+        # libère aussi le texte : seul l'emplacement (et ses codes) subsiste
+        self._alive[i] = 0
+        self._texts[i] = None
+        self._rest[i] = None
+
+    def copy(self) -> "_JokeStore":
+        # la table des valeurs ne fait que croître : elle est partagée entre copies
+        new = _JokeStore.__new__(_JokeStore)
+        new._values, new._codes = self._values, self._codes
+        new._ids, new._texts, new._rest = list(self._ids), list(self._texts), list(self._rest)
+        new._profile, new._tags, new._characters = array("I", self._profile), array("I", self._tags), array("I", self._characters)
+        new._alive = bytearray(self._alive)
+        return new
+
 # ---------- Validation légère ----------
 
 REQUIRED = ("id", "lang", "style", "audience")
 
 def _basic_validate(j: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+    if not isinstance(j, dict):
+        return False, "objet JSON attendu"
     for k in REQUIRED:
         if k not in j or j[k] in (None, ""):
             return False, f"champ requis manquant: {k}"
@@ -67,75 +185,171 @@ def _basic_validate(j: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
 
 # ---------- Bibliothèque ----------
 
+class _State:
+    """
+    Contenu publié d'une bibliothèque (blagues + index). Jamais modifié une fois
+    publié : reload() en construit un nouveau et remplace la référence d'un coup,
+    donc un lecteur qui a pris `lib._state` voit un état complet et cohérent.
+    """
+
+    def __init__(self):
+        self.jokes = _JokeStore()               # store[i] is None = emplacement retiré par un reload
+        self.dead = 0
+        # fichier (chemin résolu) → ((taille, mtime_ns), emplacements, ids de modules)
+        self.files: Dict[str, Tuple[Tuple[int, int], array, List[str]]] = {}
+        # id de module → métadonnées (priority, style_weights, taboos, ...)
+        self.modules: Dict[str, Dict[str, Any]] = {}
+        # clé → postings (array('I') trié si rare, _Bitmap si fréquent)
+        self.by_lang: Dict[str, Postings] = {}
+        self.by_style: Dict[str, Postings] = {}
+        self.by_audience: Dict[str, Postings] = {}
+        self.by_tag: Dict[str, Postings] = {}
+        self.by_character: Dict[str, Postings] = {}
+        self.by_safety: Dict[str, Postings] = {}
+        self.by_collection: Dict[str, Postings] = {}
+        # plein texte : mot replié → postings, + trigrammes du vocabulaire → mots
+        self.by_token: Dict[str, Postings] = {}
+        self.vocab: List[str] = []
+        self.vocab_trigrams: Dict[str, array] = {}
+        self.expand_cache: Dict[Tuple[str, bool, bool], Optional[Postings]] = {}
+        # combinaison de filtres (+ style_weights) → table de tirage cumulée
+        self.draw_cache: Dict[Any, Optional[_DrawTable]] = {}
+
 class JokeLibrary:
     def __init__(self):
-        self._jokes: List[Joke] = []
-        self._by_lang: Dict[str, List[int]] = {}
-        self._by_style: Dict[str, List[int]] = {}
-        self._by_audience: Dict[str, List[int]] = {}
-        self._by_tag: Dict[str, List[int]] = {}
-        self._by_character: Dict[str, List[int]] = {}
+        self._state = _State()
+        self._root: Optional[Path] = None
+        self._mapped: Optional[Path] = None       # fichier colonnes dont l'état est lu (cf. open_mapped)
+        self._prepare: Optional[Callable[["JokeLibrary"], Any]] = None  # cf. from_path(prepare=...)
+        self._reload_lock = threading.Lock()
+        self._watch_stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        # session → blagues racontées récemment (ids, les emplacements changent au reload)
+        self._sessions: "OrderedDict[str, _Recent]" = OrderedDict()
+        self._session_lock = threading.Lock()
 
     # -- Construction --
 
     @classmethod
-    def from_path(cls, path: Path | str) -> "JokeLibrary":
+    def from_path(cls, path: Path | str, snapshot: Path | str | None = None,
+                  workers: Optional[int] = None, mapped: Path | str | None = None,
+                  prepare: Optional[Callable[["JokeLibrary"], Any]] = None) -> "JokeLibrary":
         """
         path: fichier unique (.json/.ndjson) OU dossier (chargement récursif)
+        snapshot: fichier cache binaire (optionnel). S'il est à jour, le chargement
+                  se résume à une lecture; sinon seuls les fichiers modifiés
+                  (taille/mtime) sont re-parsés et le snapshot est réécrit.
+        workers: si > 1, parse/valide/indexe les fichiers dans un pool de processus
+                 (résultats fusionnés dans l'ordre des fichiers → ordre déterministe).
+        mapped: fichier colonnes partagé (cf. open_mapped). S'il est à jour (même
+                taille/mtime pour chaque fichier), il est simplement mappé : ni parse
+                ni index. Sinon la bibliothèque est chargée comme d'habitude, écrite
+                dans `mapped` puis rouverte depuis ce fichier. À construire avant de
+                lancer plusieurs workers, pour qu'ils ne le reconstruisent pas tous.
+        prepare: appelé sur la bibliothèque chargée en mémoire, avant l'écriture de
+                 `mapped` (ex. safety.guard_library : les verdicts calculés sont ainsi
+                 inscrits dans le fichier, lui-même en lecture seule). Non appelé si le
+                 fichier mappé est à jour; repris par reload() quand il faut le reconstruire.
         """
         lib = cls()
         p = Path(path)
         if not p.exists():
             raise FileNotFoundError(f"Chemin introuvable: {p}")
+        lib._root, lib._prepare = p, prepare
 
-        if p.is_file():
-            lib._load_file(p)
+        files = _list_files(p)
+        if mapped is not None:
+            mapped = Path(mapped)
+            st = _open_mapped(mapped, {str(f.resolve()): _file_sig(f) for f in files})
+            if st is not None:
+                lib._state, lib._mapped = st, mapped
+                return lib
+        if snapshot is not None:
+            lib._load_with_snapshot(files, Path(snapshot), workers)
+        elif workers and workers > 1:
+            sigs = [_file_sig(f) for f in files]
+            keys = [str(f.resolve()) for f in files]
+            lib._assemble(zip(keys, sigs, _parse_files(files, workers)))
         else:
-            # dossier → charge tous les .json/.ndjson récursivement
-            for f in p.rglob("*"):
-                if f.suffix.lower() in {".json", ".ndjson"}:
-                    lib._load_file(f)
+            st = lib._state
+            for f in files:
+                sig, start, known = _file_sig(f), len(st.jokes), set(st.modules)
+                lib._load_file(f)
+                st.files[str(f.resolve())] = (sig, array("I", range(start, len(st.jokes))),
+                                              [m for m in st.modules if m not in known])
+            lib._build_indexes()
+        if prepare is not None:
+            prepare(lib)
+        if mapped is not None:
+            try:
+                _write_mapped(lib._state, mapped)
+            except OSError as e:
+                _warn(f"{mapped}: écriture du fichier mappé impossible: {e}")
+                return lib
+            lib._state, lib._mapped = _mapped_state(_MappedFile(mapped)), mapped
+        return lib
+
+    # -- Fichier mappé --
 
-        lib._build_indexes()
+    @classmethod
+    def open_mapped(cls, path: Path | str) -> "JokeLibrary":
+        """
+        Ouvre un fichier écrit par save_mapped() : mmap en lecture seule, aucune copie.
+        search()/sample() lisent les postings et les textes directement dans le
+        fichier; les processus qui l'ouvrent en partagent les pages (cache système).
+        """
+        lib = cls()
+        lib._mapped = Path(path)
+        lib._state = _mapped_state(_MappedFile(lib._mapped))
         return lib
 
-    # -- Lecture de fichier --
+    def save_mapped(self, out: Path | str) -> Path:
+        """Écrit l'état publié en fichier colonnes (écriture atomique), cf. open_mapped()."""
+        out = Path(out)
+        _write_mapped(self._state, out)
+        return out
 
-    def _load_file(self, fpath: Path):
-        try:
-            text = fpath.read_text(encoding="utf-8")
-        except Exception as e:
-            _warn(f"{fpath}: lecture impossible: {e}")
+    # -- Snapshot --
+
+    def _load_with_snapshot(self, files: List[Path], snap_path: Path, workers: Optional[int]):
+        keys = [str(f.resolve()) for f in files]
+        manifest = {k: _file_sig(f) for k, f in zip(keys, files)}
+        snap = _read_snapshot(snap_path)
+        cached = snap["files"] if snap else {}
+
+        if snap and snap["manifest"] == manifest:
+            # Rien n'a bougé : jokes + index déjà compilés
+            st = self._state
+            for k in keys:
+                rows, modules, _ = cached[k][1]
+                start = len(st.jokes)
+                st.jokes.extend(Joke(*row) for row in rows)
+                st.files[k] = (manifest[k], array("I", range(start, len(st.jokes))), list(modules))
+            st.modules = snap["modules"]
+            for name, index in snap["indexes"].items():
+                setattr(st, name, index)
             return
 
-        # Déduction collection d'après le nom de fichier (standup/sitcom/poemes)
-        collection_guess = fpath.stem.lower()
+        stale = [(k, f) for k, f in zip(keys, files) if k not in cached or cached[k][0] != manifest[k]]
+        fresh = dict(zip((k for k, _ in stale), _parse_files([f for _, f in stale], workers)))
+        parts = [fresh[k] if k in fresh else _FilePart(*cached[k][1]) for k in keys]
+        self._assemble(zip(keys, (manifest[k] for k in keys), parts))
 
-        # Détection JSON-array vs NDJSON
-        first_non_ws = next((ch for ch in text.lstrip()[:1]), "")
-        if first_non_ws == "[":  # JSON-array
-            try:
-                items = json.loads(text)
-                if not isinstance(items, list):
-                    _warn(f"{fpath}: JSON non-array")
-                    return
-            except Exception as e:
-                _warn(f"{fpath}: JSON invalide ({e})")
-                return
+        _write_snapshot(snap_path, {
+            "version": SNAPSHOT_VERSION,
+            "manifest": manifest,
+            "files": {k: (manifest[k], (part.rows, part.modules, part.index)) for k, part in zip(keys, parts)},
+            "modules": self.modules,
+            "indexes": {name: getattr(self._state, name) for name in _INDEX_ATTRS},
+        })
 
-            for idx, raw in enumerate(items, start=1):
-                self._ingest_obj(raw, f"{fpath}[{idx}]", collection_guess)
+    # -- Lecture de fichier --
 
-        else:  # NDJSON
-            for line_no, line in enumerate(text.splitlines(), start=1):
-                if not line.strip():
-                    continue
-                try:
-                    raw = json.loads(line)
-                except Exception as e:
-                    _warn(f"{fpath}:{line_no} JSON invalide: {e}")
-                    continue
-                self._ingest_obj(raw, f"{fpath}:{line_no}", collection_guess)
+    def _load_file(self, fpath: Path):
+        # Déduction collection d'après le nom de fichier (standup/sitcom/poemes)
+        collection_guess = fpath.stem.lower()
+        for raw, origin in iter_raw_jokes(fpath, self._state.modules):
+            self._ingest_obj(raw, origin, collection_guess)
 
     def _ingest_obj(self, raw: Dict[str, Any], origin: str, collection_guess: str):
         ok, err = _basic_validate(raw)
@@ -143,26 +357,154 @@ class JokeLibrary:
             _warn(f"{origin} invalide: {err}")
             return
         raw.setdefault("collection", raw.get("collection") or collection_guess)
-        self._jokes.append(Joke(**raw))
+        self._state.jokes.append(Joke(**raw))
+
+    # -- Index --
+
+    def _assemble(self, entries: Iterable[Tuple[str, Tuple[int, int], "_FilePart"]]):
+        """Concatène des résultats par fichier et fusionne leurs index partiels (ids décalés)."""
+        st = self._state
+        merged: Dict[str, Dict[str, List[int]]] = {name: {} for name in _RAW_INDEXES}
+        for key, sig, part in entries:
+            base = len(st.jokes)
+            st.jokes.extend(Joke(*row) for row in part.rows)
+            st.files[key] = (sig, array("I", range(base, len(st.jokes))), list(part.modules))
+            st.modules.update(part.modules)
+            for name, index in part.index.items():
+                target = merged[name]
+                for k, ids in index.items():
+                    shifted = [i + base for i in ids] if base else list(ids)
+                    if k in target:
+                        target[k].extend(shifted)
+                    else:
+                        target[k] = shifted
+        _freeze_state(st, merged)
 
     def _build_indexes(self):
-        for idx, j in enumerate(self._jokes):
-            self._by_lang.setdefault(j.lang, []).append(idx)
-            self._by_style.setdefault(j.style, []).append(idx)
-            self._by_audience.setdefault(j.audience, []).append(idx)
-            for t in (j.tags or []):
-                self._by_tag.setdefault(t.lower(), []).append(idx)
-            for c in (j.characters or []):
-                self._by_character.setdefault(c.lower(), []).append(idx)
+        _freeze_state(self._state, _index_jokes(self._state.jokes))
+
+    # -- Rechargement à chaud --
+
+    def reload(self) -> Dict[str, int]:
+        """
+        Re-scanne le chemin d'origine : seuls les fichiers ajoutés/modifiés/supprimés
+        sont relus, leurs blagues retirées des index puis réinsérées. Le nouvel état
+        est publié d'un bloc : search()/sample() concurrents voient l'ancien ou le
+        nouveau contenu, jamais un index à moitié construit.
+        """
+        if self._root is None:
+            raise RuntimeError("reload() nécessite une bibliothèque créée par from_path()")
+        if self._mapped is not None:
+            return self._reload_mapped()
+        with self._reload_lock:
+            st = self._state
+            files = _list_files(self._root) if self._root.exists() else []
+            current = {str(f.resolve()): (f, _file_sig(f)) for f in files}
+            removed = [k for k in st.files if k not in current]
+            changed = [k for k, (_, sig) in current.items() if k in st.files and st.files[k][0] != sig]
+            added = [k for k in current if k not in st.files]
+            if removed or changed or added:
+                inserts = [(k, current[k][1], _parse_file(current[k][0])) for k in changed + added]
+                new = _apply_changes(st, removed + changed, inserts)
+                if new.dead * 4 > len(new.jokes):
+                    new = _compact(new)
+                self._state = new
+            return {"added": len(added), "changed": len(changed), "removed": len(removed)}
+
+    def _reload_mapped(self) -> Dict[str, int]:
+        # le fichier mappé ne se modifie pas en place : on le rouvre (un autre processus
+        # l'a peut-être déjà reconstruit) ou on le reconstruit entièrement
+        with self._reload_lock:
+            old = self._state.files
+            files = _list_files(self._root) if self._root.exists() else []
+            current = {str(f.resolve()): _file_sig(f) for f in files}
+            counts = {"added": sum(k not in old for k in current),
+                      "changed": sum(k in old and old[k][0] != sig for k, sig in current.items()),
+                      "removed": sum(k not in current for k in old)}
+            if any(counts.values()):
+                self._state = JokeLibrary.from_path(self._root, mapped=self._mapped, prepare=self._prepare)._state
+            return counts
+
+    def annotate_safety(self, verdicts: Dict[str, str]) -> int:
+        """
+        Complète Joke.safety des blagues qui n'en déclarent pas avec des verdicts calculés
+        (id → "safe" | "borderline" | "risky", cf. humor.safety.guard_library), puis
+        reconstruit by_safety; le nouvel état est publié d'un bloc, comme par reload().
+        Une bibliothèque mappée est en lecture seule : ses verdicts s'inscrivent à
+        l'écriture du fichier, cf. from_path(prepare=...).
+        Renvoie le nombre de blagues annotées.
+        """
+        with self._reload_lock:
+            st = self._state
+            missing: List[Tuple[int, str]] = []
+            for i in range(len(st.jokes)):
+                j = st.jokes[i]
+                if j is not None and not j.safety and verdicts.get(j.id):
+                    missing.append((i, verdicts[j.id]))
+            if not missing:
+                return 0
+            if isinstance(st.jokes, _MappedStore):
+                _warn(f"annotate_safety(): {len(missing)} verdicts ignorés, bibliothèque mappée en lecture seule "
+                      "(les calculer avant l'écriture : from_path(prepare=...))")
+                return 0
+            jokes = st.jokes.copy()
+            by_safety = {k: list(_posting_ids(p)) for k, p in st.by_safety.items()}
+            for i, safety in missing:
+                jokes.set_coded(i, "safety", safety)
+                by_safety.setdefault(safety, []).append(i)
+            new = _State()
+            new.__dict__.update(st.__dict__)
+            new.jokes = jokes
+            new.by_safety = _freeze_index({k: sorted(ids) for k, ids in by_safety.items()}, len(jokes))
+            new.expand_cache, new.draw_cache = {}, {}
+            self._state = new
+            return len(missing)
+
+    def watch(self, interval: float = 2.0):
+        """Appelle reload() toutes les `interval` secondes dans un thread démon."""
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._watch_stop.clear()
+
+        def loop():
+            while not self._watch_stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    _warn(f"reload impossible: {e}")
+
+        self._watcher = threading.Thread(target=loop, name="m3-watch", daemon=True)
+        self._watcher.start()
+
+    def unwatch(self):
+        self._watch_stop.set()
+        if self._watcher:
+            self._watcher.join()
+            self._watcher = None
 
     # -- Accès --
 
     @property
     def size(self) -> int:
-        return len(self._jokes)
+        st = self._state
+        return len(st.jokes) - st.dead
+
+    @property
+    def modules(self) -> Dict[str, Dict[str, Any]]:
+        return self._state.modules
+
+    @property
+    def fingerprint(self) -> str:
+        """Empreinte de l'état publié (fichiers + taille/mtime, slots) : change à chaque reload effectif."""
+        st = self._state
+        if st.files:
+            key = repr((sorted((k, v[0]) for k, v in st.files.items()), len(st.jokes), st.dead))
+        else:  # bibliothèque construite en mémoire : empreinte des ids
+            key = "\n".join(st.jokes.id_of(i) for i in range(len(st.jokes)) if st.jokes.live(i))
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
 
     def all(self) -> List[Joke]:
-        return list(self._jokes)
+        return [j for j in self._state.jokes if j is not None]
 
     # -- Recherche --
 
@@ -176,62 +518,60 @@ class JokeLibrary:
                safety: Optional[str] = None,
                collection: Optional[str] = None,
                limit: Optional[int] = None) -> List[Joke]:
-        candidates = set(range(self.size))
-        def narrow(index_map: Dict[str, List[int]], key: Optional[str]):
-            nonlocal candidates
-            if key:
-                candidates &= set(index_map.get(key, []))
-
-        narrow(self._by_lang, lang)
-        narrow(self._by_style, style)
-        narrow(self._by_audience, audience)
-
-        if include_tags:
-            for tag in include_tags:
-                candidates &= set(self._by_tag.get(str(tag).lower().strip(), []))
-
-        if include_characters:
-            for ch in include_characters:
-                candidates &= set(self._by_character.get(str(ch).lower().strip(), []))
-
-        out: List[Joke] = []
-        pattern = re.compile(re.escape(text_query), re.IGNORECASE) if text_query else None
-        for i in candidates:
-            j = self._jokes[i]
-            if safety and j.safety != safety:
-                continue
-            if collection and (j.collection or "").lower() != collection.lower():
-                continue
-            if pattern:
-                pool = [
-                    j.text or "",
-                    *(j.tags or []),
-                    *(j.characters or []),
-                    *( [j.beats.get("setup",""), j.beats.get("turn",""), j.beats.get("punchline","")] if j.beats else [] )
-                ]
-                if not any(pattern.search(x or "") for x in pool):
-                    continue
-            out.append(j)
-        if limit is not None:
-            out = out[:max(0, int(limit))]
-        return out
+        st = self._state  # un seul état pour toute la requête (cf. reload)
+        return [st.jokes[i] for i in _match(st, lang, style, audience, include_tags, include_characters,
+                                            text_query, safety, collection, limit)]
 
     # -- Sélection --
 
-    def random(self, seed: Optional[int] = None, **kwargs) -> Optional[Joke]:
-        items = self.search(**kwargs)
-        if not items:
-            return None
-        rng = random.Random(seed)
-        return rng.choice(items)
+    RECENT_PER_SESSION = 64   # blagues récentes évitées par session
+    MAX_SESSIONS = 4096       # sessions suivies (les moins récemment actives sont oubliées)
+
+    def random(self, seed: Optional[int] = None, session: Optional[str] = None,
+               style_weights: Optional[Dict[str, float]] = None, **kwargs) -> Optional[Joke]:
+        picked = self.sample(1, seed=seed, session=session, style_weights=style_weights, **kwargs)
+        return picked[0] if picked else None
 
-    def sample(self, k: int, seed: Optional[int] = None, **kwargs) -> List[Joke]:
-        items = self.search(**kwargs)
-        if not items:
+    def sample(self, k: int, seed: Optional[int] = None, session: Optional[str] = None,
+               style_weights: Optional[Dict[str, float]] = None, **kwargs) -> List[Joke]:
+        """
+        Tirage pondéré sans remise parmi les blagues filtrées (kwargs = filtres de search).
+        Poids = priorité du module × affinité de style; style_weights est indexé par
+        style de blague ("standup", ...) ou par axe des modules ("wordplay", "absurde", ...).
+        Avec `session`, les blagues déjà racontées à cette session sont évitées tant
+        qu'il en reste d'autres, puis le tirage est ajouté à son historique.
+        """
+        st = self._state
+        table = _draw_table(st, kwargs, style_weights)
+        if table is None or k <= 0:
             return []
-        k = max(0, min(k, len(items)))
-        rng = random.Random(seed)
-        return rng.sample(items, k)
+        avoid = self._recent(session).ids if session is not None else frozenset()
+        slots = _draw(table, st.jokes, k, random.Random(seed), avoid)
+        jokes = [st.jokes[i] for i in slots]
+        if session is not None:
+            self._remember(session, [j.id for j in jokes])
+        return jokes
+
+    def forget(self, session: str):
+        with self._session_lock:
+            self._sessions.pop(session, None)
+
+    def _recent(self, session: str) -> "_Recent":
+        with self._session_lock:
+            recent = self._sessions.get(session)
+            if recent is None:
+                recent = self._sessions[session] = _Recent(self.RECENT_PER_SESSION)
+                while len(self._sessions) > self.MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session)
+            return recent
+
+    def _remember(self, session: str, ids: List[str]):
+        recent = self._recent(session)
+        with self._session_lock:
+            for joke_id in ids:
+                recent.add(joke_id)
 
     # -- Export --
 
@@ -241,7 +581,1126 @@ class JokeLibrary:
         data = [asdict(j) for j in jokes]
         out_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
+# ---------- Recherche : emplacements correspondants ----------
+
+def _match(st: _State,
+           lang: Optional[str] = None,
+           style: Optional[str] = None,
+           audience: Optional[str] = None,
+           include_tags: Optional[Iterable[str]] = None,
+           include_characters: Optional[Iterable[str]] = None,
+           text_query: Optional[str] = None,
+           safety: Optional[str] = None,
+           collection: Optional[str] = None,
+           limit: Optional[int] = None) -> List[int]:
+    if limit is not None:
+        limit = max(0, int(limit))  # peut venir d'une query string
+        if not limit:
+            return []
+    wanted: List[Tuple[Dict[str, Postings], str]] = []
+    if lang:
+        wanted.append((st.by_lang, lang))
+    if style:
+        wanted.append((st.by_style, style))
+    if audience:
+        wanted.append((st.by_audience, audience))
+    for tag in (include_tags or ()):
+        wanted.append((st.by_tag, str(tag).lower().strip()))
+    for ch in (include_characters or ()):
+        wanted.append((st.by_character, str(ch).lower().strip()))
+    if safety:
+        wanted.append((st.by_safety, safety))
+    if collection:
+        wanted.append((st.by_collection, collection.lower()))
+
+    postings: List[Postings] = []
+    for index_map, key in wanted:
+        p = index_map.get(key)
+        if p is None:
+            return []  # clé inconnue → aucun résultat, inutile d'aller plus loin
+        postings.append(p)
+
+    folded_query = fold(text_query) if text_query else None
+    if folded_query:
+        for p in _text_postings(st, folded_query):
+            if p is None:
+                return []
+            postings.append(p)
+    candidates = _intersect(postings, len(st.jokes))
+
+    jokes = st.jokes
+    out: List[int] = []
+    for i in candidates:
+        if not jokes.live(i):
+            continue
+        if folded_query:
+            # vérification des survivants : sous-chaîne sur chaque champ replié
+            if not any(folded_query in fold(x) for x in _text_pool(jokes[i])):
+                continue
+        out.append(i)
+        if limit is not None and len(out) >= limit:
+            break
+    return out
+
+# ---------- Plein texte : postings d'une requête ----------
+
+def _text_postings(st: _State, folded_query: str) -> List[Optional[Postings]]:
+    """
+    Postings nécessaires (non suffisants) pour que folded_query soit une
+    sous-chaîne d'un champ. None = aucun document possible.
+    Un mot intérieur doit exister tel quel; un mot en bordure de requête peut
+    être le suffixe (gauche), le préfixe (droite) ou un fragment d'un mot indexé.
+    """
+    out: List[Optional[Postings]] = []
+    for m in _TOKEN.finditer(folded_query):
+        tok = m.group()
+        open_left, open_right = m.start() == 0, m.end() == len(folded_query)
+        if not open_left and not open_right:
+            out.append(st.by_token.get(tok))
+        elif len(tok) >= 3:
+            out.append(_expand(st, tok, open_left, open_right))
+        # fragment < 3 caractères en bordure : pas de filtrage, la vérification suffit
+    return out
+
+_MISS = object()  # absent des caches (None y est une valeur)
+
+def _expand(st: _State, tok: str, open_left: bool, open_right: bool) -> Optional[Postings]:
+    key = (tok, open_left, open_right)
+    hit = st.expand_cache.get(key, _MISS)  # lecture unique : un autre lecteur peut vider le cache
+    if hit is not _MISS:
+        return hit
+    vocab_ids = _intersect([st.vocab_trigrams.get(tri, _NO_IDS) for tri in set(_trigrams(tok))],
+                           len(st.vocab))
+    matches = []
+    for w_idx in vocab_ids:
+        word = st.vocab[w_idx]
+        if open_left and open_right:
+            ok = tok in word
+        elif open_left:
+            ok = word.endswith(tok)
+        else:
+            ok = word.startswith(tok)
+        p = st.by_token.get(word) if ok else None  # mot sans postings après un reload
+        if p is not None:
+            matches.append(p)
+    result = _union(matches, len(st.jokes)) if matches else None
+    if len(st.expand_cache) >= 1024:
+        st.expand_cache.clear()
+    st.expand_cache[key] = result
+    return result
+
+# ---------- Tirage pondéré ----------
+
+DEFAULT_PRIORITY = 50   # priorité d'un module qui n'en déclare pas (→ poids 1)
+
+class _DrawTable:
+    """Emplacements candidats + poids cumulés : un tirage = une bissection, O(log n)."""
+    __slots__ = ("slots", "weights", "cum", "total")
+
+    def __init__(self, slots: List[int], weights: List[float]):
+        self.slots = array("I", slots)
+        self.weights = array("d", weights)
+        self.cum = array("d")
+        total = 0.0
+        for w in weights:
+            total += w
+            self.cum.append(total)
+        self.total = total
+
+class _Recent:
+    """Historique borné d'une session : deque pour l'ordre, set pour le test d'appartenance."""
+    __slots__ = ("order", "ids")
+
+    def __init__(self, size: int):
+        self.order: deque = deque(maxlen=size)
+        self.ids: set = set()
+
+    def add(self, joke_id: str):
+        if joke_id in self.ids:
+            self.order.remove(joke_id)
+        elif len(self.order) == self.order.maxlen:
+            self.ids.discard(self.order[0])
+        self.order.append(joke_id)
+        self.ids.add(joke_id)
+
+def _joke_weight(style: str, module: Optional[str], modules: Dict[str, Dict[str, Any]],
+                 style_weights: Optional[Dict[str, float]]) -> float:
+    info = modules.get(module) if module else None
+    weight = 1.0
+    if info:
+        if info.get("active") is False:
+            return 0.0
+        priority = info.get("priority")
+        if isinstance(priority, (int, float)):
+            weight = max(0.0, priority / DEFAULT_PRIORITY)
+    if style_weights:
+        if style in style_weights:
+            weight *= style_weights[style]
+        elif info and info.get("style_weights"):
+            mix = info["style_weights"]
+            if any(axis in style_weights for axis in mix):
+                weight *= sum(float(share) * style_weights.get(axis, 0.0) for axis, share in mix.items())
+    return max(0.0, weight)
+
+def _draw_key(filters: Dict[str, Any], style_weights: Optional[Dict[str, float]]) -> Any:
+    def norm(v):
+        return tuple(sorted(str(x).lower().strip() for x in v)) if isinstance(v, (list, tuple, set)) else v
+    return (tuple(sorted((k, norm(v)) for k, v in filters.items() if v)),
+            tuple(sorted((style_weights or {}).items())))
+
+def _draw_table(st: _State, filters: Dict[str, Any], style_weights: Optional[Dict[str, float]]) -> Optional[_DrawTable]:
+    key = _draw_key(filters, style_weights)
+    hit = st.draw_cache.get(key, _MISS)  # cf. _expand : le cache peut être vidé entre-temps
+    if hit is not _MISS:
+        return hit
+    slots, weights = [], []
+    memo: Dict[Tuple[str, Optional[str]], float] = {}
+    for i in _match(st, **filters):
+        style, module = st.jokes.style_module(i)
+        w = memo.get((style, module))
+        if w is None:
+            w = memo[style, module] = _joke_weight(style, module, st.modules, style_weights)
+        if w > 0:
+            slots.append(i)
+            weights.append(w)
+    table = _DrawTable(slots, weights) if slots else None
+    if len(st.draw_cache) >= 256:
+        st.draw_cache.clear()
+    st.draw_cache[key] = table
+    return table
+
+def _draw(table: _DrawTable, jokes: "_JokeStore", k: int, rng: random.Random, avoid: set) -> List[int]:
+    """
+    k emplacements distincts, pondérés, en évitant les ids de `avoid`. Tirage par rejet
+    (bissection sur les poids cumulés); si le rejet s'éternise (candidats presque tous
+    déjà pris/évités), on termine par un tirage pondéré exhaustif sur le reste.
+    """
+    n = len(table.slots)
+    k = min(k, n)
+    chosen: List[int] = []
+    seen: set = set()
+    attempts = 0
+    while len(chosen) < k and attempts < 4 * k + 16:
+        attempts += 1
+        pos = min(bisect_right(table.cum, rng.random() * table.total), n - 1)
+        if pos in seen:
+            continue
+        seen.add(pos)
+        if jokes.id_of(table.slots[pos]) not in avoid:
+            chosen.append(pos)
+    if len(chosen) < k:
+        # Efraimidis-Spirakis : clé u^(1/w), on garde les plus grandes; évitées en dernier recours
+        taken = set(chosen)
+        rest = [p for p in range(n) if p not in taken]
+        fresh = [p for p in rest if jokes.id_of(table.slots[p]) not in avoid]
+        stale = [p for p in rest if jokes.id_of(table.slots[p]) in avoid]
+        for pool in (fresh, stale):
+            need = k - len(chosen)
+            if need <= 0:
+                break
+            w = table.weights
+            chosen.extend(heapq.nlargest(need, pool, key=lambda p: rng.random() ** (1.0 / w[p])))
+    return [table.slots[p] for p in chosen]
+
+# ---------- Rechargement incrémental ----------
+
+def _freeze_state(st: _State, raw: Dict[str, Dict[str, List[int]]]):
+    n = len(st.jokes)
+    for name in _RAW_INDEXES:
+        setattr(st, name, _freeze_index(raw[name], n))
+    st.vocab = sorted(raw["by_token"])
+    vocab_trigrams: Dict[str, List[int]] = {}
+    for w_idx, word in enumerate(st.vocab):
+        for tri in _trigrams(word):
+            vocab_trigrams.setdefault(tri, []).append(w_idx)
+    st.vocab_trigrams = {tri: array("I", ids) for tri, ids in vocab_trigrams.items()}
+    st.expand_cache = {}
+
+def _apply_changes(st: _State, retract: List[str],
+                   inserts: List[Tuple[str, Tuple[int, int], "_FilePart"]]) -> _State:
+    """
+    Nouvel état = st moins les blagues des fichiers `retract` (emplacements retirés)
+    plus celles de `inserts` (ajoutées en fin). Seules les clés d'index touchées sont
+    reconstruites; les autres postings sont partagés avec st (copie sur écriture).
+    """
+    new = _State()
+    new.jokes = st.jokes.copy()
+    new.files = dict(st.files)
+    new.modules = dict(st.modules)
+
+    old_slots: List[int] = []
+    old_jokes: List[Joke] = []
+    for key in retract:
+        _, slots, module_ids = new.files.pop(key)
+        for slot in slots:
+            old_slots.append(slot)
+            old_jokes.append(new.jokes[slot])
+            new.jokes.retire(slot)
+        for m in module_ids:
+            new.modules.pop(m, None)
+    new.dead = st.dead + len(old_slots)
+
+    new_slots: List[int] = []
+    new_jokes: List[Joke] = []
+    for key, sig, part in inserts:
+        start = len(new.jokes)
+        jokes = [Joke(*row) for row in part.rows]
+        new.jokes.extend(jokes)
+        new.files[key] = (sig, array("I", range(start, len(new.jokes))), list(part.modules))
+        new.modules.update(part.modules)
+        new_slots.extend(range(start, len(new.jokes)))
+        new_jokes.extend(jokes)
+
+    n = len(new.jokes)
+    retracted = _index_jokes(old_jokes, old_slots)
+    inserted = _index_jokes(new_jokes, new_slots)
+    for name in _RAW_INDEXES:
+        index = dict(getattr(st, name))
+        rem, add = retracted[name], inserted[name]
+        for key in rem.keys() | add.keys():
+            ids = set(_posting_ids(index[key])) if key in index else set()
+            ids.difference_update(rem.get(key, ()))
+            ids.update(add.get(key, ()))
+            if ids:
+                index[key] = _freeze(sorted(ids), n)
+            else:
+                index.pop(key, None)
+        setattr(new, name, index)
+
+    # vocabulaire : nouveaux mots ajoutés en fin; les mots disparus restent sans postings
+    new.vocab = list(st.vocab)
+    new.vocab_trigrams = dict(st.vocab_trigrams)
+    known = set(st.vocab)
+    for word in inserted["by_token"]:
+        if word in known:
+            continue
+        w_idx = len(new.vocab)
+        new.vocab.append(word)
+        for tri in set(_trigrams(word)):
+            ids = array("I", new.vocab_trigrams.get(tri, _NO_IDS))
+            ids.append(w_idx)
+            new.vocab_trigrams[tri] = ids
+    return new
+
+def _compact(st: _State) -> _State:
+    """Reconstruit un état sans emplacements morts (fichiers dans l'ordre de chargement)."""
+    new = _State()
+    for key in sorted(st.files):
+        sig, slots, module_ids = st.files[key]
+        start = len(new.jokes)
+        new.jokes.extend(st.jokes[slot] for slot in slots)
+        new.files[key] = (sig, array("I", range(start, len(new.jokes))), module_ids)
+    new.modules = dict(st.modules)
+    _freeze_state(new, _index_jokes(new.jokes))
+    return new
+
+# ---------- Lecture en flux ----------
+
+_CHUNK = 1 << 16
+_TAIL = 64                                # erreur dans les 64 derniers caractères lus = document tronqué
+_WS = re.compile(r"\s*")
+_RESYNC = re.compile(r"\n(?=[\[{])")     # prochain document : ligne qui commence par { ou [
+
+class _DocStream:
+    """
+    Itère (document, origine) sur un fichier texte sans le lire en entier :
+    JSON-array (un élément à la fois), NDJSON et documents JSON concaténés.
+    Le tampon ne contient que le document en cours; en cas d'erreur de syntaxe,
+    on avertit et on se resynchronise sur la prochaine ligne '{' / '['.
+    `count` : rang du dernier document rencontré dans le fichier, invalides compris.
+    """
+
+    def __init__(self, fh: TextIO, name: str):
+        self.fh = fh
+        self.name = name
+        self.count = 0
+        self.buf = ""
+        self.pos = 0
+        self.line = 1
+        self.eof = False
+        self._dec = json.JSONDecoder()
+
+    def __iter__(self) -> Iterator[Tuple[Any, str]]:
+        while True:
+            self._skip_ws()
+            if self.pos >= len(self.buf):
+                return
+            if self.buf[self.pos] == "[":
+                yield from self._array()
+                continue
+            start_line = self.line
+            self.count += 1
+            try:
+                doc = self._decode()
+            except json.JSONDecodeError as e:
+                _warn(f"{self.name}:{self._line_at(e.pos)} JSON invalide: {e.msg}")
+                self._resync()
+                continue
+            yield doc, f"{self.name}:{start_line}"
+
+    def _array(self) -> Iterator[Tuple[Any, str]]:
+        self._advance(self.pos + 1)  # '['
+        idx = 0
+        while True:
+            self._skip_ws()
+            if self.pos >= len(self.buf):
+                _warn(f"{self.name}: JSON-array non terminé")
+                return
+            ch = self.buf[self.pos]
+            if ch == "]":
+                self._advance(self.pos + 1)
+                return
+            if ch == ",":
+                self._advance(self.pos + 1)
+                continue
+            idx += 1
+            self.count += 1
+            try:
+                item = self._decode()
+            except json.JSONDecodeError as e:
+                _warn(f"{self.name}[{idx}] JSON invalide ({e.msg}), fin du tableau ignorée")
+                self._resync()
+                return
+            yield item, f"{self.name}[{idx}]"
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        rest = self.buf[self.pos:]
+        data = self.fh.read(max(_CHUNK, len(rest)))  # croissance géométrique pour les gros documents
+        if not data:
+            self.eof = True
+            return False
+        self.buf, self.pos = rest + data, 0
+        return True
+
+    def _advance(self, new_pos: int):
+        self.line += self.buf.count("\n", self.pos, new_pos)
+        self.pos = new_pos
+
+    def _line_at(self, pos: int) -> int:
+        return self.line + self.buf.count("\n", self.pos, pos)
+
+    def _skip_ws(self):
+        while True:
+            self._advance(_WS.match(self.buf, self.pos).end())
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def _decode(self) -> Any:
+        while True:
+            try:
+                obj, end = self._dec.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                truncated = e.pos >= len(self.buf) - _TAIL or e.msg.startswith("Unterminated string")
+                if truncated and self._fill():
+                    continue
+                raise
+            if end >= len(self.buf) and not isinstance(obj, (dict, list, str)) and self._fill():
+                continue  # nombre peut-être coupé en fin de tampon
+            self._advance(end)
+            return obj
+
+    def _resync(self):
+        start = self.pos + 1  # au moins un caractère consommé
+        while True:
+            m = _RESYNC.search(self.buf, start)
+            if m:
+                self._advance(m.end())
+                return
+            # on garde le dernier caractère : il peut être le '\n' du motif
+            self._advance(max(self.pos, len(self.buf) - 1))
+            if not self._fill():
+                self._advance(len(self.buf))
+                return
+            start = self.pos
+
+def iter_documents(fpath: Path | str) -> Iterator[Tuple[Any, str]]:
+    """(document JSON, origine) d'un fichier, en flux. Erreurs de lecture → avertissement."""
+    for _, doc, origin in _numbered_documents(fpath):
+        yield doc, origin
+
+def _numbered_documents(fpath: Path | str) -> Iterator[Tuple[int, Any, str]]:
+    # rang = position dans le fichier : réparer un document invalide ne renumérote pas les suivants
+    fpath = Path(fpath)
+    try:
+        with fpath.open("r", encoding="utf-8") as fh:
+            stream = _DocStream(fh, str(fpath))
+            for doc, origin in stream:
+                yield stream.count, doc, origin
+    except (OSError, UnicodeDecodeError) as e:
+        _warn(f"{fpath}: lecture impossible: {e}")
+
+# ---------- Modules d'humour → blagues ----------
+
+_MATERIAL_KEYS = ("seed_jokes", "seed_poems", "seed_scenes", "scenes")
+_NON_ENTRY_KEYS = {"characters", "hard_limits", "soft_limits"}
+_TEXT_KEYS = ("text", "texte", "content", "poem", "scene")
+_LINE_KEYS = ("lines", "dialogue", "key_lines", "scene")
+_EDGINESS = {"G": "all-ages", "PG": "PG-13", "PG-13": "PG-13", "PG-16": "18+", "16+": "18+", "R": "18+", "18+": "18+"}
+_SPEAKER = re.compile(r"\s*([A-ZÀ-Ý][\w'-]*(?: [A-ZÀ-Ý][\w'-]*)?)\s*(?:\([^)]*\)\s*)?:")
+DEFAULT_LANG = "fr"  # le corpus livré est en fr-CA
+
+def _entry_sections(doc: Dict[str, Any]) -> List[Tuple[str, list]]:
+    # materials.seed_* (listes de textes ou d'objets) + toute liste d'objets au premier niveau
+    materials = doc.get("materials") if isinstance(doc.get("materials"), dict) else {}
+    sections = [(k, materials[k]) for k in _MATERIAL_KEYS if isinstance(materials.get(k), list)]
+    sections += [(k, v) for k, v in doc.items()
+                 if k not in _NON_ENTRY_KEYS and isinstance(v, list) and v and all(isinstance(x, dict) for x in v)]
+    return sections
+
+def _is_module(doc: Any) -> bool:
+    return isinstance(doc, dict) and ("materials" in doc or bool(_entry_sections(doc)))
+
+def _module_info(doc: Dict[str, Any], module_id: str) -> Dict[str, Any]:
+    meta = doc.get("meta") or {}
+    module = doc.get("module") or {}
+    persona = doc.get("persona") or {}
+    return {
+        "id": module_id,
+        "name": meta.get("name") or doc.get("theme") or doc.get("type"),
+        "language": meta.get("language"),
+        "priority": module.get("priority"),
+        "active": module.get("active", True),
+        "edginess": persona.get("edginess"),
+        "style_weights": doc.get("style_weights") or {},
+        "taboos": doc.get("taboos") or {},
+    }
+
+def _module_audience(doc: Dict[str, Any], item: Any) -> str:
+    edginess = (doc.get("persona") or {}).get("edginess")
+    if edginess in _EDGINESS:
+        return _EDGINESS[edginess]
+    labels = [doc.get(k) for k in ("chakra", "type", "theme", "style")]
+    if isinstance(item, dict):
+        labels.append(item.get("categorie"))
+    folded = fold(" ".join(x for x in labels if isinstance(x, str)))
+    if "grivois" in folded:
+        return "18+"
+    if "enfantin" in folded:
+        return "all-ages"
+    return "PG-13"
+
+def _entry_text(item: Any) -> Tuple[Optional[str], bool]:
+    """(texte, est_un_dialogue) d'une entrée de module."""
+    if isinstance(item, str):
+        return item, False
+    if not isinstance(item, dict):
+        return None, False
+    for k in _TEXT_KEYS:
+        if isinstance(item.get(k), str) and item[k].strip():
+            return item[k], k == "scene"
+    for k in _LINE_KEYS:
+        lines = item.get(k)
+        if isinstance(lines, list) and lines:
+            body = "\n".join(str(x) for x in lines)
+            return (f"{item['premise']}\n{body}" if item.get("premise") else body), True
+    return item.get("premise"), False
+
+def _speakers(text: str) -> List[str]:
+    names: List[str] = []
+    for line in text.splitlines():
+        m = _SPEAKER.match(line)
+        if m and m.group(1) not in names:
+            names.append(m.group(1))
+    return names
+
+def _module_jokes(doc: Dict[str, Any], info: Dict[str, Any], collection_guess: str) -> Iterator[Tuple[Dict[str, Any], str]]:
+    meta = doc.get("meta") or {}
+    lang = (info["language"] or DEFAULT_LANG).split("-")[0].lower()
+    tag = doc.get("chakra") or info["id"].rsplit("/", 1)[-1]
+    for section, items in _entry_sections(doc):
+        for pos, item in enumerate(items, start=1):
+            text, dialogue = _entry_text(item)
+            fields_ = item if isinstance(item, dict) else {}
+            item_id = fields_.get("id", pos)
+            raw: Dict[str, Any] = {
+                "id": f"{info['id']}/{section}/{item_id}",
+                "lang": lang,
+                "style": collection_guess,
+                "audience": _module_audience(doc, item),
+                "tags": [t for t in (tag, fields_.get("categorie")) if t],
+                "characters": _speakers(text) if text and dialogue else [],
+                "text": text,
+                "source": "original",
+                "attribution": ", ".join(meta.get("authors") or []) or None,
+                "created_at": meta.get("created"),
+                "notes": fields_.get("title") or fields_.get("titre"),
+                "collection": collection_guess,
+                "module": info["id"],
+            }
+            yield raw, f"{info['id']}/{section}[{pos}]"
+
+def iter_raw_jokes(fpath: Path | str, modules: Optional[Dict[str, Dict[str, Any]]] = None) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """
+    (blague brute, origine) pour chaque entrée d'un fichier : objets blague tels quels,
+    ou entrées extraites des modules d'humour (materials.seed_*, jokes, blagues, ...).
+    Les métadonnées de module sont ajoutées à `modules` si fourni. Non validé.
+    """
+    fpath = Path(fpath)
+    collection_guess = fpath.stem.lower()
+    for doc_no, doc, origin in _numbered_documents(fpath):
+        if not _is_module(doc):
+            yield doc, origin
+            continue
+        module_id = (doc.get("module") or {}).get("id") or f"{collection_guess}#{doc_no}"
+        info = _module_info(doc, module_id)
+        if modules is not None:
+            modules[module_id] = info
+        if info["active"] is False:
+            continue
+        for raw, entry in _module_jokes(doc, info, collection_guess):
+            yield raw, f"{origin} {entry}"
+
+# ---------- Index partiels / chargement parallèle ----------
+
+_RAW_INDEXES = ("by_lang", "by_style", "by_audience", "by_tag", "by_character",
+                "by_safety", "by_collection", "by_token")
+
+@dataclass
+class _FilePart:
+    """Résultat compact d'un fichier : lignes Joke, modules, index partiels (ids locaux)."""
+    rows: List[tuple]
+    modules: Dict[str, Dict[str, Any]]
+    index: Dict[str, Dict[str, array]]
+    warnings: List[str] = field(default_factory=list)
+
+def _index_jokes(jokes: List[Optional[Joke]], slots: Optional[List[int]] = None) -> Dict[str, Dict[str, List[int]]]:
+    by_lang: Dict[str, List[int]] = {}
+    by_style: Dict[str, List[int]] = {}
+    by_audience: Dict[str, List[int]] = {}
+    by_tag: Dict[str, List[int]] = {}
+    by_character: Dict[str, List[int]] = {}
+    by_safety: Dict[str, List[int]] = {}
+    by_collection: Dict[str, List[int]] = {}
+    by_token: Dict[str, List[int]] = {}
+    for idx, j in zip(slots if slots is not None else range(len(jokes)), jokes):
+        if j is None:
+            continue
+        by_lang.setdefault(j.lang, []).append(idx)
+        by_style.setdefault(j.style, []).append(idx)
+        by_audience.setdefault(j.audience, []).append(idx)
+        for t in set(t.lower() for t in (j.tags or [])):
+            by_tag.setdefault(t, []).append(idx)
+        for c in set(c.lower() for c in (j.characters or [])):
+            by_character.setdefault(c, []).append(idx)
+        if j.safety:
+            by_safety.setdefault(j.safety, []).append(idx)
+        by_collection.setdefault((j.collection or "").lower(), []).append(idx)
+        for tok in set(_TOKEN.findall(fold(" ".join(_text_pool(j))))):
+            by_token.setdefault(tok, []).append(idx)
+    return {"by_lang": by_lang, "by_style": by_style, "by_audience": by_audience,
+            "by_tag": by_tag, "by_character": by_character, "by_safety": by_safety,
+            "by_collection": by_collection, "by_token": by_token}
+
+def _parse_file(fpath: Path) -> _FilePart:
+    lib = JokeLibrary()
+    lib._load_file(fpath)
+    jokes = lib._state.jokes
+    index = {name: {k: array("I", ids) for k, ids in sub.items()} for name, sub in _index_jokes(jokes).items()}
+    return _FilePart([_joke_row(j) for j in jokes], lib.modules, index)
+
+def _parse_file_isolated(fpath: Path) -> _FilePart:
+    # côté worker : les avertissements sont renvoyés au parent pour garder leur ordre
+    global _warn_sink
+    _warn_sink = []
+    try:
+        part = _parse_file(fpath)
+        part.warnings = _warn_sink
+    finally:
+        _warn_sink = None
+    return part
+
+def _parse_files(files: List[Path], workers: Optional[int] = None) -> Iterator[_FilePart]:
+    if not workers or workers <= 1 or len(files) < 2:
+        for f in files:
+            yield _parse_file(f)
+        return
+    chunksize = max(1, len(files) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part in pool.map(_parse_file_isolated, files, chunksize=chunksize):  # map conserve l'ordre
+            for msg in part.warnings:
+                _warn(msg)
+            yield part
+
+# ---------- Postings (tableaux triés / bitmaps) ----------
+
+class _Bitmap:
+    """Bitmap dense : 1 bit par blague (octets little-endian) + cardinalité."""
+    __slots__ = ("bits", "count")
+
+    def __init__(self, bits: bytes, count: int):
+        self.bits = bits
+        self.count = count
+
+# Une liste rare coûte 32 bits/entrée (array 'I'), un bitmap n bits : on garde le plus petit.
+Postings = Any  # array('I') | _Bitmap
+
+_NONZERO = re.compile(rb"[^\x00]")
+_BYTE_BITS = tuple(tuple(k for k in range(8) if b >> k & 1) for b in range(256))
+
+def _freeze(ids: List[int], n: int) -> Postings:
+    if len(ids) * 32 < n:
+        return array("I", ids)
+    bits = bytearray((n + 7) // 8)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return _Bitmap(bytes(bits), len(ids))
+
+_NO_IDS = array("I")
+
+def _union(postings: List[Postings], n: int) -> Postings:
+    if len(postings) == 1:
+        return postings[0]
+    if any(isinstance(p, _Bitmap) for p in postings):
+        acc = 0
+        for p in postings:
+            if isinstance(p, _Bitmap):
+                acc |= int.from_bytes(p.bits, "little")
+            else:
+                for i in p:
+                    acc |= 1 << i
+        return _freeze(list(_iter_bits(acc, n)), n)
+    return _freeze(sorted(set().union(*postings)), n)
+
+def _freeze_index(index: Dict[str, List[int]], n: int) -> Dict[str, Postings]:
+    return {k: _freeze(ids, n) for k, ids in index.items()}
+
+def _posting_ids(p: Postings) -> Iterable[int]:
+    if isinstance(p, _Bitmap):
+        return _iter_bits(int.from_bytes(p.bits, "little"), len(p.bits) << 3)
+    return p
+
+def _card(p: Postings) -> int:
+    return p.count if isinstance(p, _Bitmap) else len(p)
+
+def _intersect(postings: List[Postings], n: int) -> Iterable[int]:
+    """Intersection du plus petit au plus grand; renvoie des ids croissants."""
+    if not postings:
+        return range(n)
+    postings = sorted(postings, key=_card)
+    head = postings[0]
+    if _card(head) == 0:
+        return ()
+    if isinstance(head, _Bitmap):
+        # bitmaps : ET bit à bit sur des entiers (boucle en C)
+        acc = int.from_bytes(head.bits, "little")
+        rest = []
+        for p in postings[1:]:
+            if isinstance(p, _Bitmap):
+                acc &= int.from_bytes(p.bits, "little")
+            else:
+                rest.append(p)
+        if not rest:
+            return _iter_bits(acc, n)
+        # après reload(), une clé non retouchée garde sa forme : un array plus long qu'un bitmap
+        bits = acc.to_bytes((n + 7) // 8, "little")
+        out = [i for i in rest[0] if bits[i >> 3] >> (i & 7) & 1]
+        for p in rest[1:]:
+            if not out:
+                break
+            out = _sorted_intersect(out, p)
+        return out
+    out: Iterable[int] = head
+    for p in postings[1:]:
+        if isinstance(p, _Bitmap):
+            bits, nbits = p.bits, len(p.bits) << 3  # un bitmap non retouché par reload() peut être plus court
+            out = [i for i in out if i < nbits and bits[i >> 3] >> (i & 7) & 1]
+        else:
+            out = _sorted_intersect(out, p)
+        if not out:
+            return ()
+    return out
+
+def _sorted_intersect(small: Iterable[int], big: array) -> List[int]:
+    res: List[int] = []
+    lo, hi = 0, len(big)
+    for x in small:
+        lo = bisect_left(big, x, lo, hi)
+        if lo == hi:
+            break
+        if big[lo] == x:
+            res.append(x)
+    return res
+
+def _iter_bits(acc: int, n: int) -> Iterable[int]:
+    # paresseux : search(limit=...) s'arrête sans décoder tout le bitmap
+    if not acc:
+        return
+    raw = acc.to_bytes((n + 7) // 8, "little")
+    for m in _NONZERO.finditer(raw):
+        base = m.start() << 3
+        for k in _BYTE_BITS[raw[m.start()]]:
+            yield base + k
+
+# ---------- Plein texte ----------
+
+_TOKEN = re.compile(r"\w+")
+
+class _FoldTable(dict):
+    """Table str.translate paresseuse : caractère → minuscule sans accent (é→e, Œ→oe, ’→')."""
+    def __missing__(self, code: int) -> str:
+        ch = chr(code)
+        if ch in "\u2019\u2018\u02bc":
+            folded = "'"
+        else:
+            decomposed = unicodedata.normalize("NFKD", ch)
+            folded = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+            folded = folded.replace("œ", "oe").replace("æ", "ae")
+        self[code] = folded
+        return folded
+
+_FOLD_TABLE = _FoldTable()
+
+def fold(s: str) -> str:
+    """Forme de comparaison partagée (index plein texte, garde-fous) : 'L’Œuf' → "l'oeuf"."""
+    return s.translate(_FOLD_TABLE)
+
+def _text_pool(j: Joke) -> List[str]:
+    pool = [j.text or "", *(j.tags or []), *(j.characters or [])]
+    if j.beats:
+        pool.extend(j.beats.get(k) or "" for k in ("setup", "turn", "punchline"))
+    return pool
+
+def _trigrams(word: str) -> List[str]:
+    return [word[i:i + 3] for i in range(len(word) - 2)]
+
+# ---------- Snapshot (cache binaire) ----------
+
+SNAPSHOT_VERSION = 7
+_INDEX_ATTRS = _RAW_INDEXES + ("vocab", "vocab_trigrams")
+
+_JOKE_FIELDS = tuple(f.name for f in fields(Joke))
+
+def _joke_row(j: Joke) -> tuple:
+    # tuple à plat (pas de copie profonde comme astuple) → pickle compact
+    return tuple(getattr(j, name) for name in _JOKE_FIELDS)
+
+def _list_files(p: Path) -> List[Path]:
+    if p.is_file():
+        return [p]
+    # dossier → tous les .json/.ndjson récursivement, ordre stable
+    return sorted(f for f in p.rglob("*") if f.suffix.lower() in {".json", ".ndjson"})
+
+def _file_sig(f: Path) -> Tuple[int, int]:
+    st = f.stat()
+    return st.st_size, st.st_mtime_ns
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """
+    N'accepte que les types du snapshot; _Bitmap est résolu quel que soit le chemin
+    du module (m3_jokes en script, nestor.io_utils.m3_jokes en paquet).
+    """
+    def find_class(self, module: str, name: str):
+        if name == "_Bitmap" and module.rsplit(".", 1)[-1] == "m3_jokes":
+            return _Bitmap
+        if module == "array" and name in {"array", "_array_reconstructor"}:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"global interdit dans le snapshot: {module}.{name}")
+
+def _read_snapshot(snap_path: Path) -> Optional[Dict[str, Any]]:
+    # Le snapshot reste un cache local : ne jamais pointer vers un fichier non fiable.
+    try:
+        with snap_path.open("rb") as fh:
+            snap = _SnapshotUnpickler(fh).load()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        _warn(f"{snap_path}: snapshot illisible, reconstruction ({e})")
+        return None
+    if not isinstance(snap, dict) or snap.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snap
+
+def _write_snapshot(snap_path: Path, snap: Dict[str, Any]):
+    tmp = snap_path.with_name(snap_path.name + ".tmp")
+    try:
+        snap_path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("wb") as fh:
+            pickle.dump(snap, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snap_path)  # écriture atomique
+    except OSError as e:
+        _warn(f"{snap_path}: écriture du snapshot impossible: {e}")
+
+# ---------- Fichier colonnes mappé (partagé entre processus) ----------
+
+MAPPED_MAGIC = b"M3MAP\x00\x00\x00"
+MAPPED_VERSION = 2
+_MAPPED_HEAD = struct.Struct("<8sQQ")   # magic, position et taille de l'en-tête JSON (en fin de fichier)
+
+def _write_mapped(st: _State, out: Path):
+    """
+    Un seul fichier, sections alignées sur 8 octets, repérées par un en-tête JSON :
+    - colonnes : profil (code uint32 → table des profils de l'en-tête), drapeaux
+      (bit 0 : texte, bit 1 : champs rares), puis ids / textes / champs rares (JSON)
+      en blobs UTF-8 avec leurs positions uint64 (blague i = blob[off[i]:off[i+1]])
+    - index : clés triées (blob UTF-8 + positions), répertoire (nature, cardinalité,
+      position, taille) et postings tels quels (uint32 triés ou octets du bitmap)
+    Les emplacements sont ceux de l'état compacté : 0..n-1, tous vivants.
+    """
+    if st.dead:
+        st = _compact(st)
+    jokes = st.jokes
+    n = len(jokes)
+    profiles: List[tuple] = []
+    profile_codes: Dict[Any, int] = {}
+    profile = array("I")
+    flags = bytearray(n)
+    blobs = {"ids": bytearray(), "texts": bytearray(), "extra": bytearray()}
+    offsets = {name: array("Q", [0]) for name in blobs}
+
+    def put(name: str, value: str):
+        blob = blobs[name]
+        blob += value.encode("utf-8")
+        offsets[name].append(len(blob))
+
+    for i in range(n):
+        j = jokes[i]
+        values = tuple(getattr(j, name) for name in _CODED)
+        try:
+            code = profile_codes.setdefault(values, len(profiles))
+        except TypeError:                      # valeur JSON non hachable : profil à part
+            code = len(profiles)
+        if code == len(profiles):
+            profiles.append(values)
+        profile.append(code)
+        extra = (list(j.tags or ()), list(j.characters or ())) + tuple(getattr(j, name) for name in _REST)
+        has_extra = bool(extra[0] or extra[1]) or extra[2:] != _NO_REST
+        flags[i] = (j.text is not None) | has_extra << 1
+        put("ids", str(j.id))
+        put("texts", j.text or "")
+        put("extra", json.dumps(extra, ensure_ascii=False, separators=(",", ":")) if has_extra else "")
+
+    # vocabulaire retrié : après un reload, st.vocab a ses mots nouveaux en fin
+    words = sorted(st.by_token)
+    vocab_trigrams: Dict[str, List[int]] = {}
+    for w_idx, word in enumerate(words):
+        for tri in _trigrams(word):
+            vocab_trigrams.setdefault(tri, []).append(w_idx)
+    indexes = {name: getattr(st, name) for name in _RAW_INDEXES}
+    indexes["vocab_trigrams"] = {tri: array("I", ids) for tri, ids in vocab_trigrams.items()}
+
+    sections: Dict[str, Tuple[int, int]] = {}
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with tmp.open("wb") as fh:
+        fh.write(bytes(_MAPPED_HEAD.size))
+
+        def section(name: str, data: bytes | bytearray | array):
+            fh.write(bytes(-fh.tell() % 8))
+            sections[name] = (fh.tell(), fh.write(data))
+
+        section("profile", profile)
+        section("flags", flags)
+        for name, blob in blobs.items():
+            section(f"{name}.blob", blob)
+            section(f"{name}.off", offsets[name])
+        for name, index in indexes.items():
+            keys = sorted(k for k in index if isinstance(k, str))  # clés non textuelles : non mappées
+            key_blob, key_off, directory, post = bytearray(), array("Q", [0]), array("Q"), bytearray()
+            for k in keys:
+                p = index[k]
+                key_blob += k.encode("utf-8")
+                key_off.append(len(key_blob))
+                if isinstance(p, _Bitmap):
+                    kind, count, data = 1, p.count, bytes(p.bits)
+                else:
+                    kind, count, data = 0, len(p), array("I", p).tobytes()
+                directory.extend((kind, count, len(post), len(data)))
+                post += data
+                post += bytes(-len(post) % 4)   # postings uint32 suivants alignés
+            section(f"{name}.keys", key_blob)
+            section(f"{name}.off", key_off)
+            section(f"{name}.dir", directory)
+            section(f"{name}.post", post)
+
+        header = {
+            "version": MAPPED_VERSION,
+            "byteorder": sys.byteorder,
+            "n": n,
+            "profiles": profiles,
+            "modules": st.modules,
+            # fichier → [taille, mtime_ns], premier emplacement, nombre, ids de modules
+            "files": {k: [list(sig), slots[0] if len(slots) else 0, len(slots), list(module_ids)]
+                      for k, (sig, slots, module_ids) in st.files.items()},
+            "sections": sections,
+        }
+        pos = fh.tell()
+        size = fh.write(json.dumps(header, ensure_ascii=False).encode("utf-8"))
+        fh.seek(0)
+        fh.write(_MAPPED_HEAD.pack(MAPPED_MAGIC, pos, size))
+    os.replace(tmp, out)  # écriture atomique : les lecteurs gardent l'ancien mmap
+
+class _MappedFile:
+    """Fichier colonnes ouvert en mmap (lecture seule); view() expose une section sans copie."""
+
+    def __init__(self, path: Path):
+        with path.open("rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mm)
+        magic, pos, size = _MAPPED_HEAD.unpack_from(self._mm, 0)
+        if magic != MAPPED_MAGIC:
+            raise ValueError(f"{path}: pas un fichier de bibliothèque mappé")
+        self.header: Dict[str, Any] = json.loads(str(self._buf[pos:pos + size], "utf-8"))
+        if self.header.get("version") != MAPPED_VERSION or self.header.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{path}: version ou boutisme incompatible")
+
+    def view(self, name: str, fmt: str = "B") -> memoryview:
+        pos, size = self.header["sections"][name]
+        v = self._buf[pos:pos + size]
+        return v.cast(fmt) if fmt != "B" else v
+
+def _blob_str(blob: memoryview, off: memoryview, i: int) -> str:
+    return str(blob[off[i]:off[i + 1]], "utf-8")
+
+class _MappedStore:
+    """
+    Même interface de lecture que _JokeStore, sur les sections du fichier mappé :
+    store[i] ne décode que l'id, le texte et les champs rares de la blague i.
+    """
+
+    def __init__(self, mf: _MappedFile):
+        self._n: int = mf.header["n"]
+        self._profiles = [tuple(p) for p in mf.header["profiles"]]
+        self._profile = mf.view("profile", "I")
+        self._flags = mf.view("flags")
+        self._ids, self._ids_off = mf.view("ids.blob"), mf.view("ids.off", "Q")
+        self._texts, self._texts_off = mf.view("texts.blob"), mf.view("texts.off", "Q")
+        self._extra, self._extra_off = mf.view("extra.blob"), mf.view("extra.off", "Q")
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __iter__(self) -> Iterator[Joke]:
+        return map(self.__getitem__, range(self._n))
+
+    def __getitem__(self, i: int) -> Joke:
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        lang, style, audience, delivery, safety, source, collection, module = self._profiles[self._profile[i]]
+        flags = self._flags[i]
+        text = _blob_str(self._texts, self._texts_off, i) if flags & 1 else None
+        if flags & 2:
+            tags, characters, beats, attribution, created_at, updated_at, notes = \
+                json.loads(_blob_str(self._extra, self._extra_off, i))
+        else:
+            tags, characters = [], []
+            beats, attribution, created_at, updated_at, notes = _NO_REST
+        return Joke(_blob_str(self._ids, self._ids_off, i), lang, style, audience, tags, characters,
+                    beats, text, delivery, safety, source, attribution, created_at, updated_at, notes,
+                    collection, module)
+
+    def live(self, i: int) -> bool:
+        return i < self._n
+
+    def id_of(self, i: int) -> str:
+        return _blob_str(self._ids, self._ids_off, i)
+
+    def style_module(self, i: int) -> Tuple[str, Optional[str]]:
+        profile = self._profiles[self._profile[i]]
+        return profile[1], profile[7]
+
+class _MappedIndex:
+    """
+    Index clé → postings lu dans le fichier : clés triées par octets UTF-8 (même ordre
+    que les str), recherche par bissection. Les postings rendus sont des vues sur le
+    mmap : memoryview uint32 triée, ou _Bitmap dont les octets restent dans le fichier.
+    """
+
+    def __init__(self, mf: _MappedFile, name: str):
+        self._keys, self._off = mf.view(f"{name}.keys"), mf.view(f"{name}.off", "Q")
+        self._dir, self._post = mf.view(f"{name}.dir", "Q"), mf.view(f"{name}.post")
+        self._len = len(self._off) - 1
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[str]:
+        return map(self.key, range(self._len))
+
+    def __contains__(self, key: Any) -> bool:
+        return self._find(key) >= 0
+
+    def __getitem__(self, key: str) -> Postings:
+        k = self._find(key)
+        if k < 0:
+            raise KeyError(key)
+        return self.postings(k)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        k = self._find(key)
+        return self.postings(k) if k >= 0 else default
+
+    def items(self) -> Iterator[Tuple[str, Postings]]:
+        return ((self.key(k), self.postings(k)) for k in range(self._len))
+
+    def key(self, k: int) -> str:
+        return _blob_str(self._keys, self._off, k)
+
+    def postings(self, k: int) -> Postings:
+        kind, count, pos, size = self._dir[4 * k:4 * k + 4]
+        data = self._post[pos:pos + size]
+        return _Bitmap(data, count) if kind else data.cast("I")
+
+    def _find(self, key: Any) -> int:
+        if not isinstance(key, str):
+            return -1
+        target = key.encode("utf-8")
+        keys, off = self._keys, self._off
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[off[mid]:off[mid + 1]].tobytes() < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self._len and keys[off[lo]:off[lo + 1]] == target else -1
+
+class _MappedVocab:
+    """st.vocab d'un état mappé : le mot k est la k-ième clé de by_token (même tri)."""
+    __slots__ = ("_index",)
+
+    def __init__(self, index: _MappedIndex):
+        self._index = index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getitem__(self, k: int) -> str:
+        return self._index.key(k)
+
+def _mapped_state(mf: _MappedFile) -> _State:
+    st = _State()
+    st.jokes = _MappedStore(mf)
+    st.files = {k: (tuple(sig), range(first, first + count), module_ids)
+                for k, (sig, first, count, module_ids) in mf.header["files"].items()}
+    st.modules = mf.header["modules"]
+    for name in _RAW_INDEXES + ("vocab_trigrams",):
+        setattr(st, name, _MappedIndex(mf, name))
+    st.vocab = _MappedVocab(st.by_token)
+    return st
+
+def _open_mapped(path: Path, manifest: Dict[str, Tuple[int, int]]) -> Optional[_State]:
+    """État lu dans `path`, ou None s'il est absent, illisible ou périmé par rapport à `manifest`."""
+    try:
+        st = _mapped_state(_MappedFile(path))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, struct.error) as e:
+        _warn(f"{path}: fichier mappé illisible, reconstruction ({e})")
+        return None
+    if {k: v[0] for k, v in st.files.items()} != manifest:
+        return None
+    return st
+
+_warn_sink: Optional[List[str]] = None
+
 def _warn(msg: str):
+    if _warn_sink is not None:
+        _warn_sink.append(msg)
+        return
     print(f"[M3:WARN] {msg}", file=sys.stderr)
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+import asyncio, time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from .cache import ResponseCache
+
+class _Pending:
+    __slots__ = ("key", "args", "future", "enqueued")
+
+    def __init__(self, key: str, args: Tuple[str, Optional[str], Optional[list], dict], future: asyncio.Future):
+        self.key = key
+        self.args = args
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+class BatchDispatcher:
+    """
+    Async front for an LLM client (anything with agenerate). Requests are collected for
+    up to `window` seconds or `max_batch` items; identical requests in a batch share one
+    upstream call, and at most `max_concurrency` calls run at once. When all slots are
+    busy the collector stops draining, so agenerate() waits once `max_queue` requests
+    are pending (backpressure instead of an unbounded backlog on the model server).
+    Queue, slots and collector belong to one event loop; once that loop has stopped,
+    the next call from another loop starts a fresh set (e.g. successive asyncio.run).
+    """
+
+    def __init__(self, client: Any, window: float = 0.005, max_batch: int = 16,
+                 max_concurrency: int = 4, max_queue: int = 256):
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._calls: set = set()
+        self._waits: Deque[float] = deque(maxlen=2048)
+        self.counters = {"requests": 0, "batches": 0, "upstream_calls": 0, "merged": 0, "max_queue_depth": 0}
+
+    async def agenerate(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> str:
+        loop = asyncio.get_running_loop()
+        if self._collector is None or self._loop is not loop:
+            self._start(loop)
+        future = loop.create_future()
+        key = ResponseCache.key(system=system, prompt=prompt, tools=tools, params=kwargs)
+        await self._queue.put(_Pending(key, (prompt, system, tools, kwargs), future))
+        self.counters["requests"] += 1
+        self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self._queue.qsize())
+        return await future
+
+    def _start(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._loop is not None and self._loop is not loop and self._loop.is_running():
+            raise RuntimeError("BatchDispatcher is already serving another running event loop")
+        # whatever was left on a previous, stopped loop can never complete: drop it
+        self._calls = set()
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._collector = loop.create_task(self._collect())
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.counters["batches"] += 1
+            groups: Dict[str, List[_Pending]] = {}
+            for p in batch:
+                groups.setdefault(p.key, []).append(p)
+            self.counters["merged"] += len(batch) - len(groups)
+            pending = list(groups.values())
+            try:
+                while pending:
+                    await self._slots.acquire()  # blocks the collector while saturated
+                    task = loop.create_task(self._call(pending.pop(0)))
+                    self._calls.add(task)
+                    task.add_done_callback(self._calls.discard)
+            except asyncio.CancelledError:
+                for waiters in pending:
+                    for p in waiters:
+                        p.future.cancel()
+                raise
+
+    async def _call(self, waiters: List[_Pending]) -> None:
+        try:
+            live = [p for p in waiters if not p.future.done()]
+            if not live:
+                return  # every caller gave up before dispatch
+            now = time.perf_counter()
+            self._waits.extend(now - p.enqueued for p in live)
+            self.counters["upstream_calls"] += 1
+            prompt, system, tools, kwargs = live[0].args
+            try:
+                reply = await self.client.agenerate(prompt, system=system, tools=tools, **kwargs)
+            except Exception as e:
+                for p in live:
+                    if not p.future.done():
+                        p.future.set_exception(e)
+                return
+            for p in live:
+                if not p.future.done():
+                    p.future.set_result(reply)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        pct = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 3) if waits else 0.0
+        return {
+            **self.counters,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "in_flight": len(self._calls),
+            "wait_ms_p50": pct(0.50),
+            "wait_ms_p99": pct(0.99),
+        }
+
+    async def aclose(self) -> None:
+        if self._loop is not asyncio.get_running_loop():
+            self._collector = self._queue = self._loop = None  # started on a loop that is gone
+            self._calls = set()
+            return
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, return_exceptions=True)
+            self._collector = None
+        if self._calls:
+            await asyncio.gather(*self._calls, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            self._queue.get_nowait().future.cancel()
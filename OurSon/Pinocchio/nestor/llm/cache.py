@@ -0,0 +1,204 @@
+import asyncio, hashlib, json, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+_ABANDONED = object()   # result of a flight whose leader was cancelled: followers retry
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM completions: in-memory LRU, optionally backed by SQLite.
+    Entries expire after `ttl` seconds (None = never). Concurrent identical requests
+    are coalesced: one caller computes, the others wait for its result.
+    The async methods keep the SQLite tier off the event loop (worker threads).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600,
+                 path: Optional[str] = None, max_rows: int = 100_000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # key -> (expires, text)
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._aflights: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._puts = 0
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "coalesced": 0, "evictions": 0}
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache (k TEXT PRIMARY KEY, v TEXT, expires REAL, used REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_used ON llm_cache (used)")
+            self._db.commit()
+
+    @staticmethod
+    def key(**parts: Any) -> str:
+        blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    # -- lookup / store --
+
+    def get(self, key: str) -> Optional[str]:
+        hit = self._get_memory(key)
+        if hit is None and self._db is not None:
+            hit = self._get_disk(key)
+        if hit is None:
+            self._miss()
+        return hit
+
+    async def aget(self, key: str) -> Optional[str]:
+        hit = self._get_memory(key)
+        if hit is None and self._db is not None:
+            hit = await asyncio.to_thread(self._get_disk, key)
+        if hit is None:
+            self._miss()
+        return hit
+
+    def put(self, key: str, value: str) -> None:
+        now, expires = self._remember_now(key, value)
+        if self._db is not None:
+            self._put_disk(key, value, expires, now)
+
+    async def aput(self, key: str, value: str) -> None:
+        now, expires = self._remember_now(key, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_disk, key, value, expires, now)
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is None:
+                return None
+            if hit[0] < time.time():
+                del self._mem[key]
+                return None
+            self._mem.move_to_end(key)
+            self.stats["hits"] += 1
+            self.stats["memory_hits"] += 1
+            return hit[1]
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT v, expires FROM llm_cache WHERE k=?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                return None
+            self._db.execute("UPDATE llm_cache SET used=? WHERE k=?", (now, key))
+            self._db.commit()
+            self._remember(key, row[0], row[1])
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+            return row[0]
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.stats["misses"] += 1
+
+    def _remember_now(self, key: str, value: str) -> Tuple[float, float]:
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._remember(key, value, expires)
+        return now, expires
+
+    def _put_disk(self, key: str, value: str, expires: float, now: float) -> None:
+        with self._lock:
+            self._db.execute("REPLACE INTO llm_cache (k, v, expires, used) VALUES (?,?,?,?)", (key, value, expires, now))
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._trim_disk(now)
+            self._db.commit()
+
+    def _remember(self, key: str, value: str, expires: float) -> None:
+        self._mem[key] = (expires, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _trim_disk(self, now: float) -> None:
+        self._db.execute("DELETE FROM llm_cache WHERE expires < ?", (now,))
+        self._db.execute("DELETE FROM llm_cache WHERE k IN (SELECT k FROM llm_cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                         (self.max_rows,))
+
+    # -- single-flight --
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None and hit[0] >= time.time():
+                return hit[1]  # a flight for this key finished since our lookup
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = compute()
+            self.put(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Async single-flight. A cancelled leader only cancels itself: its followers
+        wake up, and the first of them takes over the computation.
+        """
+        cached = await self.aget(key)
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        fut = self._aflights.get(slot)
+        if fut is not None:
+            self.stats["coalesced"] += 1
+        while fut is not None:
+            value = await asyncio.shield(fut)
+            if value is not _ABANDONED:
+                return value
+            fut = self._aflights.get(slot)  # None: we are the new leader
+        fut = self._aflights[slot] = loop.create_future()
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            fut.set_result(_ABANDONED)
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved: no "never retrieved" warning without followers
+            raise
+        finally:
+            self._aflights.pop(slot, None)
+        fut.set_result(value)
+        await self.aput(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
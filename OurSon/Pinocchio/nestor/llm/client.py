@@ -1,18 +1,59 @@
-from typing import Any, Optional, Iterable
+from typing import Any, Optional, Iterable, AsyncIterator
+from .cache import ResponseCache
 from .lmstudio import LMStudioClient
 from .openai import OpenAIClient
 
 class LLM:
-    def __init__(self, backend: str = "lmstudio", **kwargs):
+    def __init__(self, backend: str = "lmstudio", cache: Optional[ResponseCache] = None, **kwargs):
         if backend == "lmstudio":
             self._client = LMStudioClient(**kwargs)
         elif backend == "openai":
             self._client = OpenAIClient(**kwargs)
         else:
             raise ValueError(f"Unknown backend: {backend}")
+        self.backend = backend
+        self.cache = cache
+
+    def _key(self, prompt: str, system: Optional[str], tools: Optional[list], kwargs: dict) -> str:
+        return ResponseCache.key(backend=self.backend, model=getattr(self._client, "model", None),
+                                 system=system, prompt=prompt, tools=tools, params=kwargs)
 
     def generate(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> str:
-        return self._client.generate(prompt, system=system, tools=tools, **kwargs)
+        if self.cache is None:
+            return self._client.generate(prompt, system=system, tools=tools, **kwargs)
+        return self.cache.get_or_compute(self._key(prompt, system, tools, kwargs),
+                                         lambda: self._client.generate(prompt, system=system, tools=tools, **kwargs))
 
     def stream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> Iterable[str]:
-        yield from self._client.stream(prompt, system=system, tools=tools, **kwargs)
+        if self.cache is None:
+            yield from self._client.stream(prompt, system=system, tools=tools, **kwargs)
+            return
+        key = self._key(prompt, system, tools, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        for chunk in self._client.stream(prompt, system=system, tools=tools, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        self.cache.put(key, "".join(parts))  # only reached when the stream ran to completion
+
+    async def agenerate(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> str:
+        if self.cache is None:
+            return await self._client.agenerate(prompt, system=system, tools=tools, **kwargs)
+        return await self.cache.aget_or_compute(self._key(prompt, system, tools, kwargs),
+                                                lambda: self._client.agenerate(prompt, system=system, tools=tools, **kwargs))
+
+    async def astream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> AsyncIterator[str]:
+        key = self._key(prompt, system, tools, kwargs) if self.cache is not None else None
+        cached = await self.cache.aget(key) if key is not None else None
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        async for chunk in self._client.astream(prompt, system=system, tools=tools, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        if key is not None:
+            await self.cache.aput(key, "".join(parts))
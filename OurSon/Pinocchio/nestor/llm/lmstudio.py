@@ -1,17 +1,80 @@
-from typing import Optional, Iterable
+from typing import Optional, Iterator, AsyncIterator
 import httpx, json
 
 class LMStudioClient:
-    def __init__(self, base_url: str = "http://localhost:1234/v1", model: str = "qwen2.5", **_):
-        self.base_url = base_url
+    """
+    OpenAI-compatible /chat/completions client with long-lived pooled connections.
+    stream()/astream() consume the SSE response token by token; closing the generator
+    (or cancelling the task) closes the upstream response.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:1234/v1", model: str = "qwen2.5",
+                 timeout: float = 60, max_connections: int = 20, **_):
+        self.base_url = base_url.rstrip("/")
         self.model = model
+        self._timeout = httpx.Timeout(timeout, connect=10)
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.Client(base_url=self.base_url, timeout=self._timeout, limits=self._limits)
+        self._aclient: Optional[httpx.AsyncClient] = None  # created on first async call
+
+    def _payload(self, prompt: str, system: Optional[str], stream: bool = False, **kwargs) -> dict:
+        # messages: earlier chat turns, placed between the system prompt and this user turn
+        turns = list(kwargs.get("messages") or ())
+        payload = {"model": self.model, "messages":[{"role":"system","content":system or ""}, *turns, {"role":"user","content":prompt}]}
+        payload.update({k: kwargs[k] for k in ("temperature", "max_tokens", "top_p", "stop") if k in kwargs})
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _async(self) -> httpx.AsyncClient:
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(base_url=self.base_url, timeout=self._timeout, limits=self._limits)
+        return self._aclient
 
     def generate(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> str:
-        payload = {"model": self.model, "messages":[{"role":"system","content":system or ""},{"role":"user","content":prompt}]}
-        with httpx.Client(timeout=60) as client:
-            r = client.post(f"{self.base_url}/chat/completions", json=payload)
+        r = self._client.post("/chat/completions", json=self._payload(prompt, system, **kwargs))
+        r.raise_for_status()
+        return r.json()["choices"][0]["message"]["content"]
+
+    def stream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> Iterator[str]:
+        with self._client.stream("POST", "/chat/completions", json=self._payload(prompt, system, stream=True, **kwargs)) as r:
             r.raise_for_status()
-            return r.json()["choices"][0]["message"]["content"]
+            for line in r.iter_lines():
+                done, delta = _sse_delta(line)
+                if done:
+                    return
+                if delta:
+                    yield delta
+
+    async def agenerate(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> str:
+        r = await self._async().post("/chat/completions", json=self._payload(prompt, system, **kwargs))
+        r.raise_for_status()
+        return r.json()["choices"][0]["message"]["content"]
+
+    async def astream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> AsyncIterator[str]:
+        async with self._async().stream("POST", "/chat/completions", json=self._payload(prompt, system, stream=True, **kwargs)) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                done, delta = _sse_delta(line)
+                if done:
+                    return
+                if delta:
+                    yield delta
+
+    def close(self) -> None:
+        self._client.close()
+
+    async def aclose(self) -> None:
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
 
-    def stream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> Iterable[str]:
-        yield self.generate(prompt, system=system, tools=tools, **kwargs)
+def _sse_delta(line: str) -> tuple[bool, Optional[str]]:
+    """(done, text) for one SSE line of a streamed chat completion."""
+    if not line.startswith("data:"):
+        return False, None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return True, None
+    choices = json.loads(data).get("choices") or [{}]
+    return False, (choices[0].get("delta") or {}).get("content")
@@ -1,4 +1,4 @@
-from typing import Optional, Iterable
+from typing import Optional, Iterable, AsyncIterator
 import os
 
 class OpenAIClient:
@@ -13,3 +13,9 @@ class OpenAIClient:
 
     def stream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> Iterable[str]:
         yield self.generate(prompt, system=system, tools=tools, **kwargs)
+
+    async def agenerate(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> str:
+        return self.generate(prompt, system=system, tools=tools, **kwargs)
+
+    async def astream(self, prompt: str, system: Optional[str] = None, tools: Optional[list] = None, **kwargs) -> AsyncIterator[str]:
+        yield self.generate(prompt, system=system, tools=tools, **kwargs)
@@ -1,14 +1,80 @@
-from typing import List, Dict
+import json, time
+from typing import List, Dict, Optional
 from ..storage.kv import KV
 
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS episodic ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT NOT NULL, ts REAL NOT NULL, event TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS episodic_session_seq ON episodic (session, seq)",
+    "CREATE INDEX IF NOT EXISTS episodic_ts ON episodic (ts)",
+)
+
 class EpisodicMemory:
-    def __init__(self, kv: KV):
+    """Append-only event log in the KV database; one row per event, never rewritten."""
+
+    def __init__(self, kv: KV, session: str = "default"):
         self.kv = kv
+        self.session = session
+        with self.kv.conn as conn:
+            for stmt in SCHEMA:
+                conn.execute(stmt)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        # legacy layout: the whole timeline as a JSON list under kv["episodic"]
+        legacy = self.kv.get("episodic")
+        if legacy is None:
+            return
+        now = time.time()
+        rows = [(self.session, float(e.get("ts", now)) if isinstance(e, dict) else now, json.dumps(e))
+                for e in legacy if e is not None]
+        with self.kv.conn as conn:
+            conn.executemany("INSERT INTO episodic (session, ts, event) VALUES (?,?,?)", rows)
+            conn.execute("DELETE FROM kv WHERE k=?", ("episodic",))
+
+    def remember(self, event: Dict, session: Optional[str] = None, ts: Optional[float] = None) -> None:
+        # batched with other writes when the KV runs in write-behind mode
+        self.kv.execute_write("INSERT INTO episodic (session, ts, event) VALUES (?,?,?)",
+                              (session or self.session, time.time() if ts is None else ts, json.dumps(event)))
+
+    def recent(self, n: int = 10, session: Optional[str] = None) -> List[Dict]:
+        self.kv.flush()
+        rows = self.kv.conn.execute(
+            "SELECT event FROM episodic WHERE session=? ORDER BY seq DESC LIMIT ?",
+            (session or self.session, max(0, n))).fetchall()
+        return [json.loads(r[0]) for r in reversed(rows)]
 
-    def remember(self, event: Dict):
-        timeline = self.kv.get("episodic") or []
-        timeline.append(event)
-        self.kv.set("episodic", timeline)
+    def between(self, start: Optional[float] = None, end: Optional[float] = None,
+                session: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Events with start <= ts < end, oldest first; session=None spans all sessions."""
+        self.kv.flush()
+        where, args = [], []
+        if start is not None:
+            where.append("ts >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("ts < ?")
+            args.append(end)
+        if session is not None:
+            where.append("session=?")
+            args.append(session)
+        sql = "SELECT event FROM episodic" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return [json.loads(r[0]) for r in self.kv.conn.execute(sql, args)]
 
-    def recent(self, n: int = 10) -> List[Dict]:
-        return (self.kv.get("episodic") or [])[-n:]
+    def compact(self, keep_last: Optional[int] = None, older_than: Optional[float] = None) -> int:
+        """Retention: drop events before `older_than` and/or all but the last `keep_last` per session."""
+        self.kv.flush()
+        deleted = 0
+        with self.kv.conn as conn:
+            if older_than is not None:
+                deleted += conn.execute("DELETE FROM episodic WHERE ts < ?", (older_than,)).rowcount
+            if keep_last is not None:
+                for (session,) in conn.execute("SELECT DISTINCT session FROM episodic").fetchall():
+                    deleted += conn.execute(
+                        "DELETE FROM episodic WHERE session=? AND seq <= "
+                        "(SELECT seq FROM episodic WHERE session=? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                        (session, session, max(0, keep_last))).rowcount
+        return deleted
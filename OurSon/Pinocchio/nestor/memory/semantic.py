@@ -1,10 +1,80 @@
-from typing import List, Dict
+import threading, unicodedata
+from collections import OrderedDict
+from typing import Any, List, Dict, Optional, Tuple
 from ..storage.vector import VectorStore
 
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query or "").casefold().split())
+
 class SemanticMemory:
-    def __init__(self, vec: VectorStore):
+    """
+    Recall over a vector store with two bounded LRU caches: query embeddings
+    (keyed on the normalized query) and recall results (normalized query, k,
+    namespace). A result is reused only while the store's version for its
+    namespace is unchanged, so any write to the namespace invalidates it.
+    Stores without embed/search_by_vector/version fall back to plain search.
+    """
+
+    def __init__(self, vec: VectorStore, max_embeddings: int = 1024, max_results: int = 1024):
         self.vec = vec
+        self.max_embeddings = max_embeddings
+        self.max_results = max_results
+        self._embeddings: "OrderedDict[str, Any]" = OrderedDict()
+        self._results: "OrderedDict[Tuple[str, int, str], Tuple[int, List[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._by_vector = callable(getattr(vec, "embed", None)) and callable(getattr(vec, "search_by_vector", None))
+        self.stats = {"hits": 0, "misses": 0, "embed_hits": 0, "embeds": 0}
 
     def recall(self, query: str, k: int = 5, namespace: str = "texts") -> List[Dict]:
-        hits = self.vec.search(query, k=k, namespace=namespace)
-        return [{"id": i, "score": s, "meta": m} for (i,s,m) in hits]
+        norm = normalize_query(query)
+        version = self._version(namespace)
+        key = (norm, k, namespace)
+        if version is not None and self.max_results > 0:
+            with self._lock:
+                hit = self._results.get(key)
+                if hit is not None and hit[0] == version:
+                    self._results.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return list(hit[1])
+                self.stats["misses"] += 1
+        if self._by_vector:
+            hits = self.vec.search_by_vector(self._embed(norm), k=k, namespace=namespace)
+        else:
+            hits = self.vec.search(query, k=k, namespace=namespace)
+        out = [{"id": i, "score": s, "meta": m} for (i,s,m) in hits]
+        texts = getattr(self.vec, "texts", None)
+        if callable(texts) and out:
+            for item, text in zip(out, texts([h["id"] for h in out])):
+                item["text"] = text
+        if version is not None and self.max_results > 0:
+            with self._lock:
+                self._results[key] = (version, out)
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+        return list(out)
+
+    def _version(self, namespace: str) -> Optional[int]:
+        version = getattr(self.vec, "version", None)
+        return version(namespace) if callable(version) else None
+
+    def _embed(self, norm: str) -> Any:
+        with self._lock:
+            vec = self._embeddings.get(norm)
+            if vec is not None:
+                self._embeddings.move_to_end(norm)
+                self.stats["embed_hits"] += 1
+                return vec
+        vec = self.vec.embed([norm])[0]
+        with self._lock:
+            self.stats["embeds"] += 1
+            if self.max_embeddings > 0:
+                self._embeddings[norm] = vec
+                while len(self._embeddings) > self.max_embeddings:
+                    self._embeddings.popitem(last=False)
+        return vec
+
+    def clear(self) -> None:
+        with self._lock:
+            self._embeddings.clear()
+            self._results.clear()
@@ -1,2 +1,50 @@
-def run():
-    print("Dashboard placeholder")
+import argparse, time
+from typing import Any, Callable, Dict, Optional
+from . import metrics
+
+def _source(url: Optional[str]) -> Callable[[], Dict[str, Any]]:
+    if not url:
+        return metrics.snapshot
+    import httpx
+    client = httpx.Client(timeout=5)
+    return lambda: client.get(url).json()
+
+def render(snap: Dict[str, Any]):
+    from rich.console import Group
+    from rich.table import Table
+    lat = Table(title="Latency (ms)", expand=True)
+    for col in ("stage", "count", "mean", "p50", "p90", "p99", "max"):
+        lat.add_column(col, justify="left" if col == "stage" else "right")
+    for name, h in snap.get("histograms", {}).items():
+        lat.add_row(name, str(h["count"]), *(f"{h[k]:.2f}" for k in ("mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")))
+    counters = Table(title="Counters", expand=True)
+    counters.add_column("name")
+    counters.add_column("value", justify="right")
+    for name, v in sorted(snap.get("counters", {}).items()):
+        counters.add_row(name, str(v))
+    for source, stats in sorted(snap.get("sources", {}).items()):
+        for name, v in stats.items():
+            counters.add_row(f"{source}.{name}", str(v))
+    return Group(lat, counters)
+
+def run(url: Optional[str] = None, interval: float = 1.0):
+    """Live percentiles: from this process, or polled from a running API's /metrics."""
+    from rich.live import Live
+    fetch = _source(url)
+    with Live(render(fetch()), refresh_per_second=4, screen=False) as live:
+        try:
+            while True:
+                time.sleep(interval)
+                try:
+                    live.update(render(fetch()))
+                except Exception as e:
+                    live.console.print(f"[red]metrics unavailable: {e}[/red]")
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8000/metrics")
+    ap.add_argument("--interval", type=float, default=1.0)
+    args = ap.parse_args()
+    run(args.url, args.interval)
@@ -1,4 +1,16 @@
-from typing import Any
+import time
+from collections import deque
+from typing import Any, Deque, List, Tuple
+
+# deque.append/popleft are atomic under the GIL: emitters never take a lock
+_RING: Deque[Tuple[float, str, dict]] = deque(maxlen=4096)
+
 def emit(event_type: str, payload: dict[str, Any]) -> None:
-    # TODO: wire to logging or local dashboard
-    pass
+    _RING.append((time.time(), event_type, payload))
+
+def recent(n: int = 100) -> List[dict]:
+    events = list(_RING)[-n:] if n > 0 else []
+    return [{"ts": ts, "type": t, **payload} for ts, t, payload in events]
+
+def clear() -> None:
+    _RING.clear()
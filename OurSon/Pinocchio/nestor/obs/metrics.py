@@ -0,0 +1,110 @@
+import bisect, threading, time
+from typing import Any, Callable, Dict, List, Optional
+from . import events
+
+# log-spaced latency buckets (seconds): 50µs .. ~2min, ~19% apart
+BUCKETS: List[float] = [5e-5 * 1.19 ** i for i in range(86)]
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles are bucket upper bounds (≤19% error)."""
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        ms = lambda s: round(s * 1000, 3)
+        return {"count": self.count, "mean_ms": ms(self.sum / self.count) if self.count else 0.0,
+                "p50_ms": ms(self.percentile(0.50)), "p90_ms": ms(self.percentile(0.90)),
+                "p99_ms": ms(self.percentile(0.99)), "max_ms": ms(self.max)}
+
+class Metrics:
+    """
+    Process-wide counters and latency histograms. Updates take one short lock
+    (a few hundred ns); sources are callables polled only when a snapshot is taken,
+    so components that already keep stats dicts (caches, batcher) cost nothing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            h = self.histograms.get(name)
+            if h is None:
+                h = self.histograms[name] = Histogram()
+            h.observe(seconds)
+
+    def register(self, name: str, source: Callable[[], Dict[str, Any]]) -> None:
+        self._sources[name] = source
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {"counters": dict(self.counters),
+                   "histograms": {k: h.summary() for k, h in sorted(self.histograms.items())}}
+        sources = {}
+        for name, source in list(self._sources.items()):
+            try:
+                sources[name] = dict(source())
+            except Exception as e:  # a broken source must not take /metrics down
+                sources[name] = {"error": str(e)}
+        out["sources"] = sources
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+class span:
+    """`with span("llm"):` times the block into the histogram of that name (sync or async code)."""
+    __slots__ = ("name", "metrics", "start")
+
+    def __init__(self, name: str, metrics: Optional[Metrics] = None):
+        self.name = name
+        self.metrics = metrics or METRICS
+        self.start = 0.0
+
+    def __enter__(self) -> "span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.name, elapsed)
+        if exc_type is not None:
+            self.metrics.incr(f"{self.name}.errors")
+        events.emit("span", {"name": self.name, "ms": round(elapsed * 1000, 3), "ok": exc_type is None})
+
+METRICS = Metrics()
+incr = METRICS.incr
+observe = METRICS.observe
+snapshot = METRICS.snapshot
@@ -1,7 +1,7 @@
 from .base import Persona
 from .middleware import apply_style
 import json, importlib.resources as pkg
-from typing import Dict
+from typing import Dict, List
 
 _cache: Dict[str, Persona] = {}
 
@@ -13,6 +13,9 @@ def load(name: str) -> Persona:
     _cache[name] = p
     return p
 
+def available() -> List[str]:
+    return sorted(f.name[:-5] for f in pkg.files(__package__).joinpath("chakras").iterdir() if f.name.endswith(".json"))
+
 def apply(name: str, ctx: dict) -> dict:
     persona = load(name)
     blocks = persona.apply(ctx)
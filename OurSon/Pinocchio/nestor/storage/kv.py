@@ -1,21 +1,197 @@
-import sqlite3, json
-from typing import Any, Optional
+import sqlite3, json, threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from ..logging import get_logger
+from ..obs import metrics
+from ..obs.metrics import span
+
+log = get_logger(__name__)
+
+_MISSING = object()
+_TRANSIENT = (5, 6, 10, 13, 14)   # SQLITE_BUSY, LOCKED, IOERR, FULL, CANTOPEN: worth retrying
+
+def _transient(e: sqlite3.Error) -> bool:
+    code = getattr(e, "sqlite_errorcode", None)   # Python 3.11+
+    if code is not None:
+        return code & 0xFF in _TRANSIENT
+    return isinstance(e, sqlite3.OperationalError) and any(w in str(e) for w in ("locked", "busy", "disk", "unable to open"))
 
 class KV:
-    def __init__(self, path: str = "nestor.db"):
-        self.conn = sqlite3.connect(path)
-        self.conn.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT)")
-        self.conn.commit()
+    """
+    SQLite key/value store, safe to share across threads.
+    Each thread gets its own connection (WAL: readers never block the writer).
+    write_behind > 0 buffers writes and commits them together every `write_behind`
+    seconds from a background thread; call flush()/close() before exiting.
+    A queued statement that fails on its own is dropped (and logged), not retried;
+    once `max_buffered` writes are waiting, the next write flushes synchronously.
+    """
 
-    def get(self, k: str) -> Optional[Any]:
-        cur = self.conn.execute("SELECT v FROM kv WHERE k=?", (k,))
-        row = cur.fetchone()
-        return json.loads(row[0]) if row else None
+    def __init__(self, path: str = "nestor.db", write_behind: float = 0.0, max_buffered: int = 10_000):
+        self.path = path
+        self.write_behind = write_behind
+        self.max_buffered = max_buffered
+        self._local = threading.local()
+        self._lock = threading.RLock()             # one writer at a time + pending buffers
+        self._conns: List[sqlite3.Connection] = []
+        self._shared = self._connect() if path == ":memory:" else None  # :memory: is per-connection
+        self._pending: Dict[str, Optional[str]] = {}  # key -> encoded value, None = delete
+        self._queued: List[Tuple[str, Sequence[Any]]] = []
+        self.execute_write("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT)", defer=False)
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if write_behind > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="kv-write-behind", daemon=True)
+            self._flusher.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._conns.append(conn)
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # -- writes --
+
+    def execute_write(self, sql: str, args: Sequence[Any] = (), defer: bool = True) -> None:
+        """Run a write statement now, or queue it for the next batch in write-behind mode."""
+        with self._lock:
+            if defer and self.write_behind > 0:
+                self._make_room()
+                self._queued.append((sql, args))
+                metrics.incr("kv.buffered")
+                return
+            with span("kv.commit"), self.conn as conn:
+                conn.execute(sql, args)
+            metrics.incr("kv.writes")
 
     def set(self, k: str, v: Any) -> None:
-        self.conn.execute("REPLACE INTO kv (k, v) VALUES (?,?)", (k, json.dumps(v)))
-        self.conn.commit()
+        self.set_many({k: v})
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        encoded = {k: json.dumps(v) for k, v in items.items()}
+        with self._lock:
+            if self.write_behind > 0:
+                self._make_room()
+                self._pending.update(encoded)
+                metrics.incr("kv.buffered", len(encoded))
+                return
+            with span("kv.commit"), self.conn as conn:
+                conn.executemany("REPLACE INTO kv (k, v) VALUES (?,?)", encoded.items())
+            metrics.incr("kv.writes", len(encoded))
 
     def delete(self, k: str) -> None:
-        self.conn.execute("DELETE FROM kv WHERE k=?", (k,))
-        self.conn.commit()
+        with self._lock:
+            if self.write_behind > 0:
+                self._make_room()
+                self._pending[k] = None
+                metrics.incr("kv.buffered")
+                return
+            with span("kv.commit"), self.conn as conn:
+                conn.execute("DELETE FROM kv WHERE k=?", (k,))
+            metrics.incr("kv.writes")
+
+    def _make_room(self) -> None:
+        # backpressure: a full buffer is written before anything is added to it
+        if len(self._pending) + len(self._queued) >= self.max_buffered:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Commit the buffers in one transaction. Busy/IO errors leave them untouched
+        (and are raised); any other error is blamed on single statements, which are
+        replayed one by one so only the failing ones are dropped.
+        """
+        with self._lock:
+            if not self._pending and not self._queued:
+                return
+            pending, queued = self._pending, self._queued
+            metrics.incr("kv.flushes")
+            with span("kv.flush"):
+                try:
+                    with self.conn as conn:
+                        self._write_pending(conn, pending)
+                        for sql, args in queued:
+                            conn.execute(sql, args)
+                except sqlite3.Error as e:
+                    if _transient(e):
+                        raise
+                    queued = self._replay(pending, queued)
+            metrics.incr("kv.writes", len(pending) + len(queued))
+            self._pending, self._queued = {}, []
+
+    @staticmethod
+    def _write_pending(conn: sqlite3.Connection, pending: Dict[str, Optional[str]]) -> None:
+        conn.executemany("REPLACE INTO kv (k, v) VALUES (?,?)", [(k, v) for k, v in pending.items() if v is not None])
+        conn.executemany("DELETE FROM kv WHERE k=?", [(k,) for k, v in pending.items() if v is None])
+
+    def _replay(self, pending: Dict[str, Optional[str]], queued: List[Tuple[str, Sequence[Any]]]) -> List[Tuple[str, Sequence[Any]]]:
+        """The batch again, each queued statement in its own savepoint; returns those that went through."""
+        done = []
+        with self.conn as conn:
+            conn.execute("BEGIN")
+            self._write_pending(conn, pending)
+            for sql, args in queued:
+                conn.execute("SAVEPOINT stmt")
+                try:
+                    conn.execute(sql, args)
+                except sqlite3.Error as e:
+                    if _transient(e):
+                        raise
+                    conn.execute("ROLLBACK TO stmt")
+                    metrics.incr("kv.dropped")
+                    log.warning("dropping buffered write %r: %s", sql, e)
+                else:
+                    done.append((sql, args))
+                conn.execute("RELEASE stmt")
+        return done
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.write_behind):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                log.warning("write-behind flush failed, retrying in %.3fs: %s", self.write_behind, e)
+
+    # -- reads --
+
+    def get(self, k: str) -> Optional[Any]:
+        return self.get_many([k]).get(k)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(keys))
+        metrics.incr("kv.reads", len(keys))
+        out: Dict[str, Any] = {}
+        with self._lock:
+            # read-your-writes: buffered values win over the database
+            for k in keys:
+                v = self._pending.get(k, _MISSING)
+                if v is not _MISSING:
+                    if v is not None:
+                        out[k] = json.loads(v)
+            missing = [k for k in keys if k not in self._pending]
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            cur = self.conn.execute(f"SELECT k, v FROM kv WHERE k IN ({','.join('?' * len(chunk))})", chunk)
+            out.update((k, json.loads(v)) for k, v in cur)
+        return out
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join()
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                for conn in self._conns:
+                    conn.close()
+                self._conns.clear()
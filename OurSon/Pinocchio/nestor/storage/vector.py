@@ -1,20 +1,274 @@
-from typing import List, Dict, Any, Tuple
-import chromadb
+import json, re, threading, unicodedata, zlib
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Callable, Optional
+import numpy as np
+from ..logging import get_logger
+
+log = get_logger(__name__)
 
 class VectorStore:
+    """Chroma-backed store (in-memory client)."""
+
     def __init__(self, name: str = "nestor"):
+        import chromadb
+        from chromadb.utils import embedding_functions
         self.client = chromadb.Client()
-        self.col = self.client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+        self.embed = embedding_functions.DefaultEmbeddingFunction()
+        self.col = self.client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"},
+                                                        embedding_function=self.embed)
+        self._versions: Dict[str, int] = {}
+
+    def version(self, namespace: str = "default") -> int:
+        """Bumped on every write to the namespace (lets callers cache search results)."""
+        return self._versions.get(namespace, 0)
 
     def add(self, items: List[Dict[str, Any]], namespace: str = "default"):
         ids = [f"{namespace}:{i.get('id')}" for i in items]
         texts = [i.get("text") or i.get("content") for i in items]
         metas = [{"namespace":namespace, **{k:v for k,v in i.items() if k not in ("id","text","content")}} for i in items]
-        self.col.add(ids=ids, documents=texts, metadatas=metas)
+        self.col.upsert(ids=ids, documents=texts, metadatas=metas)  # same semantics as the NumPy store
+        self._versions[namespace] = self.version(namespace) + 1
+
+    def delete(self, ids: List[str], namespace: str = "default"):
+        self.col.delete(ids=[f"{namespace}:{i}" for i in ids])
+        self._versions[namespace] = self.version(namespace) + 1
 
     def search(self, query: str, k: int = 5, namespace: str = "default") -> List[Tuple[str,float,Dict[str,Any]]]:
-        res = self.col.query(query_texts=[query], n_results=k, where={"namespace":namespace})
+        return self._hits(self.col.query(query_texts=[query], n_results=k, where={"namespace":namespace}))
+
+    def search_by_vector(self, vec, k: int = 5, namespace: str = "default") -> List[Tuple[str,float,Dict[str,Any]]]:
+        return self._hits(self.col.query(query_embeddings=[list(map(float, vec))], n_results=k, where={"namespace":namespace}))
+
+    def texts(self, full_ids: List[str]) -> List[Optional[str]]:
+        res = self.col.get(ids=list(full_ids), include=["documents"])
+        found = dict(zip(res["ids"], res["documents"]))
+        return [found.get(i) for i in full_ids]
+
+    @staticmethod
+    def _hits(res) -> List[Tuple[str,float,Dict[str,Any]]]:
         out = []
         for i in range(len(res["ids"][0])):
             out.append((res["ids"][0][i], res["distances"][0][i], res["metadatas"][0][i]))
         return out
+
+# ---------- local NumPy backend ----------
+
+_WORD = re.compile(r"\w+")
+
+class HashingEmbedder:
+    """Dependency-free text embedding: hashed words + char trigrams, L2-normalised."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            folded = "".join(c for c in unicodedata.normalize("NFKD", (text or "").casefold()) if not unicodedata.combining(c))
+            feats = _WORD.findall(folded)
+            feats += [w[i:i + 3] for w in feats if len(w) > 3 for i in range(len(w) - 2)]
+            for f in feats:
+                h = zlib.crc32(f.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1, norms)
+
+class NumpyVectorStore:
+    """
+    Persistent cosine index on a memory-mapped float32 matrix (vectors.f32) plus an
+    append-only row log (rows.jsonl). Deletes and re-adds tombstone the old row;
+    search scores only the live rows of the namespace and keeps the top k with
+    argpartition. Returned scores are cosine distances, like the Chroma store.
+    """
+
+    def __init__(self, path: str = "nestor_vectors", dim: int = 384,
+                 embed: Optional[Callable[[List[str]], np.ndarray]] = None, capacity: int = 1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.embed = embed or HashingEmbedder(dim)
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._meta: List[Dict[str, Any]] = []
+        self._texts: List[Optional[str]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_of: Dict[str, int] = {}
+        self._ns_rows: Dict[str, List[int]] = {}
+        self._ns_live: Dict[str, np.ndarray] = {}   # namespace -> live row indices (cached)
+        self._versions: Dict[str, int] = {}
+        self._replay()
+        self._open(max(capacity, len(self._ids)))
+        self._log = (self.path / "rows.jsonl").open("a", encoding="utf-8")
+
+    # -- persistence --
+
+    def _replay(self) -> None:
+        header = self.path / "index.json"
+        if header.exists():
+            dim = json.loads(header.read_text(encoding="utf-8"))["dim"]
+            if dim != self.dim:
+                raise ValueError(f"{self.path}: index built with dim={dim}, store opened with dim={self.dim}")
+        else:
+            header.write_text(json.dumps({"dim": self.dim}), encoding="utf-8")
+        rows = self.path / "rows.jsonl"
+        if not rows.exists():
+            return
+        alive: List[bool] = []
+        end = 0  # byte offset just past the last complete line
+        with rows.open("rb") as fh:
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break  # torn last line after a crash: cut off below
+                end += len(line)
+                rec = _parse_row(line)
+                if rec is None:
+                    log.warning("%s: skipping unreadable row log line at byte %d", rows, end - len(line))
+                    continue
+                if rec["op"] == "add":
+                    self._append_row(rec["id"], rec["meta"], rec.get("text"))
+                    alive.append(True)
+                else:
+                    row = rec["row"]
+                    alive[row] = False
+                    if self._row_of.get(self._ids[row]) == row:
+                        del self._row_of[self._ids[row]]
+        if end < rows.stat().st_size:
+            # new rows must start on a fresh line, or the next replay would stop at the tear
+            log.warning("%s: dropping torn row log tail after byte %d", rows, end)
+            with rows.open("r+b") as fh:
+                fh.truncate(end)
+        self._alive = np.array(alive, dtype=bool)
+
+    def _open(self, capacity: int) -> None:
+        f = self.path / "vectors.f32"
+        size = capacity * self.dim * 4
+        with open(f, "ab") as fh:
+            if fh.tell() < size:
+                fh.truncate(size)
+        self._capacity = capacity
+        self._mat = np.memmap(f, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _grow(self, needed: int) -> None:
+        if needed <= self._capacity:
+            return
+        self._mat.flush()
+        del self._mat
+        self._open(max(needed, self._capacity * 2))
+
+    def _append_row(self, full_id: str, meta: Dict[str, Any], text: Optional[str]) -> int:
+        row = len(self._ids)
+        self._ids.append(full_id)
+        self._meta.append(meta)
+        self._texts.append(text)
+        self._row_of[full_id] = row
+        ns = meta["namespace"]
+        self._ns_rows.setdefault(ns, []).append(row)
+        self._ns_live.pop(ns, None)
+        return row
+
+    # -- API --
+
+    def add(self, items: List[Dict[str, Any]], namespace: str = "default"):
+        if not items:
+            return
+        self.add_vectors(items, self.embed([i.get("text") or i.get("content") or "" for i in items]), namespace)
+
+    def add_vectors(self, items: List[Dict[str, Any]], vecs: np.ndarray, namespace: str = "default"):
+        vecs = self._normalise(vecs)
+        with self._lock:
+            start = len(self._ids)
+            self._grow(start + len(items))
+            self._mat[start:start + len(items)] = vecs
+            self._mat.flush()
+            self._alive = np.concatenate([self._alive, np.ones(len(items), dtype=bool)])
+            for i in items:
+                meta = {"namespace": namespace, **{k: v for k, v in i.items() if k not in ("id", "text", "content")}}
+                full_id = f"{namespace}:{i.get('id')}"
+                self._tombstone([full_id])  # upsert: the previous row for this id goes dead
+                text = i.get("text") or i.get("content")
+                self._append_row(full_id, meta, text)
+                self._log.write(json.dumps({"op": "add", "id": full_id, "meta": meta, "text": text}, ensure_ascii=False) + "\n")
+            self._log.flush()
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def delete(self, ids: List[str], namespace: str = "default"):
+        with self._lock:
+            self._tombstone([f"{namespace}:{i}" for i in ids])
+            self._log.flush()
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def version(self, namespace: str = "default") -> int:
+        """Bumped on every write to the namespace (lets callers cache search results)."""
+        return self._versions.get(namespace, 0)
+
+    def _tombstone(self, full_ids: List[str]) -> None:
+        for full_id in full_ids:
+            row = self._row_of.pop(full_id, None)
+            if row is None:
+                continue
+            self._alive[row] = False
+            self._ns_live.pop(self._meta[row]["namespace"], None)
+            self._log.write(json.dumps({"op": "del", "row": row}) + "\n")
+
+    def _live_rows(self, namespace: str) -> np.ndarray:
+        rows = self._ns_live.get(namespace)
+        if rows is None:
+            rows = np.array(self._ns_rows.get(namespace, ()), dtype=np.int64)
+            rows = self._ns_live[namespace] = rows[self._alive[rows]] if rows.size else rows
+        return rows
+
+    def _normalise(self, vecs: np.ndarray) -> np.ndarray:
+        vecs = np.asarray(vecs, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        return vecs / np.where(norms == 0, 1, norms)
+
+    def search(self, query: str, k: int = 5, namespace: str = "default") -> List[Tuple[str,float,Dict[str,Any]]]:
+        return self.search_by_vector(self.embed([query])[0], k=k, namespace=namespace)
+
+    def search_by_vector(self, vec: np.ndarray, k: int = 5, namespace: str = "default") -> List[Tuple[str,float,Dict[str,Any]]]:
+        q = self._normalise(vec)[0]
+        with self._lock:
+            rows = self._live_rows(namespace)
+            if rows.size == 0 or k <= 0:
+                return []
+            n = len(self._ids)
+            # large namespaces: one pass over the contiguous prefix beats a gathered copy
+            sims = (self._mat[:n] @ q)[rows] if rows.size * 2 > n else self._mat[rows] @ q
+            k = min(k, rows.size)
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.argsort(-sims[top], kind="stable")]
+            return [(self._ids[rows[i]], float(1.0 - sims[i]), self._meta[rows[i]]) for i in top]
+
+    def texts(self, full_ids: List[str]) -> List[Optional[str]]:
+        with self._lock:
+            rows = [self._row_of.get(i) for i in full_ids]
+            return [None if r is None else self._texts[r] for r in rows]
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def close(self) -> None:
+        with self._lock:
+            self._mat.flush()
+            self._log.close()
+
+def _parse_row(line: bytes) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        pass
+    # older logs: rows appended right after a torn line; keep the record behind the tear
+    start = line.rfind(b'{"op": ')
+    if start > 0:
+        try:
+            return json.loads(line[start:])
+        except json.JSONDecodeError:
+            pass
+    return None
+
+def make_vector_store(settings) -> Any:
+    if settings.vector_db == "chromadb":
+        return VectorStore()
+    if settings.vector_db == "faiss":
+        log.warning("faiss backend is not bundled; using the local NumPy index at %s", settings.vector_path)
+    return NumpyVectorStore(settings.vector_path)
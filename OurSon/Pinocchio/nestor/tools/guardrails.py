@@ -1,2 +1,19 @@
+from ..humor import safety
+
+# levels bleeped per mode, taken from the rating policy (safety.blocked): what a
+# rating rules out in is_safe() is exactly what its mode bleeps
+MODES = {"family": safety.blocked("G"), "adult": safety.blocked("18+")}
+
+def mode_for(rating: str) -> str:
+    return "family" if "soft" in safety.blocked(rating) else "adult"
+
 def sanitize(text: str, mode: str = "family") -> str:
-    return text  # TODO: implement policies
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    return safety.engine().sanitize(text, MODES[mode])
+
+def stream_sanitizer(mode: str = "family") -> safety.StreamSanitizer:
+    """feed() each chunk, flush() at the end; holds back only a term's length of text."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    return safety.engine().stream(MODES[mode])
@@ -1,8 +1,62 @@
 import random
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
 from ..storage.schemas import Joke
 
+RATINGS = ("G", "PG", "16+", "18+")   # each level allows itself and everything before it
+_LEVEL = {r: i for i, r in enumerate(RATINGS)}
+
+def _level(rating: str) -> int:
+    try:
+        return _LEVEL[rating]
+    except KeyError:
+        raise ValueError(f"Unknown rating: {rating}") from None
+
+class JokeSelector:
+    """
+    Jokes bucketed once, then drawn in O(1). Each pool (all jokes, and one per tag)
+    is sorted by rating level, so the pool for a rating is a prefix of it
+    (G ⊂ PG ⊂ 16+ ⊂ 18+) and a draw is one random index below the prefix end.
+    """
+
+    def __init__(self, jokes: Sequence[Joke], rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+        self._all = self._pool(jokes)
+        by_tag: Dict[str, List[Joke]] = {}
+        for j in jokes:
+            for tag in dict.fromkeys(j.tags):
+                by_tag.setdefault(tag, []).append(j)
+        self._by_tag = {tag: self._pool(group) for tag, group in by_tag.items()}
+
+    @staticmethod
+    def _pool(jokes: Sequence[Joke]) -> Tuple[List[Joke], List[int]]:
+        ordered = sorted(jokes, key=lambda j: _LEVEL[j.rating])   # stable: input order kept per level
+        levels = [_LEVEL[j.rating] for j in ordered]
+        return ordered, [bisect_right(levels, lvl) for lvl in range(len(RATINGS))]
+
+    def pool(self, rating: str = "G", theme: Optional[str] = None) -> Tuple[List[Joke], int]:
+        """(jokes, n): the first n jokes are exactly those allowed at `rating` (with `theme` as tag)."""
+        jokes, ends = self._all if theme is None else self._by_tag.get(theme, ([], [0] * len(RATINGS)))
+        return jokes, ends[_level(rating)]
+
+    def count(self, rating: str = "G", theme: Optional[str] = None) -> int:
+        return self.pool(rating, theme)[1]
+
+    def pick(self, rating: str = "G", theme: Optional[str] = None) -> Joke | None:
+        jokes, n = self.pool(rating, theme)
+        return jokes[self.rng.randrange(n)] if n else None
+
+    def pick_many(self, k: int, rating: str = "G", theme: Optional[str] = None, unique: bool = True) -> List[Joke]:
+        """k draws (fewer if the pool is smaller and unique=True); O(k), not O(pool)."""
+        jokes, n = self.pool(rating, theme)
+        if not n or k <= 0:
+            return []
+        if unique:
+            return [jokes[i] for i in self.rng.sample(range(n), min(k, n))]
+        return [jokes[self.rng.randrange(n)] for _ in range(k)]
+
 def pick(jokes: list[Joke], rating: str = "G", theme: str | None = None) -> Joke | None:
-    pool = [j for j in jokes if j.rating == rating or rating in ("PG","16+","18+") and j.rating in ("G","PG","16+","18+")]
-    if theme:
-        pool = [j for j in pool if theme in j.tags]
+    """One-off draw; build a JokeSelector once to pick repeatedly from the same jokes."""
+    level = _level(rating)
+    pool = [j for j in jokes if _LEVEL[j.rating] <= level and (theme is None or theme in j.tags)]
     return random.choice(pool) if pool else None
@@ -1,19 +1,178 @@
-import argparse, json, pathlib
-from nestor.storage.vector import VectorStore
+"""
+Streaming joke ingestion into the vector store.
+
+Files are parsed in a producer thread (any format JokeLibrary loads, plus .jsonl)
+and handed over in fixed-size batches through a bounded queue, so parsing and
+embedding overlap with inserts and memory stays flat whatever the corpus size.
+Each record gets a stable id (its own id, else a hash of its text) and a content
+hash; a KV checkpoint remembers the hash of every record written and the
+signature of every file fully ingested, so re-runs skip unchanged work and an
+interrupted run resumes where it stopped.
+"""
+import argparse, hashlib, json, queue, sys, threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from nestor.config import load_settings
+from nestor.io_utils.m3_jokes import iter_raw_jokes
+from nestor.logging import get_logger
+from nestor.storage.kv import KV
+from nestor.storage.vector import make_vector_store
+
+log = get_logger("ingest_jokes")
+
+SUFFIXES = {".json", ".ndjson", ".jsonl"}
+RATINGS = {"all-ages": "G", "PG-13": "PG", "18+": "18+"}
+_END = object()
+
+def list_files(path: Path) -> List[Path]:
+    if path.is_file():
+        return [path]
+    return sorted(f for f in path.rglob("*") if f.suffix.lower() in SUFFIXES)
+
+def to_item(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Vector-store item for one raw joke, or None when it has nothing to embed."""
+    if not isinstance(raw, dict):
+        return None
+    beats = raw.get("beats") if isinstance(raw.get("beats"), dict) else {}
+    text = " / ".join(beats[k] for k in ("setup", "turn", "punchline") if beats.get(k)) or (raw.get("text") or "").strip()
+    if not text:
+        return None
+    item = {
+        "id": str(raw.get("id") or "sha1-" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]),
+        "text": text,
+        "rating": raw.get("rating") or RATINGS.get(raw.get("audience"), "G"),
+    }
+    for k in ("lang", "style", "collection", "module", "safety"):
+        if raw.get(k):
+            item[k] = raw[k]
+    if raw.get("tags"):
+        item["tags"] = ",".join(map(str, raw["tags"]))  # store metadata must be scalar
+    return item
+
+def content_hash(item: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(item, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class Ingester:
+    def __init__(self, vec: Any, checkpoint: KV, namespace: str = "jokes", batch_size: int = 256, prefetch: int = 4):
+        self.vec = vec
+        self.kv = checkpoint
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue(maxsize=prefetch)
+        self._error: Optional[BaseException] = None
+        self.stats = {"files": 0, "files_skipped": 0, "records": 0, "invalid": 0, "unchanged": 0, "written": 0}
+
+    def _record_key(self, id_: str) -> str:
+        return f"ingest:{self.namespace}:{id_}"
+
+    def _file_key(self, f: Path) -> str:
+        return f"ingest-file:{self.namespace}:{f.resolve()}"
+
+    # -- producer: parse, hash, drop unchanged, embed --
+
+    def _batches(self, f: Path) -> Iterator[List[Dict[str, Any]]]:
+        batch: List[Dict[str, Any]] = []
+        for raw, _origin in iter_raw_jokes(f):
+            item = to_item(raw)
+            if item is None:
+                self.stats["invalid"] += 1
+                continue
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _prepare(self, batch: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, str], Any]:
+        self.stats["records"] += len(batch)
+        latest = {item["id"]: item for item in batch}  # duplicate ids in a batch: last one wins
+        hashes = {self._record_key(i): content_hash(item) for i, item in latest.items()}
+        seen = self.kv.get_many(hashes)
+        fresh = [item for i, item in latest.items() if seen.get(self._record_key(i)) != hashes[self._record_key(i)]]
+        self.stats["unchanged"] += len(batch) - len(fresh)
+        hashes = {self._record_key(item["id"]): hashes[self._record_key(item["id"])] for item in fresh}
+        embed = getattr(self.vec, "embed", None) if hasattr(self.vec, "add_vectors") else None
+        vecs = embed([item["text"] for item in fresh]) if embed is not None and fresh else None
+        return fresh, hashes, vecs
+
+    def _produce(self, files: List[Path]) -> None:
+        try:
+            for f in files:
+                st = f.stat()
+                sig = [st.st_size, st.st_mtime_ns]
+                if self.kv.get(self._file_key(f)) == sig:
+                    self.stats["files_skipped"] += 1
+                    continue
+                for batch in self._batches(f):
+                    self._queue.put(("batch", self._prepare(batch)))
+                self._queue.put(("file", (self._file_key(f), sig)))
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._queue.put(_END)
+
+    # -- consumer: insert, then checkpoint --
+
+    def run(self, path: Path) -> Dict[str, int]:
+        files = list_files(path)
+        producer = threading.Thread(target=self._produce, args=(files,), name="ingest-parse", daemon=True)
+        producer.start()
+        while True:
+            msg = self._queue.get()
+            if msg is _END:
+                break
+            kind, payload = msg
+            if kind == "file":
+                key, sig = payload
+                self.kv.set(key, sig)
+                self.stats["files"] += 1
+                continue
+            fresh, hashes, vecs = payload
+            if not fresh:
+                continue
+            if vecs is not None:
+                self.vec.add_vectors(fresh, vecs, namespace=self.namespace)
+            else:
+                self.vec.add(fresh, namespace=self.namespace)
+            self.kv.set_many(hashes)  # only after the store accepted the batch
+            self.stats["written"] += len(fresh)
+            log.info("ingested %d records (%d unchanged)", self.stats["written"], self.stats["unchanged"])
+        producer.join()
+        self.kv.flush()
+        if self._error is not None:
+            raise self._error
+        return self.stats
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--path", default="data/jokes", help="folder with .jsonl files")
+    ap.add_argument("--path", default="data/jokes", help="file or folder (.json/.ndjson/.jsonl, humor modules)")
+    ap.add_argument("--namespace", default="jokes")
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--checkpoint", default="ingest_checkpoint.db", help="SQLite file tracking ingested records")
     args = ap.parse_args()
-    vec = VectorStore()
-    items = []
-    for p in pathlib.Path(args.path).rglob("*.jsonl"):
-        for line in p.read_text(encoding="utf-8").splitlines():
-            obj = json.loads(line)
-            items.append({"id": obj.get("id") or str(len(items)), "text": obj["text"], "rating": obj.get("rating","G")})
-    if items:
-        vec.add(items, namespace="jokes")
-        print(f"Ingested {len(items)} jokes.")
+    settings = load_settings()
+    if settings.vector_db == "chromadb":
+        log.warning("chromadb store is in-memory: nothing persists after this run, checkpoint disabled")
+        args.checkpoint = ":memory:"
+    path = Path(args.path)
+    if not path.exists():
+        print(f"No such path: {path}")
+        return
+    vec = make_vector_store(settings)
+    kv = KV(args.checkpoint)
+    try:
+        stats = Ingester(vec, kv, namespace=args.namespace, batch_size=args.batch_size).run(path)
+    finally:
+        kv.close()
+        if hasattr(vec, "close"):
+            vec.close()
+    if stats["records"] or stats["files_skipped"]:
+        print("Ingested {written} jokes ({unchanged} unchanged, {invalid} invalid, "
+              "{files} files read, {files_skipped} files unchanged).".format(**stats))
     else:
         print("No jokes found.")
 
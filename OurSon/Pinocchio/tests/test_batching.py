@@ -0,0 +1,46 @@
+import asyncio
+from nestor.llm.batching import BatchDispatcher
+
+class _SlowModel:
+    def __init__(self):
+        self.running = self.peak = 0
+        self.prompts = []
+
+    async def agenerate(self, prompt, system=None, tools=None, **kwargs):
+        self.prompts.append(prompt)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if prompt == "boom":
+            raise RuntimeError("model down")
+        return f"<{prompt}>"
+
+def test_dispatcher_bounds_concurrency_and_routes_replies():
+    model = _SlowModel()
+
+    async def run():
+        d = BatchDispatcher(model, window=0.002, max_concurrency=2, max_queue=4)
+        prompts = [f"p{i % 15}" for i in range(20)] + ["boom"]
+        results = await asyncio.gather(*(d.agenerate(p) for p in prompts), return_exceptions=True)
+        stats = d.stats()
+        await d.aclose()
+        return prompts, results, stats
+
+    prompts, results, stats = asyncio.run(run())
+    assert results[:20] == [f"<{p}>" for p in prompts[:20]]
+    assert isinstance(results[20], RuntimeError)
+    assert model.peak <= 2
+    assert stats["requests"] == 21 and stats["upstream_calls"] + stats["merged"] == 21
+    assert stats["max_queue_depth"] <= 4 and stats["wait_ms_p99"] >= stats["wait_ms_p50"] > 0
+
+def test_dispatcher_survives_a_new_event_loop():
+    model = _SlowModel()
+    d = BatchDispatcher(model, window=0.001)
+
+    async def once(prompt):
+        return await asyncio.wait_for(d.agenerate(prompt), 1)
+
+    assert asyncio.run(once("a")) == "<a>"
+    assert asyncio.run(once("b")) == "<b>"  # second loop: collector restarted
+    asyncio.run(d.aclose())
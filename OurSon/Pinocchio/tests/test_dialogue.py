@@ -0,0 +1,125 @@
+import asyncio, importlib.util, json, time
+from pathlib import Path
+from fastapi.testclient import TestClient
+from nestor.dialogue.manager import DialogueManager
+from nestor.humor import safety
+from nestor.memory.episodic import EpisodicMemory
+from nestor.persona import registry as personas
+from nestor.storage.kv import KV
+
+class FakeLLMClient:
+    """In-process backend (no LM Studio): fixed reply, streamed in three chunks."""
+    model = "fake"
+
+    def generate(self, prompt, system=None, tools=None, **kwargs):
+        return f"Réponse à: {prompt[-20:]}"
+
+    def stream(self, prompt, system=None, tools=None, **kwargs):
+        yield self.generate(prompt, system=system)
+
+    async def agenerate(self, prompt, system=None, tools=None, **kwargs):
+        return self.generate(prompt, system=system)
+
+    async def astream(self, prompt, system=None, tools=None, **kwargs):
+        reply = self.generate(prompt, system=system)
+        for i in range(0, len(reply), len(reply) // 3 + 1):
+            await asyncio.sleep(0)
+            yield reply[i:i + len(reply) // 3 + 1]
+
+def _env(tmp_path, monkeypatch):
+    for k, v in {"VECTOR_DB": "numpy", "VECTOR_PATH": str(tmp_path / "vectors"), "KV_PATH": str(tmp_path / "nestor.db"),
+                 "LLM_CACHE_ENTRIES": "0", "KV_WRITE_BEHIND_MS": "60000"}.items():
+        monkeypatch.setenv(k, v)
+
+def _slow_writes(dm):
+    remember = dm.epi.remember
+    def slow(*args, **kwargs):
+        time.sleep(0.05)  # persist still running when the reply is already out
+        remember(*args, **kwargs)
+    dm.epi.remember = slow
+
+def _log(tmp_path, session):
+    kv = KV(str(tmp_path / "nestor.db"))
+    try:
+        return EpisodicMemory(kv).recent(10, session=session), kv.get(f"session:{session}")
+    finally:
+        kv.close()
+
+def test_async_and_streamed_turns_are_persisted_on_aclose(tmp_path, monkeypatch):
+    _env(tmp_path, monkeypatch)
+    dm = DialogueManager()
+    dm.llm._client = FakeLLMClient()
+    _slow_writes(dm)
+
+    async def scenario():
+        reply = await dm.respond_async("bonjour", {"session_id": "alice"})
+        chunks = [c async for c in dm.respond_stream("une blague ?", {"session_id": "alice"})]
+        assert len(chunks) > 1 and "".join(chunks) == FakeLLMClient().generate("une blague ?")
+        assert dm._background  # writes still in flight
+        await dm.aclose()
+        return reply
+
+    reply = asyncio.run(scenario())
+    assert reply == FakeLLMClient().generate("bonjour")
+    events, session = _log(tmp_path, "alice")
+    assert [e["u"] for e in events] == ["bonjour", "une blague ?"]
+    assert [t["user"] for t in session["history"]] == ["bonjour", "une blague ?"]
+    dm.kv.close()
+
+def test_chakra_applies_to_one_request_only(tmp_path, monkeypatch):
+    _env(tmp_path, monkeypatch)
+    dm = DialogueManager()
+    dm.llm._client = FakeLLMClient()
+    seen = []
+    monkeypatch.setattr(personas, "apply", lambda chakra, ctx: seen.append(chakra) or {"system": ""})
+    dm.respond("a", {"session_id": "alice", "chakra": "autre"})
+    dm.respond("b", {"session_id": "alice"})
+    assert seen == ["autre", "racine"] and dm.session({"session_id": "alice"}).chakra == "racine"
+    dm.kv.close()
+
+def test_anonymous_callers_share_no_history(tmp_path, monkeypatch):
+    _env(tmp_path, monkeypatch)
+    dm = DialogueManager()
+    dm.llm._client = FakeLLMClient()
+    histories = []
+    build = dm.prompts.build
+    monkeypatch.setattr(dm.prompts, "build", lambda *a, history=(), **kw: histories.append(list(history)) or build(*a, history=history, **kw))
+    dm.respond("mon secret")
+    dm.respond("bonjour")
+    asyncio.run(dm.respond_async("salut"))
+    assert histories == [[], [], []]
+    dm.kv.flush()
+    assert dm.kv.get("session:default") is None
+    dm.kv.close()
+
+def test_stream_endpoint(tmp_path, monkeypatch):
+    _env(tmp_path, monkeypatch)
+    spec = importlib.util.spec_from_file_location("fastapi_app", Path(__file__).resolve().parents[1] / "apps" / "fastapi_app.py")
+    api = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(api)
+    api.dm.llm._client = FakeLLMClient()
+    _slow_writes(api.dm)
+
+    with TestClient(api.app) as client:  # leaving the block runs the lifespan shutdown (aclose)
+        r = client.post("/respond/stream", json={"message": "salut", "session_id": "bob"})
+        assert r.status_code == 200 and r.text == FakeLLMClient().generate("salut")
+        assert client.post("/respond/stream", json={"message": "salut", "chakra": "inconnu"}).status_code == 400
+    events, _ = _log(tmp_path, "bob")
+    assert events == [{"u": "salut", "a": r.text}]
+    api.dm.kv.close()
+
+def test_corpus_taboos_guard_replies(tmp_path, monkeypatch):
+    _env(tmp_path, monkeypatch)
+    src = tmp_path / "module.json"
+    src.write_text(json.dumps({"module": {"id": "humor/test"}, "taboos": {"hard_limits": ["fake"], "bleep_symbol": "*"},
+                               "materials": {"seed_jokes": [{"id": "a", "text": "Une blague fake"}]}}), encoding="utf-8")
+    monkeypatch.setenv("JOKES_PATH", str(src))
+    dm = DialogueManager()
+    dm.llm._client = FakeLLMClient()
+    dm.llm._client.generate = lambda prompt, **kwargs: "Une réponse FAKE."
+    try:
+        assert list(dm.joke_safety.values()) == ["risky"]
+        assert dm.respond("bonjour") == "Une réponse *."
+    finally:
+        safety.configure(safety.SafetyEngine())
+        dm.kv.close()
@@ -0,0 +1,29 @@
+from nestor.memory.episodic import EpisodicMemory
+from nestor.storage.kv import KV
+
+def test_episodic_log_migrates_and_compacts(tmp_path):
+    kv = KV(str(tmp_path / "nestor.db"))
+    kv.set("episodic", [{"u": "bonjour", "a": "salut"}, {"u": "ça va?", "a": "oui"}])
+    epi = EpisodicMemory(kv)
+    assert kv.get("episodic") is None
+    assert epi.recent(1) == [{"u": "ça va?", "a": "oui"}]
+
+    for i in range(5):
+        epi.remember({"i": i}, ts=1000.0 + i)
+    epi.remember({"autre": True}, session="s2", ts=1002.0)
+    assert epi.recent(2) == [{"i": 3}, {"i": 4}]
+    assert epi.recent(5, session="s2") == [{"autre": True}]
+    assert epi.between(1001.0, 1003.0) == [{"i": 1}, {"i": 2}, {"autre": True}]
+
+    assert epi.compact(keep_last=3) == 4
+    assert epi.recent(10) == [{"i": 2}, {"i": 3}, {"i": 4}]
+    assert epi.compact(older_than=1003.0) == 2
+    assert epi.recent(10) + epi.recent(10, session="s2") == [{"i": 3}, {"i": 4}]
+
+def test_between_bounds_are_explicit(tmp_path):
+    epi = EpisodicMemory(KV(str(tmp_path / "nestor.db")))
+    for ts in (-5.0, 0.0, 3.0):
+        epi.remember({"ts": ts}, ts=ts)
+    assert epi.between(end=0) == [{"ts": -5.0}]
+    assert epi.between(start=0) == [{"ts": 0.0}, {"ts": 3.0}]
+    assert len(epi.between()) == 3
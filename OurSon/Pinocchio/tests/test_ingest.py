@@ -0,0 +1,42 @@
+import importlib.util, json
+from pathlib import Path
+from nestor.storage.kv import KV
+from nestor.storage.vector import NumpyVectorStore
+
+_spec = importlib.util.spec_from_file_location("ingest_jokes", Path(__file__).resolve().parents[1] / "scripts" / "ingest_jokes.py")
+ingest = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ingest)
+
+def test_ingest_batches_skips_unchanged_and_resumes(tmp_path):
+    src = tmp_path / "jokes"
+    src.mkdir()
+    (src / "a.jsonl").write_text("\n".join(json.dumps(j) for j in [
+        {"id": "a1", "text": "le pingouin du lundi"},
+        {"text": "une blague sans id"},
+        {"nope": 1},
+    ]), encoding="utf-8")
+    (src / "b.json").write_text(json.dumps([{"id": "b1", "lang": "fr", "style": "dad", "audience": "PG-13",
+                                             "beats": {"setup": "Le café", "punchline": "est moulu"}}]), encoding="utf-8")
+
+    def run():
+        vec = NumpyVectorStore(str(tmp_path / "vec"), dim=64)
+        kv = KV(str(tmp_path / "ckpt.db"))
+        stats = ingest.Ingester(vec, kv, batch_size=2).run(src)
+        kv.close()
+        return vec, stats
+
+    vec, stats = run()
+    assert stats["written"] == 3 and stats["invalid"] == 1
+    assert vec.search("café moulu", k=1, namespace="jokes")[0][2]["rating"] == "PG"
+    vec.close()
+
+    vec, stats = run()  # nothing changed: files skipped without parsing
+    assert stats["files_skipped"] == 2 and stats["written"] == 0
+    vec.close()
+
+    (src / "a.jsonl").write_text(json.dumps({"id": "a1", "text": "le pingouin du mardi"}) + "\n"
+                                 + json.dumps({"text": "une blague sans id"}), encoding="utf-8")
+    vec, stats = run()
+    assert stats["written"] == 1 and stats["unchanged"] == 1
+    assert len(vec) == 3
+    vec.close()
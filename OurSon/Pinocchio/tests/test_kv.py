@@ -0,0 +1,37 @@
+import threading
+from nestor.storage.kv import KV
+
+def test_kv_threads_and_write_behind(tmp_path):
+    kv = KV(str(tmp_path / "kv.db"))
+    assert kv.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def worker(t):
+        kv.set_many({f"t{t}/{i}": {"i": i} for i in range(50)})
+        assert kv.get(f"t{t}/49") == {"i": 49}
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert kv.get_many(["t0/1", "t3/2", "absent"]) == {"t0/1": {"i": 1}, "t3/2": {"i": 2}}
+
+    wb = KV(str(tmp_path / "kv.db"), write_behind=60)
+    wb.set("t0/1", "neuf")
+    wb.delete("t3/2")
+    assert wb.get("t0/1") == "neuf" and wb.get("t3/2") is None  # lu depuis le tampon
+    assert kv.get("t0/1") == {"i": 1}                              # pas encore écrit
+    wb.close()
+    assert kv.get("t0/1") == "neuf" and kv.get("t3/2") is None
+
+def test_write_behind_drops_only_the_failing_statement(tmp_path):
+    wb = KV(str(tmp_path / "kv.db"), write_behind=60, max_buffered=3)
+    wb.execute_write("CREATE TABLE t (x INTEGER)", defer=False)
+    wb.execute_write("INSERT INTO nosuch VALUES (1)")
+    wb.execute_write("INSERT INTO t VALUES (1)")
+    wb.set("a", 1)
+    wb.set("b", 2)  # tampon plein : écrit avant d'ajouter
+    assert len(wb._pending) + len(wb._queued) == 1
+    assert wb.conn.execute("SELECT x FROM t").fetchall() == [(1,)]
+    wb.close()
+    kv = KV(str(tmp_path / "kv.db"))
+    assert kv.get_many(["a", "b"]) == {"a": 1, "b": 2}
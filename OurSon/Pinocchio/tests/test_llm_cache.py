@@ -0,0 +1,62 @@
+import asyncio, threading, time
+from nestor.llm.cache import ResponseCache
+from nestor.llm.client import LLM
+
+def test_llm_cache_single_flight_and_tiers(tmp_path):
+    calls = []
+    def slow_generate(prompt, system=None, tools=None, **kwargs):
+        calls.append(prompt)
+        time.sleep(0.05)
+        return "réponse " + prompt
+
+    llm = LLM(backend="openai", cache=ResponseCache(max_entries=2, ttl=60, path=str(tmp_path / "cache.db")))
+    llm._client.generate = slow_generate
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(llm.generate("salut", system="S"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert out == ["réponse salut"] * 5 and calls == ["salut"]
+    assert llm.cache.stats["coalesced"] == 4
+
+    llm.generate("salut", system="S", temperature=0.2)  # autres paramètres → autre clé
+    llm.generate("b")
+    llm.generate("c")                                    # LRU mémoire (2) : "salut" évincé
+    assert llm.generate("salut", system="S") == "réponse salut"
+    assert llm.cache.stats["disk_hits"] == 1 and len(calls) == 4
+
+    fresh = LLM(backend="openai", cache=ResponseCache(ttl=60, path=str(tmp_path / "cache.db")))
+    assert "".join(fresh.stream("b")) == "réponse b"    # relu depuis SQLite, sans appel
+    expiring = LLM(backend="openai", cache=ResponseCache(ttl=0))
+    expiring.generate("x")
+    assert expiring.cache.get(expiring._key("x", None, None, {})) is None
+
+    async def agenerate(prompt, system=None, tools=None, **kwargs):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return prompt.upper()
+    llm._client.agenerate = agenerate
+    async def burst():
+        return await asyncio.gather(*(llm.agenerate("async") for _ in range(10)))
+    assert asyncio.run(burst()) == ["ASYNC"] * 10 and calls.count("async") == 1
+
+def test_async_leader_cancellation_hands_over(tmp_path):
+    cache = ResponseCache(ttl=60, path=str(tmp_path / "cache.db"))
+    calls = []
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def scenario():
+        leader = asyncio.create_task(cache.aget_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(cache.aget_or_compute("k", compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers), leader.cancelled()
+
+    assert asyncio.run(scenario()) == (["ok"] * 3, True)
+    assert len(calls) == 2  # le leader annulé, puis un seul des suiveurs
+    assert ResponseCache(ttl=60, path=str(tmp_path / "cache.db")).get("k") == "ok"
@@ -0,0 +1,69 @@
+import asyncio, json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+httpx = pytest.importorskip("httpx")
+from nestor.llm.lmstudio import LMStudioClient
+
+class _FakeLMStudio(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disconnected = threading.Event()
+    connections = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        _FakeLMStudio.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if not body.get("stream"):
+            data = json.dumps({"choices": [{"message": {"content": "bonjour " + body["messages"][1]["content"]}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        n = 3 if body["messages"][1]["content"] == "court" else 500
+        try:
+            for i in range(n):
+                chunk = {"choices": [{"delta": {"content": f"t{i} "}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(0.005)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            _FakeLMStudio.disconnected.set()
+        self.close_connection = True
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _FakeLMStudio)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    srv.shutdown()
+
+def test_pooled_generate_and_sse_stream(server):
+    client = LMStudioClient(base_url=server)
+    assert client.generate("a") == "bonjour a"
+    assert client.generate("b") == "bonjour b"
+    assert len(_FakeLMStudio.connections) == 1  # keep-alive: une seule connexion TCP
+    assert list(client.stream("court")) == ["t0 ", "t1 ", "t2 "]
+
+    gen = client.stream("long")
+    assert next(gen) == "t0 "
+    gen.close()  # abandon côté client → la réponse amont est fermée
+    assert _FakeLMStudio.disconnected.wait(5)
+
+    async def run():
+        chunks = [c async for c in client.astream("court")]
+        reply = await client.agenerate("c")
+        await client.aclose()
+        return chunks, reply
+    assert asyncio.run(run()) == (["t0 ", "t1 ", "t2 "], "bonjour c")
+    client.close()
@@ -0,0 +1,180 @@
+import json, os
+from dataclasses import asdict
+from nestor.io_utils.m3_jokes import JokeLibrary
+
+def _write_ndjson(path, rows):
+    path.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in rows) + "\n", encoding="utf-8")
+
+def _joke(i, **kw):
+    base = {"id": f"j{i}", "lang": "fr", "style": "dad", "audience": "all-ages", "text": f"blague {i}"}
+    base.update(kw)
+    return base
+
+def test_snapshot_reuses_unchanged_files(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    _write_ndjson(corpus / "a.ndjson", [_joke(1, tags=["chat"]), _joke(2)])
+    _write_ndjson(corpus / "b.ndjson", [_joke(3, lang="en")])
+    snap = tmp_path / "snap.pkl"
+
+    first = JokeLibrary.from_path(corpus, snapshot=snap)
+    assert snap.exists() and first.size == 3
+
+    again = JokeLibrary.from_path(corpus, snapshot=snap)
+    assert [j.id for j in again.all()] == [j.id for j in first.all()]
+    assert [j.id for j in again.search(include_tags=["chat"])] == ["j1"]
+
+    _write_ndjson(corpus / "b.ndjson", [_joke(3, lang="en"), _joke(4, lang="en")])
+    os.utime(corpus / "b.ndjson", ns=(1, 1))
+    updated = JokeLibrary.from_path(corpus, snapshot=snap)
+    assert sorted(j.id for j in updated.search(lang="en")) == ["j3", "j4"]
+
+def test_search_intersects_all_indexes(tmp_path):
+    rows = [_joke(i, tags=["chat"] if i % 2 else ["chien"], safety="safe" if i % 3 else "risky",
+                  collection="Standup" if i < 50 else "sitcom") for i in range(100)]
+    path = tmp_path / "jokes.ndjson"
+    _write_ndjson(path, rows)
+    lib = JokeLibrary.from_path(path)
+
+    got = [j.id for j in lib.search(include_tags=["CHAT"], safety="safe", collection="standup")]
+    assert got == [f"j{i}" for i in range(50) if i % 2 and i % 3]
+    assert lib.search(include_tags=["inconnu"]) == []
+    assert len(lib.search(lang="fr", limit=7)) == 7
+    assert len(lib.search(lang="fr", limit="3")) == 3 and lib.search(lang="fr", limit=0) == []
+
+def test_text_query_is_accent_insensitive_substring(tmp_path):
+    rows = [_joke(1, text="L’élève a mangé la pizza"), _joke(2, text="Une chaussette perdue", tags=["Lessive"]),
+            _joke(3, beats={"setup": "Pourquoi le café?", "punchline": "Il était moulu."})]
+    path = tmp_path / "jokes.ndjson"
+    _write_ndjson(path, rows)
+    lib = JokeLibrary.from_path(path)
+
+    assert [j.id for j in lib.search(text_query="ELEVE")] == ["j1"]
+    assert [j.id for j in lib.search(text_query="l'élève a mang")] == ["j1"]
+    assert [j.id for j in lib.search(text_query="ssive")] == ["j2"]
+    assert [j.id for j in lib.search(text_query="cafe")] == ["j3"]
+    assert lib.search(text_query="pizza froide") == []
+
+def test_concatenated_humor_modules_are_streamed(tmp_path):
+    module = {
+        "meta": {"language": "fr-CA", "authors": ["Martin"]},
+        "module": {"id": "humor/test", "priority": 40, "active": True},
+        "persona": {"edginess": "G"},
+        "style_weights": {"wordplay": 1.0},
+        "materials": {"seed_jokes": ["Pourquoi la pluie tombe?", "Un frigo triste."]},
+    }
+    scenes = {"chakra": "Seuil", "sitcoms": [{"id": 1, "titre": "Pizza", "scene": ["Nestor : « Alibi! »", "Alibast : « Reçu. »"]}]}
+    path = tmp_path / "standup.json"
+    path.write_text(json.dumps(module, indent=2) + "\n{\n  \"broken\": [1 2]\n}\n" + json.dumps(scenes, indent=2),
+                    encoding="utf-8")
+    lib = JokeLibrary.from_path(path)
+
+    assert [j.id for j in lib.all()] == ["humor/test/seed_jokes/1", "humor/test/seed_jokes/2", "standup#3/sitcoms/1"]  # 3e document du fichier
+    assert lib.modules["humor/test"]["priority"] == 40
+    first, scene = lib.all()[0], lib.all()[2]
+    assert (first.lang, first.audience, first.collection, first.module) == ("fr", "all-ages", "standup", "humor/test")
+    assert scene.characters == ["Nestor", "Alibast"] and scene.notes == "Pizza"
+
+def test_parallel_load_matches_sequential(tmp_path):
+    for f in range(4):
+        _write_ndjson(tmp_path / f"f{f}.ndjson", [_joke(f * 10 + i, tags=[f"t{i % 3}"]) for i in range(10)])
+    seq = JokeLibrary.from_path(tmp_path)
+    par = JokeLibrary.from_path(tmp_path, workers=2)
+    assert [j.id for j in par.all()] == [j.id for j in seq.all()]
+    assert [j.id for j in par.search(include_tags=["t1"], text_query="blague 2")] == \
+           [j.id for j in seq.search(include_tags=["t1"], text_query="blague 2")]
+
+def test_reload_applies_only_changed_files(tmp_path):
+    _write_ndjson(tmp_path / "a.ndjson", [_joke(i, tags=["chat"]) for i in range(40)])
+    _write_ndjson(tmp_path / "b.ndjson", [_joke(100, text="une girafe"), _joke(101)])
+    lib = JokeLibrary.from_path(tmp_path)
+    before = lib._state
+
+    _write_ndjson(tmp_path / "b.ndjson", [_joke(102, text="un zèbre", tags=["chat"])])
+    os.utime(tmp_path / "b.ndjson", ns=(1, 1))
+    _write_ndjson(tmp_path / "c.ndjson", [_joke(200, lang="en")])
+    assert lib.reload() == {"added": 1, "changed": 1, "removed": 0}
+
+    assert before.jokes[40].id == "j100"  # l'ancien état publié reste intact
+    assert lib.size == 42 and lib.search(text_query="girafe") == []
+    assert [j.id for j in lib.search(text_query="zebr")] == ["j102"]
+    assert len(lib.search(include_tags=["chat"])) == 41
+    assert [j.id for j in lib.search(lang="en")] == ["j200"]
+    fresh = JokeLibrary.from_path(tmp_path)
+    assert sorted(j.id for j in lib.all()) == sorted(j.id for j in fresh.all())
+
+    (tmp_path / "a.ndjson").unlink()
+    assert lib.reload()["removed"] == 1
+    assert [j.id for j in lib.all()] == ["j102", "j200"]  # compacté (> 25 % de trous)
+    assert lib.reload() == {"added": 0, "changed": 0, "removed": 0}
+
+    dense = tmp_path / "dense"
+    dense.mkdir()
+    _write_ndjson(dense / "a.ndjson", [_joke(i, tags=["x", "y"] if i < 2 else []) for i in range(10)])
+    lib = JokeLibrary.from_path(dense)
+    _write_ndjson(dense / "b.ndjson", [_joke(1000 + i, tags=["y"] if i < 20 else []) for i in range(1000)])
+    lib.reload()  # "x" reste un bitmap (court), "y" devient un array plus long
+    assert [j.id for j in lib.search(include_tags=["x", "y"])] == ["j0", "j1"]
+
+def test_compact_store_round_trips_jokes(tmp_path):
+    rows = [_joke(1, tags=["chat", "lundi"], characters=["Nestor"], safety="safe"),
+            _joke(2, text=None, beats={"setup": "Toc toc", "punchline": "Personne."}, delivery="sec")]
+    path = tmp_path / "jokes.ndjson"
+    _write_ndjson(path, rows)
+    lib = JokeLibrary.from_path(path)
+
+    first, second = lib.all()
+    assert {k: v for k, v in asdict(first).items() if k in rows[0]} == rows[0]
+    assert first.collection == "jokes" and first.module is None
+    assert second.render() == "Toc toc / Personne.  (delivery: sec)"
+    assert first.style is second.style  # valeurs catégorielles internées
+    first.tags.append("muté")
+    assert lib.search(lang="fr")[0].tags == ["chat", "lundi"]
+    assert lib.random(seed=1, include_tags=["chat"]).id == "j1"
+
+def test_weighted_sampling_avoids_session_repeats(tmp_path):
+    def module(mod_id, priority, jokes):
+        return {"module": {"id": mod_id, "priority": priority}, "style_weights": {"wordplay": 1.0},
+                "materials": {"seed_jokes": jokes}}
+    path = tmp_path / "mix.json"
+    path.write_text(json.dumps(module("humor/fort", 90, [f"fort {i}" for i in range(5)])) + "\n" +
+                    json.dumps(module("humor/faible", 10, [f"faible {i}" for i in range(5)])), encoding="utf-8")
+    lib = JokeLibrary.from_path(path)
+
+    draws = [lib.random(seed=s).module for s in range(300)]
+    assert draws.count("humor/fort") > 3 * draws.count("humor/faible")
+    assert lib.random(seed=1, style_weights={"wordplay": 0.0}) is None  # affinité nulle → exclue
+
+    told = [lib.random(seed=s, session="alice").id for s in range(10)]
+    assert len(set(told)) == 10  # toute la bibliothèque avant la moindre répétition
+    assert lib.random(session="alice") is not None
+    assert len({j.id for j in lib.sample(4, session="bob", lang="fr")}) == 4
+
+def test_mapped_file_matches_in_memory_library(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    _write_ndjson(corpus / "a.ndjson", [_joke(i, tags=["chat"] if i % 2 else ["Chien"], characters=["Nestor"] if i % 5 else [],
+                                              text=f"L’élève n°{i} a mangé la pizza", safety="safe") for i in range(80)])
+    _write_ndjson(corpus / "b.ndjson", [_joke(100, lang="en", text=None, beats={"setup": "Toc toc", "punchline": "Café."},
+                                              delivery="sec", notes="n")])
+    mapped = tmp_path / "lib.m3map"
+    memory = JokeLibrary.from_path(corpus)
+    built = JokeLibrary.from_path(corpus, mapped=mapped)
+    assert mapped.exists()
+    built_at = mapped.stat().st_mtime_ns
+    lib = JokeLibrary.from_path(corpus, mapped=mapped)  # à jour : simplement mappé
+    assert mapped.stat().st_mtime_ns == built_at
+
+    assert lib.size == memory.size == 81 and lib.fingerprint == memory.fingerprint
+    assert [asdict(j) for j in lib.all()] == [asdict(j) for j in memory.all()] == [asdict(j) for j in built.all()]
+    for query in ({"include_tags": ["chien"]}, {"lang": "en"}, {"text_query": "ELEVE n°1"},
+                  {"text_query": "izz", "include_characters": ["nestor"], "limit": 5}, {"text_query": "cafe"},
+                  {"collection": "a", "safety": "safe"}, {"style": "inconnu"}):
+        assert [j.id for j in lib.search(**query)] == [j.id for j in memory.search(**query)], query
+    assert [j.id for j in lib.sample(5, seed=3, lang="fr")] == [j.id for j in memory.sample(5, seed=3, lang="fr")]
+
+    _write_ndjson(corpus / "b.ndjson", [_joke(101, lang="en")])
+    os.utime(corpus / "b.ndjson", ns=(1, 1))
+    assert lib.reload() == {"added": 0, "changed": 1, "removed": 0}
+    assert [j.id for j in lib.search(lang="en")] == ["j101"]
+    assert [j.id for j in JokeLibrary.open_mapped(mapped).search(lang="en")] == ["j101"]
@@ -0,0 +1,27 @@
+import pytest
+from nestor.obs import events
+from nestor.obs.metrics import Histogram, Metrics, span
+
+def test_histogram_spans_counters_and_sources():
+    h = Histogram()
+    for ms in range(1, 101):
+        h.observe(ms / 1000)
+    assert h.count == 100 and h.max == 0.1
+    assert 0.050 <= h.percentile(0.5) <= 0.050 * 1.19
+    assert 0.099 <= h.percentile(0.99) <= 0.1
+
+    m = Metrics()
+    events.clear()
+    with span("stage", m):
+        pass
+    with pytest.raises(ValueError):
+        with span("stage", m):
+            raise ValueError
+    m.incr("hits", 3)
+    m.register("cache", lambda: {"size": 7})
+    m.register("broken", lambda: 1 / 0)
+    snap = m.snapshot()
+    assert snap["histograms"]["stage"]["count"] == 2
+    assert snap["counters"] == {"hits": 3, "stage.errors": 1}
+    assert snap["sources"]["cache"] == {"size": 7} and "error" in snap["sources"]["broken"]
+    assert [e["ok"] for e in events.recent(2)] == [True, False]
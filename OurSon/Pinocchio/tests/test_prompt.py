@@ -0,0 +1,21 @@
+from nestor.dialogue.prompt import PromptBuilder
+from nestor.dialogue.tokens import count_tokens
+
+def test_prompt_keeps_stable_prefix_and_fits_budget():
+    builder = PromptBuilder(budget=200, context_budget=40, history_budget=120, max_item_chars=60)
+    history = [{"user": f"question {i}", "assistant": "réponse " * 10} for i in range(10)]
+    retrieval = [{"id": "texts:1", "score": 0.1, "meta": {}, "text": "  Le café   du matin  "},
+                 {"id": "texts:2", "score": 0.2, "meta": {}, "text": "Le café du matin"},
+                 {"id": "texts:3", "score": 0.3, "meta": {}, "text": None},
+                 {"id": "texts:4", "score": 0.4, "meta": {}, "text": "x" * 500}]
+
+    p = builder.build("Tu es Nestor.", "Et demain ?", history=history, retrieval=retrieval)
+    assert p.system == "Tu es Nestor."
+    assert p.user.startswith("Context:\n- Le café du matin\n") and p.user.endswith("\n\nEt demain ?")
+    assert "texts:" not in p.user and "score" not in p.user and p.user.count("café") == 1
+    assert p.messages[-1] == {"role": "assistant", "content": history[-1]["assistant"]}
+    assert p.messages[-2]["content"] == "question 9" and len(p.messages) < 2 * len(history)
+    assert p.tokens <= 200
+
+    bare = builder.build("Tu es Nestor.", "Salut", history=[], retrieval=[])
+    assert bare.user == "Salut" and bare.messages == [] and bare.tokens == count_tokens("Tu es Nestor.") + count_tokens("Salut")
@@ -0,0 +1,95 @@
+import json
+from nestor.humor import safety
+from nestor.io_utils.m3_jokes import JokeLibrary
+from nestor.tools import guardrails
+
+MODULE = {
+    "module": {"id": "humor/test", "priority": 50, "active": True},
+    "taboos": {"hard_limits": ["violence explicite", "haine"], "soft_limits": ["cynisme"], "bleep_symbol": "⚡"},
+    "materials": {"seed_jokes": [
+        {"id": "ok", "text": "Une chaîne de vélo qui rit"},
+        {"id": "soft", "text": "Un peu de CYNISME au café"},
+        {"id": "hard", "text": "De la Violence   explicite, non."},
+    ]},
+}
+
+def test_engine_folds_screens_sanitizes_and_streams(tmp_path):
+    src = tmp_path / "module.json"
+    src.write_text(json.dumps(MODULE, ensure_ascii=False), encoding="utf-8")
+    lib = JokeLibrary.from_path(src)
+    verdicts = safety.guard_library(lib)
+    engine = safety.engine()
+    try:
+        assert {k.rsplit("/", 1)[1]: v for k, v in verdicts.items()} == {"ok": "safe", "soft": "borderline", "hard": "risky"}
+        assert engine.bleep == "⚡"
+        assert engine.screen(["Une chaîne", "le cynisme", "la HAINE", "violence tout court"]) == ["safe", "borderline", "risky", "safe"]
+        assert safety.is_safe("le cynisme", "PG") and not safety.is_safe("le cynisme", "G")
+        assert not safety.is_safe("la haine", "18+")
+
+        text = "Haine! Une chaîne, du cynisme et de la violence explicite."
+        assert guardrails.sanitize(text) == "⚡! Une chaîne, du ⚡ et de la ⚡."
+        assert guardrails.sanitize(text, "adult") == "⚡! Une chaîne, du cynisme et de la ⚡."
+        for rating in ("G", "PG", "16+", "18+", "inconnu"):  # one policy: is_safe and the bleeped levels agree
+            assert guardrails.MODES[guardrails.mode_for(rating)] == safety.blocked(rating)
+        assert "cynisme" in guardrails.sanitize("du cynisme", guardrails.mode_for("PG"))
+        for size in (1, 4, 9):
+            stream = guardrails.stream_sanitizer()
+            out = "".join(stream.feed(text[i:i + size]) for i in range(0, len(text), size)) + stream.flush()
+            assert out == guardrails.sanitize(text)
+    finally:
+        safety.configure(safety.SafetyEngine())
+
+def test_terms_and_text_share_the_joke_index_folding():
+    engine = safety.SafetyEngine({"l'ennemi": "hard", "cœur brisé": "soft"}, bleep="*")
+    assert engine.verdict("Voici l’ennemi") == "risky"
+    assert engine.verdict("un COEUR brise") == "borderline"
+    assert engine.sanitize("L’Ennemi au cœur brisé") == "* au *"
+
+def test_stream_holds_back_long_whitespace_runs():
+    engine = safety.SafetyEngine({"violence crue": "hard"}, bleep="*")
+    text = "de la violence          crue ici, puis violence\n\n\n\n\n\n\n\n\n\n\n\ncrue"
+    expected = engine.sanitize(text)
+    assert expected == "de la * ici, puis *"
+    for size in (1, 2, 3, 5, 8, 13):
+        stream = engine.stream()
+        out = "".join(stream.feed(text[i:i + size]) for i in range(0, len(text), size)) + stream.flush()
+        assert out == expected
+
+def test_stream_matches_batch_on_decomposed_text():
+    engine = safety.SafetyEngine({"cynisme": "soft"}, bleep="*")
+    for text in ("e\u0301cynisme !", "ou\u0300 le cynisme, e\u0301\u0301cynisme de trop", "\u0301\u0301cynisme ici"):
+        expected = engine.sanitize(text)
+        for size in (1, 2, 3):
+            stream = engine.stream()
+            out = "".join(stream.feed(text[i:i + size]) for i in range(0, len(text), size)) + stream.flush()
+            assert out == expected, (text, size)
+    assert engine.sanitize("e\u0301cynisme !") == "e\u0301cynisme !"
+
+def test_guard_library_labels_unrated_jokes(tmp_path):
+    src = tmp_path / "module.json"
+    src.write_text(json.dumps(MODULE, ensure_ascii=False), encoding="utf-8")
+    lib = JokeLibrary.from_path(src)
+    try:
+        safety.guard_library(lib)
+        assert [j.id.rsplit("/", 1)[1] for j in lib.search(safety="risky")] == ["hard"]
+        assert [j.safety for j in lib.search(safety="borderline")] == ["borderline"]
+    finally:
+        safety.configure(safety.SafetyEngine())
+
+def test_guard_library_verdicts_reach_a_mapped_library(tmp_path, capsys):
+    src = tmp_path / "module.json"
+    src.write_text(json.dumps(MODULE, ensure_ascii=False), encoding="utf-8")
+    try:
+        for _ in range(2):  # construit puis écrit le fichier, puis simplement rouvert
+            lib = JokeLibrary.from_path(src, mapped=tmp_path / "jokes.m3map", prepare=safety.guard_library)
+            safety.guard_library(lib)
+            assert [j.id.rsplit("/", 1)[1] for j in lib.search(safety="risky")] == ["hard"]
+        assert "M3:WARN" not in capsys.readouterr().err
+
+        (tmp_path / "bare").mkdir()
+        src.rename(tmp_path / "bare" / "module.json")
+        lib = JokeLibrary.from_path(tmp_path / "bare", mapped=tmp_path / "bare.m3map")
+        safety.guard_library(lib)
+        assert lib.search(safety="risky") == [] and "verdicts ignorés" in capsys.readouterr().err
+    finally:
+        safety.configure(safety.SafetyEngine())
@@ -0,0 +1,29 @@
+import random
+import pytest
+from nestor.storage.schemas import Joke
+from nestor.tools.select_joke import JokeSelector, pick
+
+JOKES = [
+    Joke(id="g", text="g", rating="G", tags=["chat"]),
+    Joke(id="pg", text="pg", rating="PG", tags=["chat", "chat"]),
+    Joke(id="16", text="16", rating="16+", tags=["bureau"]),
+    Joke(id="18", text="18", rating="18+", tags=["chat"]),
+]
+
+def test_selector_ladders_tags_and_bulk_draws():
+    sel = JokeSelector(JOKES, rng=random.Random(0))
+    assert [sel.count(r) for r in ("G", "PG", "16+", "18+")] == [1, 2, 3, 4]
+    assert [sel.count(r, "chat") for r in ("G", "PG", "16+", "18+")] == [1, 2, 2, 3]
+    assert {sel.pick("PG").id for _ in range(50)} == {"g", "pg"}
+    assert sel.pick("PG", theme="bureau") is None and sel.pick("16+", theme="bureau").id == "16"
+    assert sel.pick("18+", theme="inconnu") is None
+
+    many = sel.pick_many(10, rating="16+")
+    assert sorted(j.id for j in many) == ["16", "g", "pg"]
+    assert len(sel.pick_many(10, rating="G", unique=False)) == 10
+    with pytest.raises(ValueError):
+        sel.pick("R")
+
+    assert pick(JOKES, rating="G").id == "g"
+    assert {pick(JOKES, rating="PG").id for _ in range(50)} == {"g", "pg"}  # PG used to match 18+ too
+    assert pick(JOKES, rating="PG", theme="bureau") is None
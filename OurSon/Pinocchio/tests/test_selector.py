@@ -0,0 +1,31 @@
+import json, os
+from nestor.humor.selector import JokeRanker, rank_candidates
+from nestor.io_utils.m3_jokes import JokeLibrary
+
+def test_ranker_scores_context_blends_style_and_recency_and_caches(tmp_path):
+    rows = [
+        {"id": "pingouin", "lang": "fr", "style": "dad", "audience": "all-ages", "text": "Le pingouin glisse sur la banquise"},
+        {"id": "pingouins", "lang": "fr", "style": "standup", "audience": "all-ages", "text": "Deux pingouins sur une banquise"},
+        {"id": "cafe", "lang": "fr", "style": "dad", "audience": "all-ages", "text": "Un café serré au comptoir"},
+    ]
+    src = tmp_path / "jokes.ndjson"
+    src.write_text("\n".join(json.dumps(r) for r in rows), encoding="utf-8")
+    lib = JokeLibrary.from_path(src)
+    cache = tmp_path / "ranker.npz"
+    ranker = JokeRanker.from_library(lib, cache=cache)
+
+    assert [i for i, _ in ranker.rank("un pingouin sur la banquise", k=2)] == ["pingouin", "pingouins"]
+    assert ranker.rank("pingouin banquise", k=1, style_weights={"dad": 0.1})[0][0] == "pingouins"
+    assert ranker.rank("pingouin banquise", k=1, recent={"pingouin", "pingouins"})[0][0] == "cafe"
+    assert [i for i, _ in ranker.rank("café", candidates=["cafe", "inconnu"], k=5)] == ["cafe"]
+
+    cached = JokeRanker.from_library(JokeLibrary.from_path(src), cache=cache)
+    assert cached.signature == ranker.signature and cached.rank("pingouin banquise", k=3) == ranker.rank("pingouin banquise", k=3)
+    assert JokeRanker.from_library(lib, cache=tmp_path / "ranker.npz" / "not-a-dir").ids == ranker.ids  # unwritable: warns
+    src.write_text(json.dumps(rows[2]), encoding="utf-8")
+    os.utime(src, ns=(1, 1))
+    assert JokeRanker.from_library(JokeLibrary.from_path(src), cache=cache).ids == ["cafe"]
+
+    cands = [{"id": "a", "text": "un chat sur le toit"}, {"id": "b", "text": "le pingouin au café"}]
+    assert [c["id"] for c in rank_candidates(cands, "pingouin")] == ["b", "a"]
+    assert rank_candidates(cands, "pingouin", ranker=ranker)[0] is cands[1]
@@ -0,0 +1,22 @@
+from nestor.memory.semantic import SemanticMemory
+from nestor.storage.vector import NumpyVectorStore
+
+def test_recall_caches_embeddings_and_results_until_namespace_write(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "vec"), dim=64)
+    store.add([{"id": 1, "text": "bonjour Nestor"}, {"id": 2, "text": "la pizza du lundi"}], namespace="texts")
+    sem = SemanticMemory(store)
+
+    first = sem.recall("Bonjour   nestor", k=1)
+    assert first[0]["id"] == "texts:1"
+    assert sem.recall("bonjour nestor", k=1) == first
+    assert sem.stats["hits"] == 1 and sem.stats["embeds"] == 1
+
+    store.add([{"id": 3, "text": "pizza"}], namespace="jokes")  # other namespace: still cached
+    sem.recall("bonjour nestor", k=1)
+    assert sem.stats["hits"] == 2
+
+    store.add([{"id": 3, "text": "Bonjour Nestor !"}], namespace="texts")
+    assert {h["id"] for h in sem.recall("bonjour nestor", k=2)} == {"texts:1", "texts:3"}
+    sem.recall("bonjour nestor", k=1)
+    assert sem.stats["hits"] == 2 and sem.stats["embeds"] == 1 and sem.stats["embed_hits"] == 2
+    store.close()
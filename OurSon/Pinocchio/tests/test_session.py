@@ -0,0 +1,24 @@
+from nestor.dialogue.session import SessionStore
+from nestor.storage.kv import KV
+
+def test_sessions_are_bounded_evicted_and_reloaded(tmp_path):
+    kv = KV(str(tmp_path / "nestor.db"))
+    store = SessionStore(kv, max_sessions=4, idle_ttl=60, max_turns=3, shards=2)
+    alice = store.get("alice")
+    for i in range(5):
+        alice.add_turn(f"question {i}", "réponse " * 20)
+    assert [t["user"] for t in alice.history] == ["question 2", "question 3", "question 4"]
+    assert [t["user"] for t in alice.window(60)] == ["question 4"]
+    store.save(alice)
+    assert len(store.get("bob").history) == 0
+
+    for i in range(20):
+        store.get(f"user{i}")
+    assert len(store) <= 4
+    reloaded = store.get("alice")
+    assert reloaded is not alice and list(reloaded.history) == list(alice.history)
+
+    store.idle_ttl = 0
+    again = store.get("alice")  # idle: dropped from memory, reloaded from the KV
+    assert again is not reloaded and list(again.history) == list(alice.history)
+    kv.close()
@@ -1,6 +1,12 @@
+import asyncio
 from nestor.dialogue.manager import DialogueManager
 
 def test_respond_smoke():
     dm = DialogueManager()
     out = dm.respond("Hello")
     assert isinstance(out, str)
+
+def test_respond_async_smoke():
+    dm = DialogueManager()
+    out = asyncio.run(dm.respond_async("Hello"))
+    assert isinstance(out, str)
@@ -0,0 +1,43 @@
+from nestor.storage.vector import NumpyVectorStore
+
+def test_numpy_store_persists_filters_and_tombstones(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "vec"), dim=64, capacity=2)
+    store.add([{"id": 1, "text": "la pizza froide du lundi"}, {"id": 2, "text": "un chat qui dort"},
+               {"id": 3, "text": "le café du matin", "lang": "fr"}], namespace="texts")
+    store.add([{"id": 1, "text": "pizza pizza pizza"}], namespace="jokes")
+    hits = store.search("pizza", k=2, namespace="texts")
+    assert hits[0][0] == "texts:1" and hits[0][2] == {"namespace": "texts"}
+    assert [h[0] for h in store.search("pizza", k=5, namespace="jokes")] == ["jokes:1"]
+
+    store.delete([1], namespace="texts")
+    store.add([{"id": 2, "text": "un chat sur la pizza"}], namespace="texts")  # upsert
+    assert len(store) == 3
+    assert store.search("pizza", k=1, namespace="texts")[0][0] == "texts:2"
+    store.close()
+
+    reopened = NumpyVectorStore(str(tmp_path / "vec"), dim=64)
+    assert len(reopened) == 3
+    assert [h[0] for h in reopened.search("café", k=5, namespace="texts")][0] == "texts:3"
+    assert {h[0] for h in reopened.search("x", k=5, namespace="texts")} == {"texts:2", "texts:3"}
+
+def test_rows_added_after_a_torn_log_line_survive_restarts(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "vec"), dim=64)
+    store.add([{"id": 1, "text": "la pizza froide"}], namespace="texts")
+    store.close()
+    with open(tmp_path / "vec" / "rows.jsonl", "a", encoding="utf-8") as fh:
+        fh.write('{"op": "add", "id": "texts:2", "me')  # crash mid-write
+
+    store = NumpyVectorStore(str(tmp_path / "vec"), dim=64)
+    store.add([{"id": 3, "text": "un chat qui dort"}], namespace="texts")
+    store.close()
+    reopened = NumpyVectorStore(str(tmp_path / "vec"), dim=64)
+    assert len(reopened) == 2
+    assert reopened.search("chat qui dort", k=1, namespace="texts")[0][0] == "texts:3"
+    reopened.close()
+
+    # log written before the fix: the next row was appended onto the torn line
+    with open(tmp_path / "vec" / "rows.jsonl", "a", encoding="utf-8") as fh:
+        fh.write('{"op": "add", "id": "texts:4", "me' + '{"op": "add", "id": "texts:5", "meta": {"namespace": "texts"}, "text": "x"}\n')
+    legacy = NumpyVectorStore(str(tmp_path / "vec"), dim=64)
+    assert len(legacy) == 3 and legacy.texts(["texts:3", "texts:5"]) == ["un chat qui dort", "x"]
+    legacy.close()